@@ -0,0 +1,442 @@
+import concurrent.futures
+import hashlib
+import html
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .converter import (DEFAULT_ENGINE, DEFAULT_EXTENSIONS, DEFAULT_EXTENSION_CONFIGS,
+                        MarkdownConverter, extension_signature)
+from .fileio import atomic_write, decode_bytes
+from .incremental import content_hash
+from .render_cache import RenderCache
+
+MANIFEST_NAME = '.quickmd-manifest.json'
+SOURCE_SUFFIXES = ('.md', '.markdown')
+# Files are sent to the workers in batches of about this size to keep
+# the per-task overhead low for many small files
+BATCH_FILES = 16
+BATCH_BYTES = 1 << 20
+# A line '--8<-- "file"' is replaced by the file's text, as with
+# pymdownx.snippets, so pages can share abbreviation and footnote definitions
+SNIPPET_MARK = '--8<--'
+SNIPPET_RE = re.compile(r'^[ \t]*--8<--[ \t]+(["\']?)(.+?)\1[ \t]*$', re.MULTILINE)
+
+HTML_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+</head>
+<body>
+{body}
+</body>
+</html>
+'''
+
+# (relative path, source path, output path, digest from the last run)
+Task = Tuple[str, str, str, Optional[str]]
+
+
+class FileResult(NamedTuple):
+    """Outcome of rendering one source file."""
+
+    source: str
+    status: str
+    digest: str
+    size: int
+    seconds: float
+    error: str = ''
+    # Resolved paths of the snippets the source includes, found or not
+    includes: Tuple[str, ...] = ()
+
+
+class BatchSummary(NamedTuple):
+    """Totals of a batch render."""
+
+    rendered: int
+    skipped: int
+    failed: int
+    rendered_bytes: int
+    seconds: float
+
+    @property
+    def files_per_second(self) -> float:
+        """Returns the number of files handled per second, skipped ones included."""
+        return (self.rendered + self.skipped + self.failed) / max(self.seconds, 1e-9)
+
+    @property
+    def megabytes_per_second(self) -> float:
+        """Returns the rendered Markdown throughput in MB/s."""
+        return self.rendered_bytes / (1 << 20) / max(self.seconds, 1e-9)
+
+
+def expand_snippets(text: str, path: Path, root: Path,
+                    stack: Tuple[Path, ...] = ()) -> Tuple[str, List[str]]:
+    """Replaces snippet lines with the text of the files they name, relative to path.
+
+    Returns the expanded text and the paths of every snippet included,
+    directly or not. Missing snippets, snippets outside the resolved root
+    directory and include cycles expand to nothing.
+    """
+    if SNIPPET_MARK not in text:
+        return text, []
+    includes: List[str] = []
+
+    def replace(match: 're.Match[str]') -> str:
+        target = (path.parent / match.group(2)).resolve()
+        if root not in target.parents:
+            logging.warning(f'Snippet {match.group(2)} included by {path} is outside {root}')
+            return ''
+        includes.append(str(target))
+        if target in stack or target == path.resolve():
+            logging.warning(f'Snippet {target} includes itself')
+            return ''
+        try:
+            snippet = decode_bytes(target.read_bytes())
+        except OSError as e:
+            logging.warning(f'Snippet {match.group(2)} included by {path} not found: {e}')
+            return ''
+        snippet, nested = expand_snippets(snippet, target, root, stack + (path.resolve(),))
+        includes.extend(nested)
+        return snippet.rstrip('\n')
+
+    return SNIPPET_RE.sub(replace, text), includes
+
+
+def find_sources(src_dir: Path, exclude: Optional[Path] = None) -> List[Path]:
+    """Returns the Markdown files below src_dir, leaving out the exclude directory."""
+    sources = []
+    for root, dirs, files in os.walk(src_dir):
+        if exclude is not None:
+            dirs[:] = [d for d in dirs if Path(root, d).resolve() != exclude]
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SOURCE_SUFFIXES):
+                sources.append(Path(root, name))
+    return sources
+
+
+def manifest_signature(extensions: List[str], extension_configs: Dict[str, Dict[str, Any]],
+                       engine: str = DEFAULT_ENGINE) -> str:
+    """Returns the hash of everything besides the sources that affects the output."""
+    return content_hash(extension_signature(extensions, extension_configs, engine) + HTML_TEMPLATE)
+
+
+def read_manifest(out_dir: Path, signature: str) -> Dict[str, str]:
+    """Returns the source digests of the last run into out_dir, if it had the same signature."""
+    try:
+        manifest = json.loads((out_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('files', {}) if manifest.get('signature') == signature else {}
+
+
+def write_manifest(out_dir: Path, signature: str, files: Dict[str, str]) -> None:
+    """Records the source digests of a run into out_dir."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    atomic_write(out_dir / MANIFEST_NAME, json.dumps({'signature': signature, 'files': files},
+                                                     indent=1, sort_keys=True))
+
+
+_worker_converter: Optional[MarkdownConverter] = None
+_worker_cache: Optional[RenderCache] = None
+# The source tree, which snippets may not reach out of
+_worker_root: Optional[Path] = None
+
+
+def _init_worker(src_dir: Path, extensions: List[str], extension_configs: Dict[str, Dict[str, Any]],
+                 cache_dir: Optional[Path] = None, engine: str = DEFAULT_ENGINE) -> None:
+    """Builds the converter and opens the render cache of a worker process once."""
+    global _worker_converter, _worker_cache, _worker_root
+    _close_worker()
+    _worker_root = src_dir
+    _worker_converter = MarkdownConverter(extensions, extension_configs, engine=engine)
+    # Whole documents are stored apart from the editor's blocks, which are keyed differently
+    _worker_cache = RenderCache(
+        cache_dir, content_hash(_worker_converter.fingerprint + ':document')
+    ) if cache_dir is not None else None
+
+
+def _close_worker() -> None:
+    """Closes the render cache opened by _init_worker in this process, if any."""
+    global _worker_converter, _worker_cache, _worker_root
+    if _worker_cache is not None:
+        _worker_cache.close()
+    _worker_converter = _worker_cache = _worker_root = None
+
+
+def _render_batch(batch: List[Task]) -> List[FileResult]:
+    """Renders a batch of files in a worker process."""
+    results = []
+    pending = []
+    for rel, source, output, previous in batch:
+        started = time.perf_counter()
+        try:
+            data = Path(source).read_bytes()
+            text = None
+            includes: Tuple[str, ...] = ()
+            if SNIPPET_MARK.encode() in data:
+                # Pages with snippets change when their snippets do
+                text, found = expand_snippets(decode_bytes(data), Path(source), _worker_root)
+                includes = tuple(dict.fromkeys(found))
+                digest = hashlib.blake2b(text.encode('utf-8'), digest_size=12).hexdigest()
+            else:
+                digest = hashlib.blake2b(data, digest_size=12).hexdigest()
+            if digest == previous and os.path.exists(output):
+                results.append(FileResult(rel, 'skipped', digest, len(data), 0.0, '', includes))
+                continue
+            if text is None:
+                text = decode_bytes(data)
+            pending.append((rel, output, digest, len(data), text, content_hash(text), includes,
+                            time.perf_counter() - started))
+        except Exception as e:
+            results.append(FileResult(rel, 'failed', '', 0, time.perf_counter() - started, str(e)))
+    cached = _worker_cache.get_many(item[5] for item in pending) if _worker_cache else {}
+    fresh: Dict[str, str] = {}
+    for rel, output, digest, size, text, key, includes, seconds in pending:
+        started = time.perf_counter() - seconds
+        try:
+            body = cached.get(key)
+            if body is None:
+                body = fresh[key] = _worker_converter.convert(text)
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            # Outputs can always be rendered again, so they are not fsynced
+            atomic_write(output, HTML_TEMPLATE.format(title=html.escape(Path(rel).stem), body=body),
+                         sync=False)
+            results.append(FileResult(rel, 'rendered', digest, size,
+                                      time.perf_counter() - started, '', includes))
+        except Exception as e:
+            results.append(FileResult(rel, 'failed', '', 0, time.perf_counter() - started, str(e),
+                                      includes))
+    if _worker_cache is not None:
+        _worker_cache.put_many(fresh)
+    return results
+
+
+def _batches(tasks: List[Tuple[Task, int]]) -> List[List[Task]]:
+    """Groups tasks, largest files first, into batches for the workers."""
+    batches: List[List[Task]] = []
+    batch: List[Task] = []
+    size = 0
+    for task, task_size in sorted(tasks, key=lambda item: item[1], reverse=True):
+        batch.append(task)
+        size += task_size
+        if len(batch) >= BATCH_FILES or size >= BATCH_BYTES:
+            batches.append(batch)
+            batch, size = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def render_tree(src_dir: Path, out_dir: Path, jobs: Optional[int] = None,
+                extensions: Optional[List[str]] = None,
+                extension_configs: Optional[Dict[str, Dict[str, Any]]] = None,
+                on_result: Optional[Callable[[FileResult], None]] = None,
+                cache_dir: Optional[Path] = None, engine: str = DEFAULT_ENGINE) -> BatchSummary:
+    """Renders every Markdown file below src_dir to HTML below out_dir.
+
+    Files are rendered by a pool of jobs worker processes, and on_result is
+    called for each file as soon as its batch finishes. A manifest in
+    out_dir records the hash of every source and of the extension setup,
+    so files unchanged since the last run are skipped; pages with snippets
+    are hashed with their snippets expanded. With a cache_dir,
+    documents rendered before, in any output directory, are taken from the
+    shared render cache.
+    """
+    started = time.perf_counter()
+    extensions = list(DEFAULT_EXTENSIONS if extensions is None else extensions)
+    extension_configs = dict(
+        DEFAULT_EXTENSION_CONFIGS if extension_configs is None else extension_configs
+    )
+    src_dir = Path(src_dir).resolve()
+    out_dir = Path(out_dir).resolve()
+    signature = manifest_signature(extensions, extension_configs, engine)
+    previous = read_manifest(out_dir, signature)
+
+    tasks = []
+    for source in find_sources(src_dir, exclude=out_dir):
+        rel = source.relative_to(src_dir).as_posix()
+        output = out_dir / Path(rel).with_suffix('.html')
+        try:
+            size = source.stat().st_size
+        except OSError:
+            size = 0
+        tasks.append(((rel, str(source), str(output), previous.get(rel)), size))
+
+    files: Dict[str, str] = {}
+    counts = {'rendered': 0, 'skipped': 0, 'failed': 0}
+    rendered_bytes = 0
+
+    def collect(results: List[FileResult]) -> None:
+        nonlocal rendered_bytes
+        for result in results:
+            counts[result.status] += 1
+            if result.status != 'failed':
+                files[result.source] = result.digest
+            if result.status == 'rendered':
+                rendered_bytes += result.size
+            if on_result is not None:
+                on_result(result)
+
+    batches = _batches(tasks)
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    try:
+        if jobs == 1 or len(batches) <= 1:
+            _init_worker(src_dir, extensions, extension_configs, cache_dir, engine)
+            try:
+                for batch in batches:
+                    collect(_render_batch(batch))
+            finally:
+                _close_worker()
+        else:
+            # Spawned workers import only the Markdown stack, never the GUI
+            context = multiprocessing.get_context('spawn')
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=jobs, mp_context=context, initializer=_init_worker,
+                initargs=(src_dir, extensions, extension_configs, cache_dir, engine)
+            ) as executor:
+                futures = [executor.submit(_render_batch, batch) for batch in batches]
+                for future in concurrent.futures.as_completed(futures):
+                    collect(future.result())
+    finally:
+        write_manifest(out_dir, signature, files)
+    summary = BatchSummary(counts['rendered'], counts['skipped'], counts['failed'],
+                           rendered_bytes, time.perf_counter() - started)
+    logging.info(f'Batch render of {src_dir}: {summary}')
+    return summary
+
+
+class WatchSession:
+    """Keeps an output tree up to date with a source tree as files change.
+
+    build() renders the whole tree like render_tree. After that the
+    converter and the render cache stay open in this process until close(),
+    and rebuild() renders only the sources that changed and the pages that
+    include a changed snippet, so a save shows up in the output within
+    milliseconds instead of after a full build. Outputs and the manifest are written
+    atomically, so a later render_tree run skips what was rendered here.
+    """
+
+    def __init__(self, src_dir: Path, out_dir: Path, extensions: Optional[List[str]] = None,
+                 extension_configs: Optional[Dict[str, Dict[str, Any]]] = None,
+                 on_result: Optional[Callable[[FileResult], None]] = None,
+                 cache_dir: Optional[Path] = None, engine: str = DEFAULT_ENGINE) -> None:
+        self.src_dir = Path(src_dir).resolve()
+        self.out_dir = Path(out_dir).resolve()
+        self.extensions = list(DEFAULT_EXTENSIONS if extensions is None else extensions)
+        self.extension_configs = dict(
+            DEFAULT_EXTENSION_CONFIGS if extension_configs is None else extension_configs
+        )
+        self.on_result = on_result
+        self.cache_dir = cache_dir
+        self.engine = engine
+        self.signature = manifest_signature(self.extensions, self.extension_configs, engine)
+        # Source digests as in the manifest, and the snippets each source includes
+        self.files: Dict[str, str] = {}
+        self.includes: Dict[str, Tuple[str, ...]] = {}
+
+    def build(self, jobs: Optional[int] = None) -> BatchSummary:
+        """Renders the whole tree, skipping what is unchanged since the last run."""
+        summary = render_tree(self.src_dir, self.out_dir, jobs, self.extensions,
+                              self.extension_configs, self._collect, self.cache_dir, self.engine)
+        self.files = read_manifest(self.out_dir, self.signature)
+        # Kept warm for the rebuilds; a convert builds the parser instance
+        _init_worker(self.src_dir, self.extensions, self.extension_configs, self.cache_dir,
+                     self.engine)
+        _worker_converter.convert('')
+        return summary
+
+    def close(self) -> None:
+        """Closes the render cache kept open for the rebuilds."""
+        _close_worker()
+
+    def affected(self, changed: List[Path]) -> List[str]:
+        """Returns the sources to render again after files changed, as relative paths."""
+        paths = {str(path) for path in changed}
+        sources = set()
+        for path in changed:
+            if not path.name.lower().endswith(SOURCE_SUFFIXES):
+                continue
+            if path == self.out_dir or self.out_dir in path.parents:
+                continue
+            try:
+                sources.add(path.relative_to(self.src_dir).as_posix())
+            except ValueError:
+                continue
+        sources.update(rel for rel, includes in self.includes.items() if paths.intersection(includes))
+        return sorted(sources)
+
+    def rebuild(self, changed: Optional[List[Path]] = None) -> BatchSummary:
+        """Renders the sources affected by changed files, or checks every source if None."""
+        started = time.perf_counter()
+        if changed is None:
+            current = {source.relative_to(self.src_dir).as_posix()
+                       for source in find_sources(self.src_dir, exclude=self.out_dir)}
+            sources = sorted(current | self.files.keys() | self.includes.keys())
+        else:
+            sources = self.affected(changed)
+        tasks = []
+        for rel in sources:
+            source = self.src_dir / rel
+            output = self.out_dir / Path(rel).with_suffix('.html')
+            if source.is_file():
+                tasks.append((rel, str(source), str(output), self.files.get(rel)))
+            else:
+                self._remove(rel, output)
+        counts = {'rendered': 0, 'skipped': 0, 'failed': 0}
+        rendered_bytes = 0
+        for result in _render_batch(tasks) if tasks else []:
+            counts[result.status] += 1
+            if result.status == 'failed':
+                self.files.pop(result.source, None)
+            else:
+                self.files[result.source] = result.digest
+            if result.status == 'rendered':
+                rendered_bytes += result.size
+            self._collect(result)
+        if tasks or sources:
+            write_manifest(self.out_dir, self.signature, self.files)
+        summary = BatchSummary(counts['rendered'], counts['skipped'], counts['failed'],
+                               rendered_bytes, time.perf_counter() - started)
+        if counts['rendered'] or counts['failed']:
+            logging.info(f'Rebuild of {self.src_dir}: {summary}')
+        return summary
+
+    def run(self, watcher: Any, stop: Optional[threading.Event] = None,
+            on_rebuild: Optional[Callable[[BatchSummary], None]] = None,
+            poll: float = 0.5) -> None:
+        """Rebuilds on every change the watcher reports until stop is set.
+
+        watcher is one of those returned by watcher.open_watcher.
+        """
+        while stop is None or not stop.is_set():
+            changed = watcher.wait(poll)
+            if changed is not None and not changed:
+                continue
+            summary = self.rebuild(None if changed is None else sorted(changed))
+            if on_rebuild is not None and (summary.rendered or summary.failed):
+                on_rebuild(summary)
+
+    def _collect(self, result: FileResult) -> None:
+        """Remembers the snippets a source includes and passes the result on."""
+        self.includes[result.source] = result.includes
+        if self.on_result is not None:
+            self.on_result(result)
+
+    def _remove(self, rel: str, output: Path) -> None:
+        """Deletes the output of a source that is gone."""
+        self.files.pop(rel, None)
+        self.includes.pop(rel, None)
+        try:
+            output.unlink()
+        except FileNotFoundError:
+            pass
+        logging.info(f'Removed {output}')
@@ -0,0 +1,151 @@
+import xml.etree.ElementTree as etree
+from typing import List
+
+from markdown.extensions.attr_list import AttrListExtension, get_attrs_and_remainder
+from markdown.extensions.codehilite import (CodeHilite, CodeHiliteExtension, HiliteTreeprocessor,
+                                            parse_hl_lines)
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+
+from .highlight_cache import HighlightCache, get_highlight_cache
+from .incremental import content_hash
+
+try:
+    from pygments import highlight
+    from pygments.lexers import guess_lexer
+except ImportError:
+    highlight = None
+
+
+class CachedCodeHilite(CodeHilite):
+    """CodeHilite that reuses the HTML of code blocks it has highlighted before."""
+
+    def hilite(self, shebang: bool = True) -> str:
+        """Returns the highlighted HTML of the code, from the cache when possible."""
+        if highlight is None or not self.use_pygments or not isinstance(self.pygments_formatter, str):
+            return super().hilite(shebang)
+        cache = get_highlight_cache()
+        options_key = repr(sorted(self.options.items()))
+        key = (self.lang, shebang, self.guess_lang, self.pygments_formatter, options_key,
+               content_hash(self.src))
+        html = cache.get(key)
+        if html is None:
+            html = self._highlight(cache, shebang, options_key)
+            cache.put(key, html)
+        return html
+
+    def _highlight(self, cache: HighlightCache, shebang: bool, options_key: str) -> str:
+        """Highlights the code with shared lexer and formatter instances."""
+        self.src = self.src.strip('\n')
+        if self.lang is None and shebang:
+            self._parseHeader()
+        lexer = cache.lexer(self.lang, self.options, options_key) if self.lang else None
+        if lexer is None:
+            if self.guess_lang:
+                try:
+                    lexer = guess_lexer(self.src, **self.options)
+                except ValueError:
+                    lexer = cache.lexer('text', self.options, options_key)
+            else:
+                lexer = cache.lexer('text', self.options, options_key)
+        if not self.lang:
+            self.lang = lexer.aliases[0]
+        formatter = cache.formatter(self.pygments_formatter, self.options, options_key)
+        return highlight(self.src, lexer, formatter)
+
+
+class CachedFencedBlockPreprocessor(FencedBlockPreprocessor):
+    """Fenced code preprocessor highlighting with CachedCodeHilite.
+
+    Blocks to be highlighted are stashed here; the rest, left in place, are
+    escaped by the library's run as before.
+    """
+
+    def run(self, lines: List[str]) -> List[str]:
+        """Highlights the fenced blocks codehilite applies to, then runs the library's pass."""
+        if not self.checked_for_deps:
+            for ext in self.md.registeredExtensions:
+                if isinstance(ext, CodeHiliteExtension):
+                    self.codehilite_conf = ext.getConfigs()
+                if isinstance(ext, AttrListExtension):
+                    self.use_attr_list = True
+            self.checked_for_deps = True
+        if not self.codehilite_conf or not self.codehilite_conf['use_pygments']:
+            return super().run(lines)
+        text = '\n'.join(lines)
+        index = 0
+        while True:
+            m = self.FENCED_BLOCK_RE.search(text, index)
+            if not m:
+                break
+            lang, classes, config = None, [], {}
+            if m.group('attrs'):
+                attrs, remainder = get_attrs_and_remainder(m.group('attrs'))
+                if remainder:
+                    index = m.end('attrs')
+                    continue
+                _, classes, config = self.handle_attrs(attrs)
+                if classes:
+                    lang = classes.pop(0)
+            else:
+                lang = m.group('lang') or None
+                if m.group('hl_lines'):
+                    config['hl_lines'] = parse_hl_lines(m.group('hl_lines'))
+            if not config.get('use_pygments', True):
+                index = m.end()
+                continue
+            local_config = dict(self.codehilite_conf, **config)
+            if classes:
+                # As in the library, cssclass stays last for the suffix Pygments may add
+                local_config['css_class'] = f"{' '.join(classes)} {local_config['css_class']}"
+            highliter = CachedCodeHilite(m.group('code'), lang=lang,
+                                         style=local_config.pop('pygments_style', 'default'),
+                                         **local_config)
+            placeholder = self.md.htmlStash.store(highliter.hilite(shebang=False))
+            text = f'{text[:m.start()]}\n{placeholder}\n{text[m.end():]}'
+            index = m.start() + 1 + len(placeholder)
+        return super().run(text.split('\n'))
+
+
+class CachedHiliteTreeprocessor(HiliteTreeprocessor):
+    """Indented code treeprocessor highlighting with CachedCodeHilite."""
+
+    def run(self, root: etree.Element) -> None:
+        """Stashes the highlighted HTML of every code block."""
+        for block in root.iter('pre'):
+            if len(block) != 1 or block[0].tag != 'code' or block[0].text is None:
+                continue
+            local_config = self.config.copy()
+            code = CachedCodeHilite(self.code_unescape(block[0].text), tab_length=self.md.tab_length,
+                                    style=local_config.pop('pygments_style', 'default'),
+                                    **local_config)
+            placeholder = self.md.htmlStash.store(code.hilite())
+            block.clear()
+            block.tag = 'p'
+            block.text = placeholder
+
+
+class CachedCodeHiliteExtension(CodeHiliteExtension):
+    """The codehilite extension with highlighted code blocks memoized.
+
+    Its processors and those of fenced_code, when that is loaded first, are
+    replaced on the Markdown instance by ones producing the same HTML from
+    the cache. With fenced_code loaded later, fenced blocks are highlighted
+    as before, only without the cache.
+    """
+
+    def extendMarkdown(self, md) -> None:
+        """Registers the highlighting processors, using the cache."""
+        hiliter = CachedHiliteTreeprocessor(md)
+        hiliter.config = self.getConfigs()
+        md.treeprocessors.register(hiliter, 'hilite', 30)
+        md.registerExtension(self)
+        if 'fenced_code_block' in md.preprocessors:
+            fenced = md.preprocessors['fenced_code_block']
+            if type(fenced) is FencedBlockPreprocessor:
+                md.preprocessors.register(CachedFencedBlockPreprocessor(md, fenced.config),
+                                          'fenced_code_block', 25)
+
+
+def makeExtension(**kwargs) -> CachedCodeHiliteExtension:
+    """Returns the extension; lets it be loaded by import path."""
+    return CachedCodeHiliteExtension(**kwargs)
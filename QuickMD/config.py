@@ -23,3 +23,15 @@ class Config:
     def get_viewer_config(self) -> Dict[str, str]:
         """Returns viewer configuration."""
         return dict(self.parser.items('Viewer'))
+
+    def get_logging_config(self) -> Dict[str, str]:
+        """Returns logging configuration, empty if the file has no Logging section."""
+        if not self.parser.has_section('Logging'):
+            return {}
+        return dict(self.parser.items('Logging'))
+
+    def get_renderer_config(self) -> Dict[str, str]:
+        """Returns renderer configuration, empty if the file has no Renderer section."""
+        if not self.parser.has_section('Renderer'):
+            return {}
+        return dict(self.parser.items('Renderer'))
@@ -0,0 +1,197 @@
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+import hashlib
+import importlib.util
+import json
+import logging
+import queue
+import threading
+
+from .profiling import profiled
+
+# Markdown and Pygments are imported when the first instance is built, so
+# that they stay off the startup path of the editor
+if TYPE_CHECKING:
+    import markdown
+
+# Extensions used for the preview, by import path so that every pooled
+# instance gets its own (stateful) extension objects.
+DEFAULT_EXTENSIONS: List[str] = [
+    'markdown.extensions.tables',
+    'markdown.extensions.fenced_code',
+    'QuickMD.codehilite',
+    'markdown.extensions.toc',
+    'markdown.extensions.footnotes',
+    'markdown.extensions.attr_list',
+    'markdown.extensions.def_list',
+    'markdown.extensions.abbr',
+    'markdown.extensions.meta',
+]
+
+DEFAULT_EXTENSION_CONFIGS: Dict[str, Dict[str, Any]] = {
+    'QuickMD.codehilite': {'guess_lang': False},
+}
+
+# Markdown engines by their name in the [Renderer] section, with the
+# package each one needs
+DEFAULT_ENGINE = 'python-markdown'
+ENGINES: Dict[str, str] = {
+    'python-markdown': 'markdown',
+    'markdown-it': 'markdown_it',
+}
+
+
+def available_engines() -> List[str]:
+    """Returns the engines whose package is installed, without importing them."""
+    return [name for name, package in ENGINES.items() if importlib.util.find_spec(package)]
+
+
+class MarkdownConverter:
+    """Converts Markdown to HTML with pre-built, reusable parser instances.
+
+    Building a ``markdown.Markdown`` object registers every extension, which
+    is a noticeable share of the cost of converting a small document. The
+    converter builds instances once, keeps them in a small pool and resets
+    them between documents. Each instance is used by one thread at a time, so
+    up to ``pool_size`` conversions can run concurrently.
+
+    The engine picks the Markdown implementation: ``python-markdown``, or
+    ``markdown-it`` for the faster markdown-it-py, which maps the same
+    extensions (see mdit_engine.py). Instances of either have the
+    ``convert()`` and ``reset()`` methods of ``markdown.Markdown``.
+    """
+
+    def __init__(self, extensions: Optional[List[str]] = None,
+                 extension_configs: Optional[Dict[str, Dict[str, Any]]] = None,
+                 pool_size: int = 1, engine: str = DEFAULT_ENGINE) -> None:
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown Markdown engine {engine!r}; choose one of {", ".join(ENGINES)}')
+        self.engine = engine
+        self.extensions = list(DEFAULT_EXTENSIONS if extensions is None else extensions)
+        self.extension_configs = dict(
+            DEFAULT_EXTENSION_CONFIGS if extension_configs is None else extension_configs
+        )
+        self.pool_size = max(1, pool_size)
+        self._idle: 'queue.LifoQueue[markdown.Markdown]' = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @property
+    def fingerprint(self) -> str:
+        """Returns a hash of everything besides the source that affects the HTML."""
+        return extension_signature(self.extensions, self.extension_configs, self.engine)
+
+    def set_pool_size(self, pool_size: int) -> None:
+        """Changes the maximum number of pooled instances."""
+        with self._lock:
+            self.pool_size = max(1, pool_size)
+
+    def build(self) -> 'markdown.Markdown':
+        """Builds a new configured Markdown instance."""
+        if self.engine == 'markdown-it':
+            from .mdit_engine import MarkdownItEngine
+            return MarkdownItEngine(self.extensions, self.extension_configs)
+        import markdown
+        return markdown.Markdown(
+            extensions=self.extensions,
+            extension_configs=self.extension_configs
+        )
+
+    @contextmanager
+    def acquire(self) -> Iterator['markdown.Markdown']:
+        """Borrows a pooled instance, building one if the pool is not full."""
+        md = self._take()
+        try:
+            yield md
+        finally:
+            md.reset()
+            self._idle.put(md)
+
+    @profiled('markdown.convert')
+    def convert(self, text: str) -> str:
+        """Converts a Markdown document to HTML."""
+        with self.acquire() as md:
+            return md.convert(text)
+
+    def _take(self) -> 'markdown.Markdown':
+        """Returns an idle instance, waiting for one if the pool is exhausted."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_build = self._created < self.pool_size
+            if can_build:
+                self._created += 1
+        if can_build:
+            logging.debug(f'Building Markdown instance {self._created}')
+            try:
+                return self.build()
+            except BaseException:
+                # The slot is free again, so later calls build instead of waiting
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+
+def extension_signature(extensions: List[str], extension_configs: Dict[str, Dict[str, Any]],
+                        engine: str = DEFAULT_ENGINE) -> str:
+    """Returns a hash of an extension setup and the library versions rendering it."""
+    import markdown
+    try:
+        from pygments import __version__ as pygments_version
+    except ImportError:
+        pygments_version = None
+    versions: List[Any] = [markdown.__version__, pygments_version]
+    if engine != DEFAULT_ENGINE:
+        versions.append(_engine_versions(engine))
+    payload = json.dumps(versions + [extensions, extension_configs], sort_keys=True, default=repr)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def _engine_versions(engine: str) -> Tuple[str, ...]:
+    """Returns the engine name and the versions of the packages it renders with."""
+    import markdown_it
+    try:
+        import mdit_py_plugins
+        plugins = mdit_py_plugins.__version__
+    except ImportError:
+        plugins = None
+    return (engine, markdown_it.__version__, plugins)
+
+
+# Exercises the extensions and a Pygments lexer and formatter
+WARM_UP_TEXT = '''# Warm-up
+
+Some *text* with a footnote[^1].
+
+| a | b |
+| --- | --- |
+| 1 | 2 |
+
+```python
+print("warm-up")
+```
+
+[^1]: Note.
+'''
+
+
+def warm_up(converter: Optional[MarkdownConverter] = None) -> None:
+    """Imports Markdown and Pygments and builds a pooled instance ahead of the first render."""
+    converter = converter or get_converter()
+    converter.convert(WARM_UP_TEXT)
+
+
+_shared_converters: Dict[str, MarkdownConverter] = {}
+_shared_lock = threading.Lock()
+
+
+def get_converter(engine: str = DEFAULT_ENGINE) -> MarkdownConverter:
+    """Returns the converter of an engine shared by the editor preview and the viewer."""
+    with _shared_lock:
+        converter = _shared_converters.get(engine)
+        if converter is None:
+            converter = _shared_converters[engine] = MarkdownConverter(pool_size=2, engine=engine)
+        return converter
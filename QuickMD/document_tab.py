@@ -0,0 +1,370 @@
+from PyQt5.QtWidgets import QVBoxLayout, QWidget
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtGui import QTextCursor
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+import logging
+import time
+
+from .converter import MarkdownConverter
+from .editor import Editor
+from .viewer import Viewer
+from .render_worker import RenderWorker
+from .incremental import BlockRenderer, RenderedBlock, RenderResult
+from .fileio import read_text
+from .loader import FileLoader
+from .saver import FileSaver
+from .journal import EditJournal, JournalLock
+from .stats import PARAGRAPH_SEPARATOR
+from .profiling import is_enabled, record
+
+if TYPE_CHECKING:
+    from .render_cache import RenderCache
+
+# Rough costs, in bytes, of what Qt keeps per character, per text block
+# and per highlighted line, used to estimate the memory of a tab
+CHAR_BYTES = 2
+BLOCK_BYTES = 160
+FORMATTED_LINE_BYTES = 96
+
+
+class TabMemory(NamedTuple):
+    """Estimated memory held by one document tab, in bytes."""
+
+    text: int
+    highlighting: int
+    preview: int
+    blocks: int
+
+    @property
+    def evictable(self) -> int:
+        """Returns the part that is dropped when the tab is evicted."""
+        return self.highlighting + self.preview + self.blocks
+
+    @property
+    def total(self) -> int:
+        return self.text + self.evictable
+
+
+class DocumentTab(QWidget):
+    """One open document: its editor and preview, renderer, loader and journal.
+
+    Tabs share the window's converter, the global thread pool their render
+    workers and loaders run on, the code highlight cache and the render
+    cache; each has its own block renderer, since those are not thread-safe.
+    A hidden tab can be evicted: its preview, cached blocks and highlight
+    formats are dropped and rebuilt when it is shown again, mostly from the
+    render cache.
+    """
+
+    file_changed = pyqtSignal()
+    load_progress = pyqtSignal(int, int)
+    loading = pyqtSignal(bool)
+    load_failed = pyqtSignal(str)
+    message = pyqtSignal(str)
+    rendered = pyqtSignal()
+    preview_updated = pyqtSignal()
+
+    def __init__(self, editor_config: Dict[str, str], viewer_config: Dict[str, str],
+                 converter: MarkdownConverter, saver: FileSaver,
+                 render_cache: Optional['RenderCache'] = None,
+                 journal_dir: Optional[Path] = None, parent: Optional[QWidget] = None) -> None:
+        super().__init__(parent)
+        self.saver = saver
+        self.current_file: Optional[Path] = None
+        self.recovered = False
+        self.evicted = False
+        self.last_active = 0
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.editor = Editor(editor_config)
+        self.viewer = Viewer(viewer_config)
+        layout.addWidget(self.editor)
+        layout.addWidget(self.viewer)
+        self.setLayout(layout)
+
+        self.editor.textChanged.connect(self.update_viewer)
+        self.scroll_sync = viewer_config.get('scroll_sync', 'true').lower() == 'true'
+        self.editor.verticalScrollBar().valueChanged.connect(self.sync_viewer_scroll)
+        self.viewer.line_activated.connect(self.jump_to_line)
+
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(int(viewer_config.get('render_delay', '150')))
+        self.render_timer.timeout.connect(self.request_render)
+        self.block_renderer = BlockRenderer(
+            converter,
+            cache_size=int(viewer_config.get('block_cache_size', '4096')),
+            persistent=render_cache
+        )
+        self.render_worker = RenderWorker(self.render_markdown, parent=self)
+        self.render_worker.rendered.connect(self.on_rendered)
+        self._render_started = 0.0
+        # The blocks the preview shows, for the preview server
+        self.blocks: List[RenderedBlock] = []
+
+        self.stream_threshold = int(editor_config.get('stream_threshold', '4194304'))
+        self.stream_chunk_size = int(editor_config.get('stream_chunk_size', '262144'))
+        self.loader = FileLoader(parent=self)
+        self.loader.chunk_loaded.connect(self.editor.append_text)
+        self.loader.progress.connect(self.load_progress)
+        self.loader.loaded.connect(self.on_file_loaded)
+        self.loader.failed.connect(self.on_load_failed)
+        self._load_started = 0.0
+        # The line to show once a streaming load has finished
+        self._pending_line: Optional[int] = None
+
+        self.journal = EditJournal(journal_dir) if journal_dir is not None else None
+        self._journal_document = None
+        self._journal_generation = 0
+        self._start_journal('')
+
+    @property
+    def title(self) -> str:
+        """Returns the name shown on the tab and in the window title."""
+        name = self.current_file.name if self.current_file else 'Untitled'
+        return f'{name} (recovered)' if self.recovered else name
+
+    def is_blank(self) -> bool:
+        """Returns True for an untitled, empty tab that a file can be opened in."""
+        return (self.current_file is None and not self.loader.is_running()
+                and self.editor.document().isEmpty())
+
+    def render_markdown(self, text: str) -> RenderResult:
+        """Renders Markdown text into HTML blocks. Runs on a worker thread."""
+        return self.block_renderer.render(text)
+
+    def update_viewer(self) -> None:
+        """Schedules a viewer update, coalescing bursts of edits."""
+        self.render_timer.start()
+
+    def request_render(self) -> None:
+        """Submits the current editor text to the render worker."""
+        if self.evicted:
+            return
+        self._render_started = time.perf_counter()
+        self.render_worker.submit(self.editor.plain_text())
+
+    def on_rendered(self, generation: int, result: RenderResult) -> None:
+        """Shows the rendered blocks if they belong to the newest snapshot."""
+        if generation == self.render_worker.generation and not self.evicted:
+            self.blocks = result.blocks
+            self.viewer.show_blocks(result.blocks)
+            self.sync_viewer_scroll()
+            self.preview_updated.emit()
+            if is_enabled():
+                record('render.latency', time.perf_counter() - self._render_started)
+                self.rendered.emit()
+
+    def sync_viewer_scroll(self) -> None:
+        """Scrolls the preview to the first line visible in the editor."""
+        if self.scroll_sync:
+            self.viewer.scroll_to_line(self.editor.firstVisibleBlock().blockNumber())
+
+    def jump_to_line(self, line: int) -> None:
+        """Moves the editor cursor to the start of a source line."""
+        block = self.editor.document().findBlockByNumber(line)
+        if block.isValid():
+            self.editor.setTextCursor(QTextCursor(block))
+            self.editor.centerCursor()
+            self.editor.setFocus()
+
+    def show_line(self, line: int) -> None:
+        """Shows a line at the top of the editor and the preview, with the cursor on it.
+
+        While a file streams in, the line is shown once it has loaded.
+        """
+        if self.loader.is_running():
+            self._pending_line = line
+            return
+        block = self.editor.document().findBlockByNumber(line)
+        if not block.isValid():
+            return
+        self.editor.setTextCursor(QTextCursor(block))
+        self.editor.verticalScrollBar().setValue(block.firstLineNumber())
+        if not self.scroll_sync:
+            self.viewer.scroll_to_line(line)
+        self.editor.setFocus()
+
+    def memory_usage(self) -> TabMemory:
+        """Estimates the memory held by the document, its highlighting and its preview."""
+        document = self.editor.document()
+        preview = self.viewer.document()
+        return TabMemory(
+            text=document.characterCount() * CHAR_BYTES + document.blockCount() * BLOCK_BYTES,
+            highlighting=self.editor.highlighter.formatted_lines() * FORMATTED_LINE_BYTES,
+            preview=preview.characterCount() * CHAR_BYTES + preview.blockCount() * BLOCK_BYTES,
+            blocks=self.block_renderer.cached_size()
+        )
+
+    def can_evict(self) -> bool:
+        """Returns True if nothing is rendering or loading into the tab."""
+        return not self.evicted and self.render_worker.is_idle() and not self.loader.is_running()
+
+    def evict(self) -> None:
+        """Drops the preview, the cached blocks and the highlight formats."""
+        self.evicted = True
+        self.render_timer.stop()
+        self.viewer.setHtml('')
+        self.blocks = []
+        self.block_renderer.clear()
+        self.editor.evict_highlighting()
+        logging.debug(f'Evicted tab {self.title}')
+
+    def restore(self) -> None:
+        """Rebuilds what evict dropped; called when the tab is shown again."""
+        if not self.evicted:
+            return
+        self.evicted = False
+        self.editor.restore_highlighting()
+        self.request_render()
+
+    def load_file(self, file_path: Path) -> None:
+        """Loads a file, streaming it in the background if it is large."""
+        self._load_started = time.perf_counter()
+        try:
+            size = file_path.stat().st_size
+            if size >= self.stream_threshold:
+                self.loader.start(file_path, self.stream_chunk_size)
+            else:
+                self._stop_loading()
+                text = read_text(file_path)
+                self._detach_journal()
+                self.editor.setPlainText(text)
+                self.set_current_file(file_path)
+                self._start_journal(text)
+                record('file.open', time.perf_counter() - self._load_started)
+                logging.info(f'Opened file: {file_path}')
+                return
+        except Exception as e:
+            logging.error(f'Error opening file: {e}')
+            self.load_failed.emit(str(e))
+            return
+        self.editor.begin_load(size)
+        self.loading.emit(True)
+        self.load_progress.emit(0, size)
+        self.message.emit(f'Loading {file_path.name}...')
+
+    def on_file_loaded(self, file_path: Path) -> None:
+        """Shows a file once streaming it has finished."""
+        self._detach_journal()
+        self.editor.end_load()
+        self.set_current_file(file_path)
+        self._start_journal(self.editor.plain_text())
+        self.loading.emit(False)
+        self.update_viewer()
+        if self._pending_line is not None:
+            self.show_line(self._pending_line)
+            self._pending_line = None
+        record('file.open', time.perf_counter() - self._load_started)
+        logging.info(f'Opened file: {file_path}')
+
+    def on_load_failed(self, file_path: Path, message: str) -> None:
+        """Discards a partly loaded file."""
+        logging.error(f'Error opening file: {message}')
+        self._pending_line = None
+        self.loading.emit(False)
+        self.editor.cancel_load()
+        self.load_failed.emit(message)
+
+    def cancel_load(self) -> None:
+        """Cancels a streaming load, keeping the current document."""
+        self._stop_loading()
+
+    def _stop_loading(self) -> None:
+        """Cancels a streaming load in progress, if any."""
+        if self.loader.is_running():
+            self._pending_line = None
+            self.loader.cancel()
+            self.loading.emit(False)
+            self.editor.cancel_load()
+
+    def set_current_file(self, file_path: Optional[Path]) -> None:
+        """Records the file being edited."""
+        self.current_file = file_path
+        self.recovered = False
+        self.viewer.base_path = file_path.parent if file_path is not None else None
+        self.file_changed.emit()
+
+    def save(self, file_path: Path) -> None:
+        """Saves the document to file_path in the background."""
+        if file_path != self.current_file:
+            self.set_current_file(file_path)
+        text = self.editor.plain_text()
+        mark = self.journal.mark() if self.journal is not None else 0
+        self.saver.save(file_path, text, (self, self._journal_generation, mark, text))
+
+    def on_file_saved(self, file_path: Path, generation: int, mark: int, text: str) -> None:
+        """Makes the saved text the base of the autosave journal."""
+        if self.journal is not None and generation == self._journal_generation:
+            self.journal.rebase(file_path, text, mark)
+
+    def autosave(self) -> None:
+        """Writes the edits made since the last autosave to the journal."""
+        if self.journal is None:
+            return
+        try:
+            self.journal.flush()
+        except OSError as e:
+            logging.error(f'Autosave failed: {e}')
+
+    def close_journal(self) -> None:
+        """Keeps unsaved edits in the journal for recovery, or removes it."""
+        if self.journal is None:
+            return
+        self._detach_journal()
+        if self.journal.has_edits:
+            self.autosave()
+            self.journal.close()
+        else:
+            self.journal.discard()
+
+    def recover(self, path: Path, file_path: Optional[Path], text: str, lock: JournalLock) -> None:
+        """Shows the text recovered from the journal at path and keeps journaling to it."""
+        self._detach_journal()
+        if self.journal is not None:
+            self.journal.discard()
+        self.editor.setPlainText(text)
+        self.current_file = file_path
+        self.recovered = True
+        self.viewer.base_path = file_path.parent if file_path is not None else None
+        self.file_changed.emit()
+        self.journal = EditJournal.resume(path, text, lock)
+        self._attach_journal()
+        logging.info(f'Recovered unsaved edits from {path}')
+
+    def _start_journal(self, text: str) -> None:
+        """Starts journaling edits to the document now in the editor."""
+        if self.journal is None:
+            return
+        self._detach_journal()
+        self.journal.start(self.current_file, text)
+        self._attach_journal()
+
+    def _attach_journal(self) -> None:
+        """Records the edits of the editor's document in the journal."""
+        self._journal_generation += 1
+        self._journal_document = self.editor.document()
+        self._journal_document.contentsChange.connect(self._record_edit)
+
+    def _detach_journal(self) -> None:
+        """Stops recording edits, for example before a new document is loaded."""
+        if self._journal_document is not None:
+            try:
+                self._journal_document.contentsChange.disconnect(self._record_edit)
+            except (TypeError, RuntimeError):
+                pass
+            self._journal_document = None
+
+    def _record_edit(self, position: int, removed: int, added: int) -> None:
+        """Adds one change of the document to the journal."""
+        document = self.editor.document()
+        length = document.characterCount() - 1
+        cursor = QTextCursor(document)
+        cursor.setPosition(min(position, length))
+        cursor.setPosition(min(position + added, length), QTextCursor.KeepAnchor)
+        self.journal.record(position, removed, cursor.selectedText().replace(PARAGRAPH_SEPARATOR, '\n'))
+        if self.journal.length != length:
+            # Qt reports a few changes with sizes that do not add up
+            self.journal.snapshot(self.current_file, self.editor.plain_text())
@@ -1,11 +1,23 @@
-from PyQt5.QtWidgets import QTextEdit
-from PyQt5.QtGui import QFont
-from typing import Dict
+from PyQt5.QtWidgets import QPlainTextDocumentLayout, QPlainTextEdit
+from PyQt5.QtGui import QFont, QTextCursor, QTextDocument
+from PyQt5.QtCore import QPoint, QTimer
+from typing import Dict, Optional, Tuple
 from .highlighter import MarkdownHighlighter
+from .outline import DocumentOutline
+from .stats import DocumentStats
 
+# Lines highlighted above and below the viewport when highlighting lazily
+LAZY_MARGIN = 50
+# Lines highlighted per slice of background highlighting
+LAZY_SLICE = 2000
 
-class Editor(QTextEdit):
-    """Markdown editor widget."""
+
+class Editor(QPlainTextEdit):
+    """Markdown editor widget.
+
+    Based on QPlainTextEdit, whose layout only touches the changed lines, so
+    edits and highlighting stay fast in documents of tens of megabytes.
+    """
 
     def __init__(self, config: Dict[str, str]) -> None:
         super().__init__()
@@ -19,5 +31,142 @@ class Editor(QTextEdit):
         font = QFont(font_family, font_size)
         self.setFont(font)
         self.setTabStopWidth(int(self.config.get('tab_width', '40')))
+        self.lazy_highlight_threshold = int(self.config.get('lazy_highlight_threshold', '500000'))
         self.highlighter = MarkdownHighlighter(self.document())
+        self.stats = DocumentStats(self.document())
+        self.outline = DocumentOutline(self.document())
+        self._text: Optional[str] = None
+        self.document().contentsChange.connect(self._drop_text)
+        self._incoming: Optional[Tuple[QTextDocument, MarkdownHighlighter, DocumentStats]] = None
+        self.lazy_timer = QTimer(self)
+        self.lazy_timer.setInterval(0)
+        self.lazy_timer.timeout.connect(self.highlight_slice)
+        self.verticalScrollBar().valueChanged.connect(self.highlight_visible)
+
+    def plain_text(self) -> str:
+        """Returns the document text, sharing one copy until the next change."""
+        if self._text is None:
+            self._text = self.toPlainText()
+        return self._text
+
+    def _drop_text(self, position: int, removed: int, added: int) -> None:
+        """Forgets the shared text copy after a change."""
+        self._text = None
+
+    def setPlainText(self, text: str) -> None:
+        """Replaces the text, highlighting large documents lazily.
+
+        Above the configured size only the visible lines are highlighted
+        right away; the rest is highlighted in the background.
+        """
+        self.lazy_timer.stop()
+        if len(text) >= self.lazy_highlight_threshold:
+            self.highlighter.begin_lazy()
+            try:
+                super().setPlainText(text)
+            finally:
+                self._start_lazy()
+        else:
+            self.highlighter.end_lazy()
+            super().setPlainText(text)
+
+    def begin_load(self, size: int) -> None:
+        """Starts loading a document of size characters with append_text.
+
+        The text goes into a separate document that is not laid out, which
+        makes appending several times faster, and replaces the current one
+        in end_load. The editor is read-only in the meantime.
+        """
+        self.cancel_load()
+        self.setReadOnly(True)
+        document = QTextDocument(self)
+        document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        document.setDefaultFont(self.document().defaultFont())
+        document.setDefaultTextOption(self.document().defaultTextOption())
+        document.setUndoRedoEnabled(False)
+        # Attached while the document is empty, so no full pass is scheduled
+        highlighter = MarkdownHighlighter(document)
+        if size >= self.lazy_highlight_threshold:
+            highlighter.begin_lazy()
+        self._incoming = (document, highlighter, DocumentStats(document))
+
+    def append_text(self, text: str) -> None:
+        """Appends text to the document being loaded."""
+        if self._incoming is None:
+            return
+        cursor = QTextCursor(self._incoming[0])
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+
+    def end_load(self) -> None:
+        """Replaces the current document with the one loaded since begin_load."""
+        if self._incoming is None:
+            return
+        document, highlighter, stats = self._incoming
+        self._incoming = None
+        self.lazy_timer.stop()
+        # Documents from earlier loads are ours to delete; Qt deletes its own
+        previous = self.document() if self.document().parent() is self else None
+        document.setUndoRedoEnabled(True)
+        self.setDocument(document)
+        self.highlighter = highlighter
+        self.stats = stats
+        # Parsed once the text is complete rather than chunk by chunk
+        self.outline = DocumentOutline(document)
+        self._text = None
+        document.contentsChange.connect(self._drop_text)
+        if previous is not None:
+            previous.deleteLater()
+        self.setReadOnly(False)
+        if highlighter.lazy:
+            self._start_lazy()
+
+    def cancel_load(self) -> None:
+        """Drops the document being loaded and keeps the current one."""
+        if self._incoming is not None:
+            self._incoming[0].deleteLater()
+            self._incoming = None
+        self.setReadOnly(False)
+
+    def begin_bulk_edit(self) -> None:
+        """Holds highlighting back during a long series of edits, such as Replace All."""
+        if self._incoming is None:
+            self.lazy_timer.stop()
+            self.highlighter.begin_lazy()
+
+    def end_bulk_edit(self) -> None:
+        """Highlights the visible lines again, and the rest in the background."""
+        if self._incoming is None and self.highlighter.loading:
+            self._start_lazy()
+
+    def evict_highlighting(self) -> None:
+        """Drops the highlight formats, for example while the editor is hidden."""
+        if self._incoming is not None:
+            return
+        self.lazy_timer.stop()
+        self.highlighter.drop_formats()
+
+    def restore_highlighting(self) -> None:
+        """Highlights the visible lines again, and the rest in the background."""
+        if self._incoming is None and self.highlighter.lazy:
+            self._start_lazy()
+
+    def _start_lazy(self) -> None:
+        """Starts highlighting a freshly loaded document lazily."""
+        self.highlighter.loading = False
+        QTimer.singleShot(0, self.highlight_visible)
+        self.lazy_timer.start()
+
+    def highlight_visible(self) -> None:
+        """Highlights the visible lines, plus a margin, during lazy highlighting."""
+        if not self.highlighter.lazy:
+            return
+        first = self.cursorForPosition(QPoint(0, 0)).blockNumber()
+        last = self.cursorForPosition(QPoint(0, self.viewport().height())).blockNumber()
+        start = max(0, first - LAZY_MARGIN)
+        self.highlighter.highlight_range(start, last + LAZY_MARGIN + 1 - start)
 
+    def highlight_slice(self) -> None:
+        """Highlights the next part of a lazily highlighted document."""
+        if self.highlighter.highlight_slice(LAZY_SLICE):
+            self.lazy_timer.stop()
@@ -0,0 +1,123 @@
+import codecs
+import io
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterator, Tuple, Union
+
+# Checked in order, so the UTF-32 LE mark wins over the UTF-16 LE mark it starts with
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+# Used when a file is neither Unicode with a byte order mark nor valid UTF-8
+FALLBACK_ENCODING = 'cp1252'
+CHUNK_SIZE = 1 << 20
+# Read once at import; changing the umask later from a worker thread would race
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def detect_encoding(head: bytes) -> Tuple[str, int]:
+    """Returns the encoding of a file starting with head and the length of its byte order mark."""
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    # UTF-16 without a byte order mark: ASCII text has every other byte zero
+    sample = head[:4096]
+    if len(sample) >= 4:
+        if sample[1::2].count(0) > len(sample) * 2 // 5:
+            return 'utf-16-le', 0
+        if sample[0::2].count(0) > len(sample) * 2 // 5:
+            return 'utf-16-be', 0
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING, 0
+    return 'utf-8', 0
+
+
+def read_chunks(path: Union[str, Path], chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, int]]:
+    """Yields the text of a file one chunk at a time with the bytes read so far.
+
+    The encoding is detected from the first chunk. Decoding is incremental,
+    so characters and line breaks split across chunks come out whole, and
+    line breaks are normalized to '\\n' as in text mode.
+    """
+    with open(path, 'rb') as file:
+        data = file.read(chunk_size)
+        encoding, skip = detect_encoding(data)
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(encoding)(errors='replace'), translate=True
+        )
+        data = data[skip:]
+        read = skip
+        while data:
+            read += len(data)
+            text = decoder.decode(data)
+            if text:
+                yield text, read
+            data = file.read(chunk_size)
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text, read
+
+
+def decode_bytes(data: bytes) -> str:
+    """Decodes a whole file's bytes the way read_chunks decodes them."""
+    encoding, skip = detect_encoding(data)
+    text = data[skip:].decode(encoding, errors='replace')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def read_text(path: Union[str, Path]) -> str:
+    """Reads a whole file with the encoding detected by read_chunks."""
+    return ''.join(text for text, _ in read_chunks(path))
+
+
+def atomic_write(path: Union[str, Path], text: str, encoding: str = 'utf-8',
+                 sync: bool = True) -> None:
+    """Writes text to path so that a crash leaves either the old or the new file.
+
+    The text goes to a temporary file next to path, which is flushed to disk
+    and then renamed over path. Without sync nothing is flushed, so readers
+    still never see a partial file but a power loss may lose the write.
+    """
+    path = Path(path)
+    fd, temp = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=path.parent)
+    try:
+        with open(fd, 'w', encoding=encoding) as file:
+            file.write(text)
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        try:
+            os.chmod(temp, path.stat().st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(temp, 0o666 & ~UMASK)
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
+    if sync:
+        _sync_directory(path.parent)
+
+
+def _sync_directory(directory: Path) -> None:
+    """Flushes a rename in directory to disk where the platform allows it."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,434 @@
+from PyQt5.QtWidgets import QCheckBox, QGridLayout, QLabel, QLineEdit, QPushButton, QWidget
+from PyQt5.QtGui import QTextCursor, QTextDocument
+from PyQt5.QtCore import QRegularExpression, QTimer, Qt
+from typing import List, Optional, Tuple, Union
+import re
+import time
+
+from .editor import Editor
+from .profiling import profiled
+
+# Time the match count and Replace All may take per turn of the event loop, in seconds
+SCAN_BUDGET = 0.01
+# Quiet time after an edit before the matches are counted again, in milliseconds
+RECOUNT_DELAY = 200
+
+# Lines the match count and Replace All take at a time between looks at the clock
+SCAN_LINES = 512
+
+TEMPLATE_RE = re.compile(r'\\(\d|\\)')
+# Characters outside the Basic Multilingual Plane, which take two UTF-16 units
+ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+
+
+def expand_template(template: str, match) -> str:
+    """Expands the \\1 to \\9 and \\0 groups of a replacement from a QRegularExpressionMatch."""
+    return TEMPLATE_RE.sub(lambda m: '\\' if m.group(1) == '\\' else match.captured(int(m.group(1))),
+                           template)
+
+
+class LineMatcher:
+    """Counts and replaces the matches of a plain query within one line.
+
+    Matches never span lines, as with QTextDocument.find.
+    """
+
+    def __init__(self, text: str, flags: QTextDocument.FindFlags) -> None:
+        pattern = re.escape(text)
+        if flags & QTextDocument.FindWholeWords:
+            pattern = rf'(?<!\w){pattern}(?!\w)'
+        self.regex = re.compile(pattern, 0 if flags & QTextDocument.FindCaseSensitively else re.IGNORECASE)
+
+    def count(self, line: str) -> int:
+        """Returns the number of matches in line."""
+        return len(self.regex.findall(line))
+
+    def replace(self, line: str, template: str) -> Tuple[str, int]:
+        """Returns line with the matches replaced by template, and their number."""
+        return self.regex.subn(lambda match: template, line)
+
+
+class RegexLineMatcher(LineMatcher):
+    """Counts and replaces the matches of a QRegularExpression within one line.
+
+    The query is matched by Qt, as QTextDocument.find matches it, whose
+    offsets count UTF-16 units; lines with characters that take two units
+    are cut up in UTF-16. Empty matches are left alone.
+    """
+
+    def __init__(self, regex: QRegularExpression) -> None:
+        self.regex = regex
+
+    def count(self, line: str) -> int:
+        """Returns the number of non-empty matches in line."""
+        matches = self.regex.globalMatch(line)
+        count = 0
+        while matches.hasNext():
+            count += matches.next().capturedLength() > 0
+        return count
+
+    def replace(self, line: str, template: str) -> Tuple[str, int]:
+        """Returns line with the matches replaced by the expanded template, and their number."""
+        matches = self.regex.globalMatch(line)
+        if not matches.hasNext():
+            return line, 0
+        wide = not line.isascii() and ASTRAL_RE.search(line) is not None
+        units = line.encode('utf-16-le') if wide else line
+        step = 2 if wide else 1
+        pieces = []
+        position = count = 0
+        while matches.hasNext():
+            match = matches.next()
+            if not match.capturedLength():
+                continue
+            start = match.capturedStart() * step
+            pieces += (units[position:start], expand_template(template, match))
+            position = match.capturedEnd() * step
+            count += 1
+        pieces.append(units[position:])
+        if wide:
+            pieces = [piece if isinstance(piece, str) else piece.decode('utf-16-le') for piece in pieces]
+        return ''.join(pieces), count
+
+
+def line_matcher(pattern: Union[str, QRegularExpression], flags: QTextDocument.FindFlags) -> LineMatcher:
+    """Returns the matcher of a query for the options in flags."""
+    if isinstance(pattern, QRegularExpression):
+        return RegexLineMatcher(pattern)
+    return LineMatcher(pattern, flags)
+
+
+def _document_lines(editor: Editor) -> List[str]:
+    """Returns the lines of the editor's document, one per text block."""
+    lines = editor.plain_text().split('\n')
+    if len(lines) != editor.document().blockCount():
+        # Line separators inside blocks
+        lines = []
+        block = editor.document().begin()
+        while block.isValid():
+            lines.append(block.text())
+            block = block.next()
+    return lines
+
+
+class FindBar(QWidget):
+    """Find and replace in the editor, without freezing on large documents.
+
+    Finding the next match is left to QTextDocument.find, which scans the
+    document natively from the cursor. Counting the matches and Replace All
+    go through the document a time slice at a time on the event loop, so
+    the editor stays responsive; Replace All is one undo step, keeps the
+    editor read-only until it is done and leaves the new text to lazy
+    highlighting.
+    """
+
+    def __init__(self, parent: Optional[QWidget] = None) -> None:
+        super().__init__(parent)
+        self.find_field = QLineEdit()
+        self.find_field.setPlaceholderText('Find')
+        self.find_field.textChanged.connect(self.on_query_changed)
+        self.find_field.returnPressed.connect(self.find_next)
+        self.replace_field = QLineEdit()
+        self.replace_field.setPlaceholderText('Replace with')
+        self.replace_field.returnPressed.connect(self.replace)
+        self.case_box = QCheckBox('Match case')
+        self.words_box = QCheckBox('Whole words')
+        self.regex_box = QCheckBox('Regular expression')
+        for box in (self.case_box, self.words_box, self.regex_box):
+            box.toggled.connect(self.on_query_changed)
+        self.count_label = QLabel()
+        previous_button = QPushButton('Previous')
+        previous_button.clicked.connect(self.find_previous)
+        next_button = QPushButton('Next')
+        next_button.clicked.connect(self.find_next)
+        self.replace_button = QPushButton('Replace')
+        self.replace_button.clicked.connect(self.replace)
+        self.replace_all_button = QPushButton('Replace All')
+        self.replace_all_button.clicked.connect(self.replace_all)
+        close_button = QPushButton('Close')
+        close_button.clicked.connect(self.close_bar)
+
+        layout = QGridLayout()
+        layout.setContentsMargins(4, 2, 4, 2)
+        layout.addWidget(self.find_field, 0, 0)
+        layout.addWidget(previous_button, 0, 1)
+        layout.addWidget(next_button, 0, 2)
+        layout.addWidget(self.case_box, 0, 3)
+        layout.addWidget(self.words_box, 0, 4)
+        layout.addWidget(self.regex_box, 0, 5)
+        layout.addWidget(self.count_label, 0, 6)
+        layout.addWidget(close_button, 0, 7)
+        layout.addWidget(self.replace_field, 1, 0)
+        layout.addWidget(self.replace_button, 1, 1)
+        layout.addWidget(self.replace_all_button, 1, 2)
+        layout.setColumnStretch(0, 1)
+        self.setLayout(layout)
+
+        self.editor: Optional[Editor] = None
+        self.matches = 0
+        self.replaced = 0
+        # The lines the match count and Replace All go through, and how far they are
+        self._lines: List[str] = []
+        self._line = 0
+        self._matcher: Optional[LineMatcher] = None
+        self._replacing = False
+        # Lines Replace All changed in the current slice, and whether it has
+        # made the first edit block, which later slices join
+        self._changed = (0, -1)
+        self._edited = False
+        self._scan_timer = QTimer(self)
+        self._scan_timer.setInterval(0)
+        self._scan_timer.timeout.connect(self._scan_slice)
+        self._recount_timer = QTimer(self)
+        self._recount_timer.setSingleShot(True)
+        self._recount_timer.setInterval(RECOUNT_DELAY)
+        self._recount_timer.timeout.connect(self.count_matches)
+
+    def set_editor(self, editor: Editor) -> None:
+        """Searches another editor, for example after switching tabs."""
+        if editor is self.editor:
+            return
+        self._stop_scan()
+        if self.editor is not None:
+            try:
+                self.editor.textChanged.disconnect(self.on_text_changed)
+            except (TypeError, RuntimeError):
+                pass
+        self.editor = editor
+        editor.textChanged.connect(self.on_text_changed)
+        if self.isVisible():
+            self.count_matches()
+
+    def show_find(self, replace: bool = False) -> None:
+        """Shows the bar with the selected text as the query, focusing find or replace."""
+        cursor = self.editor.textCursor() if self.editor is not None else None
+        if cursor is not None and cursor.hasSelection() and '\u2029' not in cursor.selectedText():
+            self.find_field.setText(cursor.selectedText())
+        self.show()
+        field = self.replace_field if replace and self.find_field.text() else self.find_field
+        field.setFocus()
+        field.selectAll()
+        self.count_matches()
+
+    def close_bar(self) -> None:
+        """Hides the bar and gives the focus back to the editor."""
+        self._stop_scan()
+        self.hide()
+        if self.editor is not None:
+            self.editor.setFocus()
+
+    def pattern(self) -> Union[str, QRegularExpression, None]:
+        """Returns what to search for, or None if the query is empty or invalid."""
+        text = self.find_field.text()
+        if not text:
+            return None
+        if not self.regex_box.isChecked():
+            return text
+        if self.words_box.isChecked():
+            text = rf'\b(?:{text})\b'
+        options = QRegularExpression.NoPatternOption
+        if not self.case_box.isChecked():
+            options |= QRegularExpression.CaseInsensitiveOption
+        regex = QRegularExpression(text, options)
+        return regex if regex.isValid() else None
+
+    def flags(self, backward: bool = False) -> QTextDocument.FindFlags:
+        """Returns the QTextDocument.find flags of the options."""
+        flags = QTextDocument.FindFlags()
+        if self.case_box.isChecked():
+            flags |= QTextDocument.FindCaseSensitively
+        if self.words_box.isChecked() and not self.regex_box.isChecked():
+            flags |= QTextDocument.FindWholeWords
+        if backward:
+            flags |= QTextDocument.FindBackward
+        return flags
+
+    def find_next(self) -> bool:
+        """Selects the next match after the cursor, wrapping around at the end."""
+        return self._find(backward=False)
+
+    def find_previous(self) -> bool:
+        """Selects the previous match before the cursor, wrapping around at the start."""
+        return self._find(backward=True)
+
+    @profiled('find.next')
+    def _find(self, backward: bool) -> bool:
+        """Finds and selects a match, wrapping around once."""
+        pattern = self.pattern()
+        if pattern is None or self.editor is None:
+            return False
+        document = self.editor.document()
+        flags = self.flags(backward)
+        found = document.find(pattern, self.editor.textCursor(), flags)
+        if found.isNull():
+            start = QTextCursor(document)
+            start.movePosition(QTextCursor.End if backward else QTextCursor.Start)
+            found = document.find(pattern, start, flags)
+        if found.isNull():
+            self._show_count()
+            return False
+        self.editor.setTextCursor(found)
+        self._show_count()
+        return True
+
+    def replace(self) -> None:
+        """Replaces the selected match, if the selection is one, and finds the next."""
+        if self.editor is None or self.editor.isReadOnly():
+            return
+        cursor = self.editor.textCursor()
+        if cursor.hasSelection() and self._is_match(cursor):
+            cursor.insertText(self._replacement(cursor))
+        self.find_next()
+
+    def replace_all(self) -> None:
+        """Replaces every match in the background, as one undo step."""
+        if self.pattern() is None or self.editor is None or self.editor.isReadOnly():
+            return
+        self._start_scan(replacing=True)
+        self.editor.setReadOnly(True)
+        self.editor.begin_bulk_edit()
+        self.count_label.setText('Replacing...')
+
+    def count_matches(self) -> None:
+        """Counts the matches in the background, restarting if a count is under way."""
+        if self._replacing:
+            return
+        self._stop_scan()
+        if self.pattern() is None or self.editor is None:
+            self.matches = 0
+            self._show_count()
+            return
+        self._start_scan(replacing=False)
+        self.count_label.setText('Counting...')
+
+    def is_idle(self) -> bool:
+        """Returns True when no count or Replace All is running."""
+        return not self._scan_timer.isActive()
+
+    def on_query_changed(self) -> None:
+        """Counts the matches of the new query."""
+        if self.pattern() is None and self.find_field.text():
+            self._stop_scan()
+            self.count_label.setText('Invalid pattern')
+            return
+        self.count_matches()
+
+    def on_text_changed(self) -> None:
+        """Counts again once editing pauses."""
+        if self.isVisible() and not self._replacing:
+            self._recount_timer.start()
+
+    def _start_scan(self, replacing: bool) -> None:
+        """Starts counting or replacing the matches line by line from the top."""
+        self._stop_scan()
+        self._matcher = line_matcher(self.pattern(), self.flags())
+        self._lines = _document_lines(self.editor)
+        self._line = 0
+        self._changed = (len(self._lines), -1)
+        self._replacing = replacing
+        self._edited = False
+        self.matches = self.replaced = 0
+        self._scan_timer.start()
+
+    @profiled('find.scan')
+    def _scan_slice(self) -> None:
+        """Counts or replaces the matches on the lines reached within one time slice.
+
+        The lines a slice changes are replaced with one edit, from the first
+        to the last of them, so the highlighter, the statistics and the
+        journal see a few large changes rather than one per match.
+        """
+        lines, matcher = self._lines, self._matcher
+        first = self._line
+        end = first
+        deadline = time.perf_counter() + SCAN_BUDGET
+        while end < len(lines) and time.perf_counter() < deadline:
+            stop = min(end + SCAN_LINES, len(lines))
+            if not self._replacing:
+                self.matches += sum(map(matcher.count, lines[end:stop]))
+            else:
+                template = self.replace_field.text()
+                for index in range(end, stop):
+                    line, count = matcher.replace(lines[index], template)
+                    if count:
+                        lines[index] = line
+                        self.replaced += count
+                        self._changed = (min(self._changed[0], index), index)
+            end = stop
+        self._line = end
+        if self._replacing and self._changed[0] <= self._changed[1]:
+            self._apply_changes()
+        if end >= len(lines):
+            replacing = self._replacing
+            self._stop_scan()
+            if replacing:
+                self.count_label.setText(f'Replaced {self.replaced}')
+            else:
+                self._show_count()
+
+    def _apply_changes(self) -> None:
+        """Writes the lines changed by the last slice into the document."""
+        first, last = self._changed
+        self._changed = (len(self._lines), -1)
+        document = self.editor.document()
+        start = document.findBlockByNumber(first)
+        end = document.findBlockByNumber(last)
+        cursor = QTextCursor(document)
+        if self._edited:
+            cursor.joinPreviousEditBlock()
+        else:
+            cursor.beginEditBlock()
+        self._edited = True
+        cursor.setPosition(start.position())
+        cursor.setPosition(end.position() + end.length() - 1, QTextCursor.KeepAnchor)
+        cursor.insertText('\n'.join(self._lines[first:last + 1]))
+        cursor.endEditBlock()
+
+    def _stop_scan(self) -> None:
+        """Stops a count or Replace All where it is."""
+        self._scan_timer.stop()
+        self._recount_timer.stop()
+        self._lines = []
+        self._changed = (0, -1)
+        if self._replacing:
+            self._replacing = False
+            self.editor.setReadOnly(False)
+            self.editor.end_bulk_edit()
+
+    def _show_count(self) -> None:
+        """Shows the number of matches once they are counted."""
+        if self._scan_timer.isActive():
+            return
+        if self.pattern() is None:
+            self.count_label.setText('')
+        elif self.matches == 0:
+            self.count_label.setText('No matches')
+        else:
+            self.count_label.setText(f'{self.matches} matches')
+
+    def _is_match(self, cursor: QTextCursor) -> bool:
+        """Returns True if the selection is exactly a match of the query."""
+        start = QTextCursor(cursor.document())
+        start.setPosition(cursor.selectionStart())
+        found = cursor.document().find(self.pattern(), start, self.flags())
+        return (not found.isNull() and found.selectionStart() == cursor.selectionStart()
+                and found.selectionEnd() == cursor.selectionEnd())
+
+    def _replacement(self, cursor: QTextCursor) -> str:
+        """Returns the text that replaces the match selected by cursor."""
+        template = self.replace_field.text()
+        pattern = self.pattern()
+        if not isinstance(pattern, QRegularExpression):
+            return template
+        block = cursor.document().findBlock(cursor.selectionStart())
+        match = pattern.match(block.text(), cursor.selectionStart() - block.position(),
+                              QRegularExpression.NormalMatch,
+                              QRegularExpression.AnchoredMatchOption)
+        return expand_template(template, match)
+
+    def keyPressEvent(self, event) -> None:
+        """Closes the bar on Escape."""
+        if event.key() == Qt.Key_Escape:
+            self.close_bar()
+        else:
+            super().keyPressEvent(event)
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+import threading
+
+# Pygments is imported on first use: this module is loaded at startup to
+# size the cache, before anything has been highlighted.
+
+# Total size of the cached HTML, in characters
+DEFAULT_CACHE_SIZE = 8 << 20
+
+
+class HighlightStats(NamedTuple):
+    """Hit and miss counts of the highlight cache."""
+
+    hits: int
+    misses: int
+    entries: int
+    size: int
+
+
+class HighlightCache:
+    """Memoizes Pygments output of code blocks, with shared lexers and formatters.
+
+    Highlighted HTML is kept by (language, options, code hash) in an LRU
+    whose total size is capped. Lexer and formatter instances are created
+    once per language and options and reused for every block. Safe to use
+    from several converter threads.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._html: 'OrderedDict[Hashable, str]' = OrderedDict()
+        self._lexers: Dict[Hashable, Any] = {}
+        self._formatters: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+
+    def stats(self) -> HighlightStats:
+        """Returns the hit and miss counts and the current size."""
+        with self._lock:
+            return HighlightStats(self.hits, self.misses, len(self._html), self._size)
+
+    def clear(self) -> None:
+        """Drops the cached HTML and resets the counts."""
+        with self._lock:
+            self._html.clear()
+            self._size = self.hits = self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """Returns the cached HTML for key, counting a hit or a miss."""
+        with self._lock:
+            html = self._html.get(key)
+            if html is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._html.move_to_end(key)
+            return html
+
+    def put(self, key: Hashable, html: str) -> None:
+        """Stores HTML, evicting the least recently used blocks over the size cap."""
+        with self._lock:
+            if key in self._html or len(html) > self.max_size:
+                return
+            self._html[key] = html
+            self._size += len(html)
+            while self._size > self.max_size:
+                _, old = self._html.popitem(last=False)
+                self._size -= len(old)
+
+    def lexer(self, lang: str, options: Dict[str, Any], options_key: str) -> Optional[Any]:
+        """Returns the shared lexer for a language, or None if Pygments does not know it."""
+        key = (lang, options_key)
+        lexer = self._lexers.get(key)
+        if lexer is None and key not in self._lexers:
+            from pygments.lexers import get_lexer_by_name
+            from pygments.util import ClassNotFound
+            try:
+                lexer = get_lexer_by_name(lang, **options)
+            except ClassNotFound:
+                lexer = None
+            self._lexers[key] = lexer
+        return lexer
+
+    def formatter(self, name: str, options: Dict[str, Any], options_key: str) -> Any:
+        """Returns the shared formatter for a formatter name and options."""
+        key = (name, options_key)
+        formatter = self._formatters.get(key)
+        if formatter is None:
+            from pygments.formatters import get_formatter_by_name
+            from pygments.util import ClassNotFound
+            try:
+                formatter = get_formatter_by_name(name, **options)
+            except ClassNotFound:
+                formatter = get_formatter_by_name('html', **options)
+            self._formatters[key] = formatter
+        return formatter
+
+
+_shared_cache = HighlightCache()
+
+
+def get_highlight_cache() -> HighlightCache:
+    """Returns the highlight cache shared by every converter in the process."""
+    return _shared_cache
@@ -1,48 +1,282 @@
 # markdown_editor/highlighter.py
 
-from PyQt5.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont
-from PyQt5.QtCore import QRegExp
+from PyQt5.QtGui import QSyntaxHighlighter, QTextCharFormat, QTextLayout, QColor, QFont
+from PyQt5.QtCore import QRegularExpression
+from typing import Callable, Optional
+
+from .profiling import profiled
+
+# Block states carried from one line to the next
+NORMAL = 0
+COMMENT = 1
+FRONT_MATTER = 2
+# Fenced code is FENCE + 2 * fence length (+ 1 for ~~~ fences), so the
+# closing fence can be matched exactly
+FENCE = 16
+
 
 class MarkdownHighlighter(QSyntaxHighlighter):
-    """Syntax highlighter for Markdown."""
+    """Syntax highlighter for Markdown.
+
+    Inline rules are combined into one precompiled expression and each line
+    is scanned once. Fenced code, HTML comments and front matter span lines
+    and are tracked with the block state, so an edit only re-highlights the
+    lines whose state actually changes.
+
+    In lazy mode nothing is done while a document loads. Lines are formatted
+    when they are shown (highlight_range) or by highlight_slice, which works
+    through the document from the top a slice at a time; block states are
+    computed up to the first line that needs them.
+    """
+
+    # Alternatives are tried in order; the group number identifies the rule
+    INLINE_PATTERN = QRegularExpression(
+        r'(`[^`]+`)'                 # 1: code
+        r'|(<!--.*?(?:-->|$))'       # 2: comment, possibly left open
+        r'|(\*\*.+?\*\*)'            # 3: bold
+        r'|(\*[^*]+\*)'              # 4: italic
+    )
+    HEADING_PATTERN = QRegularExpression(r'^#{1,6} .+')
+    FENCE_PATTERN = QRegularExpression(r'^(`{3,}|~{3,})')
 
     def __init__(self, document):
         super().__init__(document)
-        self.highlighting_rules = []
+        self.lazy = False
+        self.loading = False
+        self._known = 0
+        self._frontier = 0
+        self._window = (0, 0)
 
         # Heading
-        heading_format = QTextCharFormat()
-        heading_format.setForeground(QColor('blue'))
-        heading_format.setFontWeight(QFont.Bold)
-        heading_pattern = QRegExp('^#{1,6} .+')
-        self.highlighting_rules.append((heading_pattern, heading_format))
+        self.heading_format = QTextCharFormat()
+        self.heading_format.setForeground(QColor('blue'))
+        self.heading_format.setFontWeight(QFont.Bold)
 
         # Bold
         bold_format = QTextCharFormat()
         bold_format.setFontWeight(QFont.Bold)
-        bold_pattern = QRegExp(r'\*\*(.*?)\*\*')
-        self.highlighting_rules.append((bold_pattern, bold_format))
 
         # Italic
         italic_format = QTextCharFormat()
         italic_format.setFontItalic(True)
-        italic_pattern = QRegExp(r'\*(.*?)\*')
-        self.highlighting_rules.append((italic_pattern, italic_format))
 
         # Code
-        code_format = QTextCharFormat()
-        code_format.setForeground(QColor('darkGreen'))
+        self.code_format = QTextCharFormat()
+        self.code_format.setForeground(QColor('darkGreen'))
         code_font = QFont('Courier New')
-        code_format.setFont(code_font)
-        code_pattern = QRegExp(r'`([^`]+)`')
-        self.highlighting_rules.append((code_pattern, code_format))
+        self.code_format.setFont(code_font)
+
+        # Comments and front matter
+        self.comment_format = QTextCharFormat()
+        self.comment_format.setForeground(QColor('gray'))
+        self.comment_format.setFontItalic(True)
+        self.front_matter_format = QTextCharFormat()
+        self.front_matter_format.setForeground(QColor('gray'))
+
+        self.inline_formats = {
+            1: self.code_format,
+            2: self.comment_format,
+            3: bold_format,
+            4: italic_format,
+        }
+        # Inline formats as they apply inside a heading
+        self.heading_inline_formats = {}
+        for group, fmt in self.inline_formats.items():
+            merged = QTextCharFormat(self.heading_format)
+            merged.merge(fmt)
+            self.heading_inline_formats[group] = merged
+
+    def begin_lazy(self) -> None:
+        """Starts lazy mode and skips highlighting until loading is cleared."""
+        self.lazy = True
+        self.loading = True
+        self._known = 0
+        self._frontier = 0
+        self._window = (0, 0)
+
+    def end_lazy(self) -> None:
+        """Leaves lazy mode without formatting the remaining lines."""
+        self.lazy = False
+        self.loading = False
+
+    def drop_formats(self) -> None:
+        """Clears the formats of every line and goes lazy so they are redone on demand.
+
+        Block states are kept, so lines can be formatted again in any order
+        without recomputing the states above them.
+        """
+        document = self.document()
+        if not self.lazy:
+            self._known = document.blockCount()
+        self.lazy = True
+        self._frontier = 0
+        self._window = (0, 0)
+        block = document.begin()
+        while block.isValid():
+            block.layout().clearFormats()
+            block = block.next()
+        document.markContentsDirty(0, document.characterCount())
+
+    def formatted_lines(self) -> int:
+        """Returns about how many lines carry formats."""
+        if not self.lazy:
+            return self.document().blockCount()
+        return self._frontier + max(0, self._window[1] - max(self._window[0], self._frontier))
+
+    def highlight_range(self, first: int, count: int) -> None:
+        """Formats count lines from line first if lazy mode has not reached them."""
+        if not self.lazy:
+            return
+        first = max(first, self._frontier)
+        end = first + count
+        if first >= end or (self._window[0] <= first and end <= self._window[1]):
+            return
+        self._find_states(first)
+        self._window = (first, end)
+        self._format_blocks(first, end - first)
 
+    def highlight_slice(self, count: int) -> bool:
+        """Formats the next count lines after the lazy frontier.
+
+        Returns True once the whole document is formatted and lazy mode ends.
+        """
+        if not self.lazy:
+            return True
+        self._format_blocks(self._frontier, count)
+        self._frontier += count
+        if self._frontier >= self.document().blockCount():
+            self.end_lazy()
+            return True
+        return False
+
+    def _find_states(self, number: int) -> None:
+        """Computes the block states of all lines before line number."""
+        if number <= self._known:
+            return
+        block = self.document().findBlockByNumber(self._known)
+        state = block.previous().userState() if self._known else -1
+        highlight_line = self.highlight_line
+        for current in range(self._known, number):
+            if not block.isValid():
+                break
+            text = block.text()
+            # Most lines leave a normal state as it is
+            if state != NORMAL or text[:1] in '`~' or '<!--' in text or current == 0:
+                state = highlight_line(text, state, current == 0, None)
+            block.setUserState(state)
+            block = block.next()
+        self._known = number
+
+    @profiled('highlighter.format_range')
+    def _format_blocks(self, number: int, count: int) -> None:
+        """Formats count lines from line number and relayouts them once.
+
+        Re-highlighting block by block would relayout and notify the editor
+        after every line, which costs more than the highlighting itself.
+        """
+        block = self.document().findBlockByNumber(number)
+        if not block.isValid():
+            return
+        start = block.position()
+        state = block.previous().userState() if number else -1
+        end = start
+        for _ in range(count):
+            if not block.isValid():
+                break
+            ranges = []
+
+            def paint(begin: int, length: int, fmt: QTextCharFormat) -> None:
+                format_range = QTextLayout.FormatRange()
+                format_range.start = begin
+                format_range.length = length
+                format_range.format = fmt
+                ranges.append(format_range)
+
+            state = self.highlight_line(block.text(), state, block.blockNumber() == 0, paint)
+            block.setUserState(state)
+            block.layout().setFormats(ranges)
+            end = block.position() + block.length()
+            block = block.next()
+        self._known = max(self._known, number + count)
+        self.document().markContentsDirty(start, end - start)
+
+    @profiled('highlighter.block')
     def highlightBlock(self, text: str) -> None:
         """Applies syntax highlighting to the given block of text."""
-        for pattern, format in self.highlighting_rules:
-            expression = QRegExp(pattern)
-            index = expression.indexIn(text)
-            while index >= 0:
-                length = expression.matchedLength()
-                self.setFormat(index, length, format)
-                index = expression.indexIn(text, index + length)
+        if self.loading:
+            return
+        number = self.currentBlock().blockNumber()
+        paint = self.setFormat
+        if self.lazy:
+            if number > self._known:
+                # The previous state is not known yet; the line is
+                # highlighted when lazy highlighting reaches it
+                return
+            if number == self._known:
+                self._known += 1
+            if number >= self._frontier and not self._window[0] <= number < self._window[1]:
+                paint = None
+        self.setCurrentBlockState(self.highlight_line(text, self.previousBlockState(), number == 0, paint))
+
+    def highlight_line(self, text: str, state: int, first: bool,
+                       paint: Optional[Callable[[int, int, QTextCharFormat], None]]) -> int:
+        """Highlights one line and returns the state passed on to the next one.
+
+        Formats are reported through paint; without it only the state is
+        computed.
+        """
+        if state == -1 and first and text.rstrip() == '---':
+            if paint:
+                paint(0, len(text), self.front_matter_format)
+            return FRONT_MATTER
+        if state == FRONT_MATTER:
+            if paint:
+                paint(0, len(text), self.front_matter_format)
+            end = text.rstrip()
+            return NORMAL if end in ('---', '...') else FRONT_MATTER
+        if state >= FENCE:
+            if paint:
+                paint(0, len(text), self.code_format)
+            fence = ('~' if state & 1 else '`') * ((state - FENCE) // 2)
+            return NORMAL if text.rstrip(' ') == fence else state
+
+        start = 0
+        if state == COMMENT:
+            end = text.find('-->')
+            if end < 0:
+                if paint:
+                    paint(0, len(text), self.comment_format)
+                return COMMENT
+            start = end + 3
+            if paint:
+                paint(0, start, self.comment_format)
+        elif text[:1] in '`~':
+            match = self.FENCE_PATTERN.match(text)
+            if match.hasMatch():
+                fence = match.captured(1)
+                if paint:
+                    paint(0, len(text), self.code_format)
+                return FENCE + 2 * len(fence) + (fence[0] == '~')
+
+        state = NORMAL
+        if not paint:
+            opened = text.rfind('<!--', start)
+            if opened >= 0 and text.find('-->', opened + 4) < 0:
+                state = COMMENT
+            return state
+
+        formats = self.inline_formats
+        if text[:1] == '#' and self.HEADING_PATTERN.match(text).hasMatch():
+            paint(0, len(text), self.heading_format)
+            formats = self.heading_inline_formats
+
+        if '*' not in text and '`' not in text and '<!--' not in text:
+            return state
+        matches = self.INLINE_PATTERN.globalMatch(text, start)
+        while matches.hasNext():
+            match = matches.next()
+            group = match.lastCapturedIndex()
+            paint(match.capturedStart(), match.capturedLength(), formats[group])
+            if group == 2 and not match.captured().endswith('-->'):
+                state = COMMENT
+        return state
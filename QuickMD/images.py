@@ -0,0 +1,179 @@
+from PyQt5.QtCore import QObject, QRunnable, QSize, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QImageReader
+from collections import OrderedDict
+from pathlib import Path
+from typing import Hashable, NamedTuple, Optional, Set, Tuple
+import logging
+import threading
+
+# Total size of the decoded images kept, in bytes
+DEFAULT_IMAGE_CACHE_SIZE = 64 << 20
+
+# Shown while an image is decoded
+PLACEHOLDER_SIZE = QSize(32, 32)
+PLACEHOLDER_COLOR = QColor('#E0E0E0')
+
+
+class ImageStats(NamedTuple):
+    """Hit and miss counts of the image cache."""
+
+    hits: int
+    misses: int
+    entries: int
+    size: int
+
+
+class ImageCache:
+    """Decoded, downscaled preview images in an LRU whose total size is capped.
+
+    Images are kept by path, modification time and display width, so an
+    image is decoded again only when its file changes or it is shown at
+    another width. Safe to use from several threads.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_IMAGE_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._images: 'OrderedDict[Hashable, QImage]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stats(self) -> ImageStats:
+        """Returns the hit and miss counts and the current size."""
+        with self._lock:
+            return ImageStats(self.hits, self.misses, len(self._images), self._size)
+
+    def clear(self) -> None:
+        """Drops the cached images and resets the counts."""
+        with self._lock:
+            self._images.clear()
+            self._size = self.hits = self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[QImage]:
+        """Returns the cached image for key, counting a hit or a miss."""
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._images.move_to_end(key)
+            return image
+
+    def put(self, key: Hashable, image: QImage) -> None:
+        """Stores an image, evicting the least recently used ones over the size cap."""
+        size = image.sizeInBytes()
+        with self._lock:
+            if key in self._images or size > self.max_size:
+                return
+            self._images[key] = image
+            self._size += size
+            while self._size > self.max_size:
+                _, old = self._images.popitem(last=False)
+                self._size -= old.sizeInBytes()
+
+
+_shared_cache = ImageCache()
+
+
+def get_image_cache() -> ImageCache:
+    """Returns the image cache shared by every viewer in the process."""
+    return _shared_cache
+
+
+def image_key(path: Path, width: int) -> Optional[Tuple[str, int, int]]:
+    """Returns the cache key of an image file shown at most width pixels wide.
+
+    Returns None if the file is missing.
+    """
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    return (str(path), mtime, width)
+
+
+def placeholder() -> QImage:
+    """Returns the image shown until the real one is decoded."""
+    image = QImage(PLACEHOLDER_SIZE, QImage.Format_RGB32)
+    image.fill(PLACEHOLDER_COLOR)
+    return image
+
+
+def decode_image(path: Path, width: int) -> QImage:
+    """Reads an image, scaled down while decoding if it is wider than width."""
+    reader = QImageReader(str(path))
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if size.isValid() and width > 0 and size.width() > width:
+        reader.setScaledSize(QSize(width, max(1, size.height() * width // size.width())))
+    image = reader.read()
+    if image.isNull():
+        raise OSError(reader.errorString())
+    return image
+
+
+class _DecodeSignals(QObject):
+    """Carries decoded images from the pool thread back to the GUI thread."""
+
+    decoded = pyqtSignal(str, object, object)
+
+
+class _DecodeJob(QRunnable):
+    """Decodes one image file."""
+
+    def __init__(self, name: str, path: Path, key: Tuple[str, int, int],
+                 cache: ImageCache, signals: _DecodeSignals) -> None:
+        super().__init__()
+        self.name = name
+        self.path = path
+        self.key = key
+        self.cache = cache
+        self.signals = signals
+
+    def run(self) -> None:
+        """Decodes the image into the cache and reports it, or None if it cannot be read."""
+        try:
+            image = decode_image(self.path, self.key[2])
+        except Exception as e:
+            logging.warning(f'Cannot load image {self.path}: {e}')
+            image = None
+        else:
+            self.cache.put(self.key, image)
+        self.signals.decoded.emit(self.name, self.key, image)
+
+
+class ImageLoader(QObject):
+    """Decodes preview images off the GUI thread, each file once while it is pending."""
+
+    loaded = pyqtSignal(str, QImage)
+
+    def __init__(self, cache: Optional[ImageCache] = None,
+                 pool: Optional[QThreadPool] = None,
+                 parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self.cache = cache or get_image_cache()
+        self.pool = pool or QThreadPool.globalInstance()
+        self.decoded = 0
+        self._pending: Set[Tuple[str, Tuple[str, int, int]]] = set()
+        self._signals = _DecodeSignals()
+        self._signals.decoded.connect(self._on_decoded)
+
+    def is_idle(self) -> bool:
+        """Returns True when no image is being decoded."""
+        return not self._pending
+
+    def load(self, name: str, path: Path, key: Tuple[str, int, int]) -> None:
+        """Decodes path in the background; loaded carries the image and the resource name."""
+        if (name, key) in self._pending:
+            return
+        self._pending.add((name, key))
+        self.pool.start(_DecodeJob(name, path, key, self.cache, self._signals))
+
+    def _on_decoded(self, name: str, key: Tuple[str, int, int], image: Optional[QImage]) -> None:
+        """Passes a decoded image on."""
+        self._pending.discard((name, key))
+        if image is not None:
+            self.decoded += 1
+            self.loaded.emit(name, image)
@@ -0,0 +1,495 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from .converter import MarkdownConverter, get_converter
+from .profiling import profiled, span
+
+if TYPE_CHECKING:
+    from .render_cache import RenderCache
+
+# Block structure
+FENCE_RE = re.compile(r'^(`{3,}|~{3,})')
+LIST_RE = re.compile(r'^[ ]{0,3}(?:[*+-]|\d+[.)])[ \t]+')
+INDENT_RE = re.compile(r'^(?:[ ]{4}|\t)')
+DEFINITION_RE = re.compile(r'^[ ]{0,3}:[ ]{1,3}')
+HTML_BLOCK_RE = re.compile(
+    r'^<(address|article|aside|blockquote|details|div|dl|fieldset|figure|'
+    r'footer|form|header|ol|p|pre|section|table|ul)[\s>]', re.IGNORECASE
+)
+
+# Meta data at the top of the document (same rules as markdown.extensions.meta)
+META_RE = re.compile(r'^[ ]{0,3}(?P<key>[A-Za-z0-9_-]+):\s*(?P<value>.*)')
+META_MORE_RE = re.compile(r'^[ ]{4,}(?P<value>.*)')
+META_BEGIN_RE = re.compile(r'^-{3}(\s.*)?')
+META_END_RE = re.compile(r'^(-{3}|\.{3})(\s.*)?')
+
+# Document-wide definitions
+FOOTNOTE_DEF_RE = re.compile(r'^[ ]{0,3}\[\^([^\]]*)\]:[ ]*(.*)$')
+ABBR_DEF_RE = re.compile(r'^[*]\[([^\\]*?)\][ ]?:[ ]*(.*)$')
+REFERENCE_DEF_RE = re.compile(r'^[ ]{0,3}\[([^\[\]]+)\]:[ ]*\S+')
+REFERENCE_TITLE_RE = re.compile(r'^[ ]+(["\'(]).*["\')][ ]*$')
+FOOTNOTE_REF_RE = re.compile(r'\[\^([^\]]+)\](?!:)')
+LABEL_RE = re.compile(r'\[([^\[\]]+)\]')
+
+# Rendered HTML
+FOOTNOTE_DIV = '<div class="footnote">'
+FOOTNOTE_LINK_RE = re.compile(r'<sup id="fnref\d*:([^"]*)"><a class="footnote-ref" href="#fn:\1">\d+</a>')
+HEADING_RE = re.compile(r'<h([1-6])([^>]*?) id="([^"]*)"([^>]*)>(.*?)</h\1>', re.DOTALL)
+TAG_RE = re.compile(r'<[^>]+>')
+IDCOUNT_RE = re.compile(r'^(.*)_([0-9]+)$')
+
+TOC_MARKER = '[TOC]'
+
+
+def content_hash(text: str) -> str:
+    """Returns a short, stable hash of a piece of text."""
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=12).hexdigest()
+
+
+def normalize_label(label: str) -> str:
+    """Normalizes a reference label the way Python-Markdown matches it."""
+    return ' '.join(label.lower().split())
+
+
+def meta_length(lines: List[str]) -> int:
+    """Returns the number of leading lines consumed as document meta data."""
+    index = 1 if lines and META_BEGIN_RE.match(lines[0]) else 0
+    has_key = False
+    while index < len(lines):
+        line = lines[index]
+        index += 1
+        if not line.strip() or META_END_RE.match(line):
+            return index
+        if META_RE.match(line):
+            has_key = True
+        elif not (has_key and META_MORE_RE.match(line)):
+            return index - 1
+    return index
+
+
+def split_blocks(lines: List[str], start: int = 0) -> List[Tuple[int, int]]:
+    """Splits lines into top-level blocks, returned as (start, end) line ranges.
+
+    Blocks are separated by blank lines, except that fenced code and HTML
+    comments are kept whole, and blocks that continue the previous one (loose
+    list items, indented continuations, definitions, block quotes and
+    unclosed HTML blocks) are merged into it so that each block renders the
+    same on its own as it does in the full document.
+    """
+    raw: List[Tuple[int, int]] = []
+    block_start: Optional[int] = None
+    index = start
+    count = len(lines)
+    while index < count:
+        line = lines[index]
+        if not line.strip():
+            if block_start is not None:
+                raw.append((block_start, index))
+                block_start = None
+            index += 1
+            continue
+        if block_start is None:
+            block_start = index
+        fence = FENCE_RE.match(line)
+        if fence:
+            closing = _find_fence_end(lines, index + 1, fence.group(1))
+            if closing is not None:
+                index = closing + 1
+                continue
+        elif '<!--' in line and '-->' not in line[line.index('<!--'):]:
+            closing = _find_line(lines, index + 1, '-->')
+            if closing is not None:
+                index = closing + 1
+                continue
+        index += 1
+    if block_start is not None:
+        raw.append((block_start, count))
+
+    merged: List[Tuple[int, int]] = []
+    open_tag: Optional[str] = None
+    for block in raw:
+        first = lines[block[0]]
+        if merged and (open_tag or _continues(lines[merged[-1][0]], first)):
+            merged[-1] = (merged[-1][0], block[1])
+        else:
+            merged.append(block)
+            html = HTML_BLOCK_RE.match(first)
+            open_tag = f'</{html.group(1).lower()}>' if html else None
+        if open_tag and any(open_tag in line.lower() for line in lines[block[0]:block[1]]):
+            open_tag = None
+    return merged
+
+
+def _continues(previous_first: str, first: str) -> bool:
+    """Returns True if a block starting with `first` continues the previous one."""
+    return bool(
+        INDENT_RE.match(first)
+        or DEFINITION_RE.match(first)
+        or (LIST_RE.match(first) and LIST_RE.match(previous_first))
+        or (first.startswith('>') and previous_first.startswith('>'))
+    )
+
+
+def _find_fence_end(lines: List[str], index: int, fence: str) -> Optional[int]:
+    """Returns the index of the line closing a code fence, if there is one."""
+    for i in range(index, len(lines)):
+        if lines[i].rstrip(' ') == fence:
+            return i
+    return None
+
+
+def _find_line(lines: List[str], index: int, marker: str) -> Optional[int]:
+    """Returns the index of the first line containing marker."""
+    for i in range(index, len(lines)):
+        if marker in lines[i]:
+            return i
+    return None
+
+
+class BlockInfo:
+    """What the global pass needs to know about one source block."""
+
+    __slots__ = ('content', 'references', 'abbreviations', 'footnotes',
+                 'labels', 'footnote_refs', 'is_toc', 'signature', 'source',
+                 'key', 'used_notes')
+
+    def __init__(self, text: str) -> None:
+        self.references: List[Tuple[str, str]] = []
+        self.abbreviations: List[Tuple[str, str]] = []
+        self.footnotes: List[Tuple[str, str]] = []
+        # Render source for the definitions in effect when it was last built
+        self.signature: Optional[str] = None
+        self.source = ''
+        self.key = ''
+        self.used_notes: List[str] = []
+        content: List[str] = []
+        footnote: Optional[List[str]] = None
+        fence: Optional[str] = None
+        lines = text.split('\n')
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            index += 1
+            if fence:
+                if line.rstrip(' ') == fence:
+                    fence = None
+                (footnote if footnote is not None else content).append(line)
+                continue
+            opening = FENCE_RE.match(line)
+            if opening and _find_fence_end(lines, index, opening.group(1)) is not None:
+                fence = opening.group(1)
+            elif FOOTNOTE_DEF_RE.match(line):
+                if footnote is not None:
+                    self.footnotes[-1] = (self.footnotes[-1][0], '\n'.join(footnote))
+                footnote = [line]
+                self.footnotes.append((FOOTNOTE_DEF_RE.match(line).group(1), line))
+                continue
+            elif footnote is None and ABBR_DEF_RE.match(line):
+                self.abbreviations.append((ABBR_DEF_RE.match(line).group(1), line))
+                continue
+            elif footnote is None and REFERENCE_DEF_RE.match(line):
+                label = normalize_label(REFERENCE_DEF_RE.match(line).group(1))
+                if index < len(lines) and REFERENCE_TITLE_RE.match(lines[index]):
+                    line = line + '\n' + lines[index]
+                    index += 1
+                self.references.append((label, line))
+                continue
+            if footnote is not None:
+                footnote.append(line)
+            else:
+                content.append(line)
+        if footnote is not None:
+            self.footnotes[-1] = (self.footnotes[-1][0], '\n'.join(footnote))
+        self.content = '\n'.join(content).strip('\n')
+        self.is_toc = self.content.strip() == TOC_MARKER
+        self.labels: Set[str] = {normalize_label(m) for m in LABEL_RE.findall(self.content)}
+        self.footnote_refs: List[str] = FOOTNOTE_REF_RE.findall(self.content)
+
+
+class RenderedBlock(NamedTuple):
+    """A rendered top-level block and the source lines it came from."""
+
+    key: str
+    start_line: int
+    end_line: int
+    html: str
+
+
+class RenderResult(NamedTuple):
+    """The rendered blocks of a document."""
+
+    blocks: List[RenderedBlock]
+    rendered_count: int
+
+    @property
+    def html(self) -> str:
+        """Returns the HTML of the whole document."""
+        return '\n'.join(block.html for block in self.blocks if block.html)
+
+
+class BlockRenderer:
+    """Renders Markdown block by block, re-rendering only changed blocks.
+
+    The source is split into top-level blocks and the HTML of every block is
+    cached by a hash of its source. Definitions that apply to the whole
+    document (reference links, abbreviations and footnotes) are collected in
+    a cheap global pass and appended to the blocks that use them, so a block
+    is re-rendered when its text or one of its definitions changes. Heading
+    ids, the ``[TOC]`` block and the footnote list are then fixed up across
+    blocks without running the Markdown parser again.
+
+    Blocks missing from the in-memory cache are looked up in the optional
+    persistent cache in one batch before anything is rendered, and newly
+    rendered blocks are written back to it after the render.
+
+    A renderer is not thread-safe; each document should have its own.
+    """
+
+    def __init__(self, converter: Optional[MarkdownConverter] = None,
+                 cache_size: int = 4096,
+                 persistent: Optional['RenderCache'] = None) -> None:
+        self.converter = converter or get_converter()
+        self.cache_size = cache_size
+        self.persistent = persistent
+        self._html: 'OrderedDict[str, Tuple[str, List[Tuple[int, str, str]]]]' = OrderedDict()
+        self._info: 'OrderedDict[str, BlockInfo]' = OrderedDict()
+
+    def clear(self) -> None:
+        """Drops all cached blocks."""
+        self._html.clear()
+        self._info.clear()
+
+    def cached_size(self) -> int:
+        """Returns the number of characters of source and HTML held in memory.
+
+        May be called while a render runs on another thread: the entries are
+        copied in one step, under the GIL, before they are measured.
+        """
+        entries = list(self._html.values())
+        infos = list(self._info.values())
+        return (sum(len(html) for html, _ in entries)
+                + sum(len(info.content) + len(info.source) for info in infos))
+
+    @profiled('render.document')
+    def render(self, text: str) -> RenderResult:
+        """Renders a document, reusing the HTML of unchanged blocks."""
+        lines = text.split('\n')
+        ranges = split_blocks(lines, meta_length(lines))
+        infos = [self._block_info('\n'.join(lines[s:e])) for s, e in ranges]
+
+        references: Dict[str, str] = {}
+        abbreviations: Dict[str, str] = {}
+        footnotes: Dict[str, str] = {}
+        for info in infos:
+            for label, line in info.references:
+                references.setdefault(label, line)
+            for term, line in info.abbreviations:
+                abbreviations[term] = line
+            for label, definition in info.footnotes:
+                footnotes.setdefault(label, definition)
+        signature = content_hash(repr((references, abbreviations, list(footnotes))))
+        footnote_numbers = {label: i + 1 for i, label in enumerate(footnotes)}
+
+        capacity = max(self.cache_size, 2 * len(ranges))
+        for info in infos:
+            if info.signature != signature and not info.is_toc:
+                self._prepare(info, signature, references, abbreviations, footnotes)
+        if self.persistent is not None:
+            self._load([info.key for info in infos
+                        if not info.is_toc and info.content.strip() and info.key not in self._html])
+        fresh: Dict[str, Tuple[str, List[Tuple[int, str, str]]]] = {}
+        blocks: List[RenderedBlock] = []
+        toc_indexes: List[int] = []
+        headings: List[Tuple[int, str, str]] = []
+        ids: Set[str] = set()
+        counters: Dict[str, int] = {}
+        # References to each footnote so far, which number their ids like fnref2:label
+        note_refs: Dict[str, int] = {}
+        rendered = 0
+        with self.converter.acquire() as md:
+            for (start, end), info in zip(ranges, infos):
+                if info.is_toc:
+                    toc_indexes.append(len(blocks))
+                    blocks.append(RenderedBlock('', start, end, ''))
+                    continue
+                if not info.content.strip():
+                    continue
+                entry = self._html.get(info.key)
+                if entry is None:
+                    with span('markdown.convert'):
+                        html = md.convert(info.source)
+                    md.reset()
+                    if info.used_notes:
+                        html = html[:html.rfind(FOOTNOTE_DIV)].rstrip()
+                    entry = (html, [(int(m.group(1)), m.group(3), TAG_RE.sub('', m.group(5)).strip())
+                                    for m in HEADING_RE.finditer(html)])
+                    self._html[info.key] = entry
+                    fresh[info.key] = entry
+                    rendered += 1
+                else:
+                    self._html.move_to_end(info.key)
+                html, block_headings = entry
+                final = html
+                if info.used_notes:
+                    final = FOOTNOTE_LINK_RE.sub(
+                        lambda m: _footnote_link(m, footnote_numbers, note_refs), final)
+                if block_headings:
+                    unique = [unique_id(heading_id, ids, counters)
+                              for _, heading_id, _ in block_headings]
+                    headings.extend((level, heading_id, name) for (level, _, name), heading_id
+                                    in zip(block_headings, unique))
+                    if any(new != old for new, (_, old, _) in zip(unique, block_headings)):
+                        final = _rename_headings(final, iter(unique))
+                key = info.key if final == html else content_hash(final)
+                blocks.append(RenderedBlock(key, start, end, final))
+        while len(self._html) > capacity:
+            self._html.popitem(last=False)
+        while len(self._info) > capacity:
+            self._info.popitem(last=False)
+        if self.persistent is not None and fresh:
+            self.persistent.put_many({key: json.dumps(entry) for key, entry in fresh.items()})
+
+        if toc_indexes:
+            toc = build_toc(headings)
+            for index in toc_indexes:
+                block = blocks[index]
+                blocks[index] = RenderedBlock(content_hash(toc), block.start_line,
+                                              block.end_line, toc)
+        if footnotes:
+            html = self._footnote_list(footnotes, note_refs, references, abbreviations)
+            blocks.append(RenderedBlock(content_hash(html), len(lines), len(lines), html))
+        return RenderResult(blocks, rendered)
+
+    @staticmethod
+    def _prepare(info: BlockInfo, signature: str, references: Dict[str, str],
+                 abbreviations: Dict[str, str], footnotes: Dict[str, str]) -> None:
+        """Builds the render source of a block with the definitions it uses.
+
+        The source starts with a blank line so that text looking like meta
+        data is not taken as such outside the top of the document.
+        """
+        info.signature = signature
+        info.used_notes = [label for label in footnotes if label in info.footnote_refs]
+        info.source = '\n'.join(
+            ['', info.content, '']
+            + [references[label] for label in sorted(info.labels & references.keys())]
+            + [line for term, line in abbreviations.items() if term in info.content]
+            + [f'[^{label}]: .' for label in info.used_notes]
+        )
+        info.key = content_hash(info.source)
+
+    def _load(self, keys: List[str]) -> None:
+        """Fills the in-memory cache with the blocks found in the persistent cache."""
+        for key, value in self.persistent.get_many(keys).items():
+            html, headings = json.loads(value)
+            self._html[key] = (html, [tuple(heading) for heading in headings])
+
+    def _block_info(self, text: str) -> BlockInfo:
+        """Returns the (cached) global-pass information of a block."""
+        key = content_hash(text)
+        info = self._info.get(key)
+        if info is None:
+            info = BlockInfo(text)
+            self._info[key] = info
+        else:
+            self._info.move_to_end(key)
+        return info
+
+    def _footnote_list(self, footnotes: Dict[str, str], note_refs: Dict[str, int],
+                       references: Dict[str, str], abbreviations: Dict[str, str]) -> str:
+        """Renders the footnote list shown at the end of the document.
+
+        Each note is referenced as often as in the document, so it gets a
+        back-link to every reference, and the definitions its text uses are
+        added as for blocks.
+        """
+        bodies = '\n\n'.join(footnotes.values())
+        labels = {normalize_label(label) for label in LABEL_RE.findall(bodies)}
+        source = '\n\n'.join(
+            [''.join(f'[^{label}]' * max(1, note_refs.get(label, 0)) for label in footnotes), bodies]
+            + [references[label] for label in sorted(labels & references.keys())]
+            + [line for term, line in abbreviations.items() if term in bodies]
+        )
+        key = content_hash(source)
+        entry = self._html.get(key)
+        if entry is None and self.persistent is not None:
+            self._load([key])
+            entry = self._html.get(key)
+        if entry is None:
+            html = self.converter.convert(source)
+            entry = (html[html.find(FOOTNOTE_DIV):], [])
+            self._html[key] = entry
+            if self.persistent is not None:
+                self.persistent.put(key, json.dumps(entry))
+        return entry[0]
+
+
+def _footnote_link(match: 're.Match', numbers: Dict[str, int], refs: Dict[str, int]) -> str:
+    """Numbers a footnote reference, and its id among the references to the same note."""
+    label = match.group(1)
+    if label not in numbers:
+        return match.group(0)
+    count = refs.get(label, 0) + 1
+    refs[label] = count
+    ref_id = f'fnref:{label}' if count == 1 else f'fnref{count}:{label}'
+    return (f'<sup id="{ref_id}"><a class="footnote-ref" href="#fn:{label}">'
+            f'{numbers[label]}</a>')
+
+
+def _rename_headings(html: str, new_ids: Iterator[str]) -> str:
+    """Replaces the ids of the headings in html, in order."""
+    return HEADING_RE.sub(
+        lambda m: f'<h{m.group(1)}{m.group(2)} id="{next(new_ids)}"{m.group(4)}>'
+                  f'{m.group(5)}</h{m.group(1)}>',
+        html
+    )
+
+
+def unique_id(heading_id: str, ids: Set[str], counters: Dict[str, int]) -> str:
+    """Makes an id unique by appending _1, _2, ... like the toc extension.
+
+    counters remembers the last suffix tried for each base id, so repeated
+    headings do not probe every taken suffix again. Only ids without a
+    suffix of their own skip ahead: the toc extension counts on from the
+    suffix an id like a_5 has, past suffixes that may still be free.
+    """
+    skip = not IDCOUNT_RE.match(heading_id)
+    while heading_id in ids or not heading_id:
+        match = IDCOUNT_RE.match(heading_id)
+        if match:
+            base, number = match.group(1), int(match.group(2)) + 1
+        else:
+            base, number = heading_id, 1
+        if skip:
+            number = max(number, counters.get(base, 0) + 1)
+            counters[base] = number
+        heading_id = f'{base}_{number}'
+    ids.add(heading_id)
+    return heading_id
+
+
+def build_toc(headings: List[Tuple[int, str, str]]) -> str:
+    """Builds the nested table of contents for a list of headings."""
+    root: List[Tuple[str, str, list]] = []
+    stack: List[Tuple[int, list]] = []
+    for level, heading_id, name in headings:
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        children: list = []
+        (stack[-1][1] if stack else root).append((heading_id, name, children))
+        stack.append((level, children))
+    return f'<div class="toc">\n{_toc_list(root)}\n</div>'
+
+
+def _toc_list(nodes: List[Tuple[str, str, list]]) -> str:
+    """Renders one level of the table of contents."""
+    if not nodes:
+        return '<ul></ul>'
+    items = []
+    for heading_id, name, children in nodes:
+        nested = f'{_toc_list(children)}\n' if children else ''
+        items.append(f'<li><a href="#{heading_id}">{name}</a>{nested}</li>')
+    return '<ul>\n' + '\n'.join(items) + '\n</ul>'
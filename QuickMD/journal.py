@@ -0,0 +1,291 @@
+import json
+import logging
+import os
+import sys
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from .fileio import atomic_write, read_text
+from .incremental import content_hash
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+JOURNAL_SUFFIX = '.journal'
+LOCK_SUFFIX = '.lock'
+
+
+def apply_edit(pieces: List[str], at: int, removed: int, text: str) -> List[str]:
+    """Returns pieces with removed characters at position at replaced by text.
+
+    The text is kept as a list of pieces so replaying many edits does not
+    copy the whole document for each one.
+    """
+    result = []
+    end = at + removed
+    inserted = False
+    pos = 0
+    for piece in pieces:
+        start = pos
+        pos += len(piece)
+        if pos <= at or (inserted and start >= end):
+            result.append(piece)
+            continue
+        if start < at:
+            result.append(piece[:at - start])
+        if not inserted:
+            result.append(text)
+            inserted = True
+        if pos > end:
+            result.append(piece[max(end - start, 0):])
+    if not inserted:
+        result.append(text)
+    return [piece for piece in result if piece]
+
+
+class JournalLock:
+    """Marks a journal as owned by a running editor.
+
+    The lock is held on a file next to the journal rather than on the
+    journal itself, which is replaced whenever it is written in full. The
+    system releases it when the owning process ends, however it ends, so a
+    journal whose lock can be taken was left behind by a crash or a closed
+    tab and may be recovered.
+    """
+
+    def __init__(self, path: Path, descriptor: int) -> None:
+        self.path = path
+        self._descriptor = descriptor
+
+    @classmethod
+    def acquire(cls, journal: Path) -> Optional['JournalLock']:
+        """Takes the lock of a journal; returns None if a running editor holds it."""
+        path = journal.with_suffix(LOCK_SUFFIX)
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if sys.platform == 'win32':
+                msvcrt.locking(descriptor, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(descriptor)
+            return None
+        return cls(path, descriptor)
+
+    def release(self, remove: bool = False) -> None:
+        """Gives the journal up, removing the lock file along with a removed journal."""
+        if self._descriptor < 0:
+            return
+        if remove:
+            # Removed while still held, so no one takes a lock on it in between
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+        os.close(self._descriptor)
+        self._descriptor = -1
+
+
+class EditJournal:
+    """Append-only log of the edits made to a document since it was saved.
+
+    The journal starts with a base record: the file the text was loaded
+    from or saved to with a hash of that text, or the full text for untitled
+    documents. Edit records follow, so autosaving only appends what changed
+    instead of writing a snapshot of the whole document. Consecutive typing
+    is merged into one record. The file is created on the first flush, so
+    documents that are never edited leave no journal behind, and it is
+    locked from then on so other editors do not recover it while it is in use.
+    """
+
+    def __init__(self, directory: Union[str, Path], path: Optional[Path] = None) -> None:
+        self.directory = Path(directory)
+        self.path = path or self.directory / f'{uuid.uuid4().hex}{JOURNAL_SUFFIX}'
+        self.length = 0
+        self._base: Dict = {'type': 'base', 'file': None, 'text': ''}
+        self._records: List[Dict] = []
+        # Sequence number of the first record kept, so marks stay valid as records are dropped
+        self._dropped = 0
+        self._flushed = 0
+        self._sealed = 0
+        self._written = False
+        self._unsaved = False
+        self._lock: Optional[JournalLock] = None
+
+    @classmethod
+    def resume(cls, path: Path, text: str, lock: JournalLock) -> 'EditJournal':
+        """Continues a recovered journal whose edits produced text, holding its lock."""
+        journal = cls(path.parent, path)
+        journal.length = len(text)
+        journal._written = True
+        journal._unsaved = True
+        journal._lock = lock
+        return journal
+
+    @property
+    def has_edits(self) -> bool:
+        """Returns True if the document differs from the journal's base."""
+        return self._unsaved or bool(self._records)
+
+    def start(self, file: Optional[Path], text: str) -> None:
+        """Starts over from a document freshly loaded from file, or untitled."""
+        self.discard()
+        self._set_base(file, text)
+        self._restart()
+
+    def record(self, at: int, removed: int, text: str) -> None:
+        """Records that removed characters at position at were replaced by text."""
+        if removed == 0 and not text:
+            return
+        self.length += len(text) - removed
+        if self._records and len(self._records) > max(self._flushed, self._sealed):
+            last = self._records[-1]
+            if removed == 0 and at == last['at'] + len(last['text']):
+                last['text'] += text
+                return
+        self._records.append({'type': 'edit', 'at': at, 'removed': removed, 'text': text})
+
+    def snapshot(self, file: Optional[Path], text: str) -> None:
+        """Records the whole text, replacing the edits recorded so far."""
+        self._base = {'type': 'base', 'file': str(file) if file else None, 'text': text}
+        self.length = len(text)
+        self._restart()
+        self._written = False
+        self._unsaved = True
+
+    def mark(self) -> int:
+        """Returns a position in the journal to rebase on once a save completes.
+
+        Marks count every record since the journal started, so a mark taken
+        while an earlier save is still being written stays valid after that
+        save rebases the journal.
+        """
+        self._sealed = len(self._records)
+        return self._dropped + self._sealed
+
+    def rebase(self, file: Path, text: str, mark: int) -> None:
+        """Makes a saved text the new base, keeping the edits made after mark.
+
+        A save older than the current base, which finished after a later
+        one, changes nothing.
+        """
+        position = mark - self._dropped
+        if position < 0:
+            return
+        kept = self._records[position:]
+        self._set_base(file, text)
+        self.length += sum(len(record['text']) - record['removed'] for record in kept)
+        self._records = kept
+        self._dropped = mark
+        # Records sealed by saves still being written stay sealed
+        self._sealed = max(self._sealed - position, 0)
+        self._flushed = 0
+        self._unsaved = False
+        if self._written:
+            if kept:
+                self._written = False
+                self.flush()
+            else:
+                self.discard()
+
+    def flush(self) -> None:
+        """Writes the records made since the last flush to disk."""
+        if not self.has_edits or (self._written and self._flushed == len(self._records)):
+            return
+        lines = [json.dumps(record) + '\n' for record in self._records[self._flushed:]]
+        if not self._written:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self._lock is None:
+                self._lock = JournalLock.acquire(self.path)
+            atomic_write(self.path, json.dumps(self._base) + '\n' + ''.join(lines))
+            self._written = True
+        else:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(''.join(lines))
+                file.flush()
+                os.fsync(file.fileno())
+        self._flushed = len(self._records)
+
+    def discard(self) -> None:
+        """Deletes the journal file."""
+        if self._written:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        self._written = False
+        self._unsaved = False
+        if self._lock is not None:
+            self._lock.release(remove=True)
+            self._lock = None
+
+    def close(self) -> None:
+        """Leaves the journal on disk for the next session to recover."""
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+
+    def _restart(self) -> None:
+        """Drops every record, leaving the marks taken so far behind the base."""
+        self._dropped += len(self._records) + 1
+        self._records = []
+        self._flushed = self._sealed = 0
+
+    def _set_base(self, file: Optional[Path], text: str) -> None:
+        """Sets the base record for text, by reference to file if there is one."""
+        if file is None:
+            self._base = {'type': 'base', 'file': None, 'text': text}
+        else:
+            self._base = {'type': 'base', 'file': str(file), 'hash': content_hash(text)}
+        self.length = len(text)
+
+
+def find_journals(directory: Union[str, Path]) -> List[Path]:
+    """Returns the journals left in directory, newest first."""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    journals = list(directory.glob(f'*{JOURNAL_SUFFIX}'))
+    return sorted(journals, key=lambda path: path.stat().st_mtime, reverse=True)
+
+
+def recover(path: Path) -> Tuple[Optional[Path], str]:
+    """Replays a journal and returns the file it belongs to and the recovered text.
+
+    Raises ValueError if the journal is unreadable or its base file has
+    changed since the journal was written.
+    """
+    with open(path, encoding='utf-8') as file:
+        lines = file.read().split('\n')
+    records = []
+    for number, line in enumerate(lines):
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            if number >= len(lines) - 2:
+                # A crash in the middle of appending the last record
+                logging.warning(f'Ignoring truncated record at the end of {path}')
+                break
+            raise ValueError(f'Journal {path} is corrupt at line {number + 1}')
+    if not records or records[0].get('type') != 'base':
+        raise ValueError(f'Journal {path} has no base record')
+    base = records[0]
+    file_path = Path(base['file']) if base.get('file') else None
+    if 'text' in base:
+        text = base['text']
+    else:
+        try:
+            text = read_text(file_path)
+        except OSError as e:
+            raise ValueError(f'Cannot read {file_path}: {e}')
+        if content_hash(text) != base['hash']:
+            raise ValueError(f'{file_path} has changed since journal {path} was written')
+    pieces = [text]
+    for record in records[1:]:
+        pieces = apply_edit(pieces, record['at'], record['removed'], record['text'])
+    return file_path, ''.join(pieces)
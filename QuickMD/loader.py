@@ -0,0 +1,123 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from pathlib import Path
+from typing import Optional
+import logging
+import threading
+
+from .fileio import CHUNK_SIZE, read_chunks
+
+# Chunks read ahead of the GUI thread; bounds the memory used by a load
+READ_AHEAD = 2
+
+
+class _LoadSignals(QObject):
+    """Carries chunks from the pool thread back to the GUI thread."""
+
+    chunk = pyqtSignal(int, str, int)
+    finished = pyqtSignal(int)
+    failed = pyqtSignal(int, str)
+
+
+class _LoadJob(QRunnable):
+    """Reads and decodes one file."""
+
+    def __init__(self, path: Path, chunk_size: int, generation: int,
+                 signals: _LoadSignals, credit: threading.Semaphore,
+                 cancelled: threading.Event) -> None:
+        super().__init__()
+        self.path = path
+        self.chunk_size = chunk_size
+        self.generation = generation
+        self.signals = signals
+        self.credit = credit
+        self.cancelled = cancelled
+
+    def run(self) -> None:
+        """Reads the file, waiting for the GUI thread whenever it falls behind."""
+        try:
+            for text, read in read_chunks(self.path, self.chunk_size):
+                while not self.credit.acquire(timeout=0.1):
+                    if self.cancelled.is_set():
+                        return
+                if self.cancelled.is_set():
+                    return
+                self.signals.chunk.emit(self.generation, text, read)
+        except Exception as e:
+            logging.exception(f'Loading {self.path} failed')
+            self.signals.failed.emit(self.generation, str(e))
+        else:
+            self.signals.finished.emit(self.generation)
+
+
+class FileLoader(QObject):
+    """Streams a file into the GUI thread in decoded chunks.
+
+    The file is read and decoded on a pool thread and handed over a chunk at
+    a time through chunk_loaded. Only READ_AHEAD chunks are read ahead of the
+    GUI thread, so even very large files never exist in memory as a whole
+    outside the editor. A load can be cancelled at any time; chunks that
+    arrive afterwards are dropped.
+    """
+
+    chunk_loaded = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+    loaded = pyqtSignal(Path)
+    failed = pyqtSignal(Path, str)
+
+    def __init__(self, pool: Optional[QThreadPool] = None,
+                 parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        self.path: Optional[Path] = None
+        self._size = 0
+        self._generation = 0
+        self._running = False
+        self._credit = threading.Semaphore(READ_AHEAD)
+        self._cancelled = threading.Event()
+        self._signals = _LoadSignals()
+        self._signals.chunk.connect(self._on_chunk)
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+
+    def is_running(self) -> bool:
+        """Returns True while a file is being loaded."""
+        return self._running
+
+    def start(self, path: Path, chunk_size: int = CHUNK_SIZE) -> None:
+        """Starts loading path, cancelling any load in progress."""
+        self.cancel()
+        self._generation += 1
+        self._running = True
+        self.path = path
+        self._size = path.stat().st_size
+        self._credit = threading.Semaphore(READ_AHEAD)
+        self._cancelled = threading.Event()
+        self.pool.start(_LoadJob(path, chunk_size, self._generation, self._signals,
+                                 self._credit, self._cancelled))
+
+    def cancel(self) -> None:
+        """Stops the load in progress, if any."""
+        if self._running:
+            logging.info(f'Cancelled loading {self.path}')
+        self._running = False
+        self._cancelled.set()
+
+    def _on_chunk(self, generation: int, text: str, read: int) -> None:
+        """Passes a chunk on and lets the reader continue."""
+        if generation != self._generation or not self._running:
+            return
+        self.chunk_loaded.emit(text)
+        self.progress.emit(read, self._size)
+        self._credit.release()
+
+    def _on_finished(self, generation: int) -> None:
+        """Reports a completed load."""
+        if generation == self._generation and self._running:
+            self._running = False
+            self.loaded.emit(self.path)
+
+    def _on_failed(self, generation: int, message: str) -> None:
+        """Reports a failed load."""
+        if generation == self._generation and self._running:
+            self._running = False
+            self.failed.emit(self.path, message)
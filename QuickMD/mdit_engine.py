@@ -0,0 +1,286 @@
+import html
+import logging
+import re
+from typing import Any, Dict, List, Set, Tuple
+
+from markdown_it import MarkdownIt
+from markdown_it.token import Token
+
+from .incremental import (ABBR_DEF_RE, FENCE_RE, build_toc, meta_length, unique_id)
+
+try:
+    from mdit_py_plugins.attrs import attrs_plugin
+    from mdit_py_plugins.deflist import deflist_plugin
+    from mdit_py_plugins.footnote import footnote_plugin
+except ImportError:
+    attrs_plugin = deflist_plugin = footnote_plugin = None
+
+# Python-Markdown extensions this engine knows, by the last part of their
+# import path; 'extra' stands for the ones it bundles
+SUPPORTED = {'tables', 'fenced_code', 'codehilite', 'toc', 'footnotes', 'attr_list',
+             'def_list', 'abbr', 'meta'}
+EXTRA = {'tables', 'fenced_code', 'footnotes', 'attr_list', 'def_list', 'abbr'}
+# Extensions that need mdit-py-plugins
+PLUGIN_EXTENSIONS = {'footnotes', 'attr_list', 'def_list'}
+
+HEADING_ATTRS_RE = re.compile(r'\s*\{:?([^}]*)\}\s*$')
+TOC_PARAGRAPH = '<p>[TOC]</p>\n'
+
+
+class MarkdownItEngine:
+    """Renders Markdown with markdown-it-py, in the HTML of the Python-Markdown extensions.
+
+    markdown-it-py parses CommonMark several times faster than
+    Python-Markdown. The extensions the editor uses are mapped onto its
+    rules and plugins, with renderers producing the markup Python-Markdown
+    emits for heading ids, footnotes, abbreviations and highlighted code,
+    so the block renderer and the stylesheets work the same with both
+    engines. Has the convert() and reset() methods of markdown.Markdown.
+    """
+
+    def __init__(self, extensions: List[str], extension_configs: Dict[str, Dict[str, Any]]) -> None:
+        names: Dict[str, str] = {}
+        for path in extensions:
+            name = path.rsplit('.', 1)[-1]
+            if name == 'extra':
+                names.update((part, path) for part in EXTRA)
+            else:
+                names[name] = path
+        if footnote_plugin is None and names.keys() & PLUGIN_EXTENSIONS:
+            logging.warning('mdit-py-plugins is not installed; footnotes, attribute lists '
+                            'and definition lists are not rendered by markdown-it')
+            names = {name: path for name, path in names.items() if name not in PLUGIN_EXTENSIONS}
+        unsupported = sorted(path for name, path in names.items() if name not in SUPPORTED)
+        if unsupported:
+            logging.warning(f'markdown-it engine ignores extensions: {", ".join(unsupported)}')
+        self.extensions = set(names) & SUPPORTED
+
+        md = MarkdownIt('commonmark', {'html': True})
+        if 'tables' in self.extensions:
+            md.enable('table')
+        if 'fenced_code' not in self.extensions:
+            md.disable('fence')
+        if 'codehilite' in self.extensions:
+            self._codehilite = self._codehilite_options(extension_configs.get(names['codehilite'], {}))
+            md.add_render_rule('fence', lambda renderer, tokens, idx, options, env:
+                               self._render_fence(tokens[idx]))
+        if 'footnotes' in self.extensions:
+            # Python-Markdown has no inline footnotes
+            md.use(footnote_plugin, inline=False)
+            md.core.ruler.before('footnote_tail', 'footnote_order', _footnote_order)
+            md.add_render_rule('footnote_ref', _render_footnote_ref)
+            md.add_render_rule('footnote_block_open', lambda *args: '<div class="footnote">\n<hr />\n<ol>\n')
+            md.add_render_rule('footnote_block_close', lambda *args: '</ol>\n</div>\n')
+            md.add_render_rule('footnote_open', _render_footnote_open)
+            md.add_render_rule('footnote_close', lambda *args: '</li>\n')
+            md.add_render_rule('footnote_anchor', _render_footnote_anchor)
+        if 'def_list' in self.extensions:
+            md.use(deflist_plugin)
+        if 'attr_list' in self.extensions:
+            md.use(attrs_plugin)
+        if self.extensions & {'toc', 'attr_list'}:
+            md.core.ruler.push('heading_ids', self._heading_ids)
+        if 'abbr' in self.extensions:
+            md.core.ruler.push('abbreviations', _abbreviations)
+        self.md = md
+
+    def convert(self, source: str) -> str:
+        """Converts a Markdown document to HTML."""
+        lines = source.split('\n')
+        if 'meta' in self.extensions:
+            lines = lines[meta_length(lines):]
+        env: Dict[str, Any] = {}
+        if 'abbr' in self.extensions:
+            lines = _take_abbreviations(lines, env)
+        output = self.md.render('\n'.join(lines), env)
+        if 'toc' in self.extensions and TOC_PARAGRAPH in output:
+            output = output.replace(TOC_PARAGRAPH, build_toc(env.get('headings', [])) + '\n')
+        return output.rstrip('\n')
+
+    def reset(self) -> 'MarkdownItEngine':
+        """Does nothing: all per-document state lives in the render environment."""
+        return self
+
+    @staticmethod
+    def _codehilite_options(config: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the CodeHilite options of the codehilite extension settings."""
+        from markdown.extensions.codehilite import CodeHiliteExtension
+        options = CodeHiliteExtension(**config).getConfigs()
+        # Passed per block by the fenced_code extension
+        options.pop('linenums', None)
+        return options
+
+    def _render_fence(self, token: Token) -> str:
+        """Highlights fenced code the way the fenced_code and codehilite extensions do."""
+        from .codehilite import CachedCodeHilite
+        lang = token.info.strip().split(' ', 1)[0] or None
+        code = CachedCodeHilite(token.content, lang=lang, **self._codehilite)
+        return code.hilite(shebang=False) + '\n'
+
+    def _heading_ids(self, state) -> None:
+        """Gives headings the ids of the toc extension and applies trailing attribute lists."""
+        ids: Set[str] = set()
+        counters: Dict[str, int] = {}
+        headings: List[Tuple[int, str, str]] = state.env.setdefault('headings', [])
+        tokens = state.tokens
+        for index, token in enumerate(tokens):
+            if token.type != 'heading_open':
+                continue
+            inline = tokens[index + 1]
+            attributes: Dict[str, str] = {}
+            if 'attr_list' in self.extensions and inline.children:
+                last = inline.children[-1]
+                match = HEADING_ATTRS_RE.search(last.content) if last.type == 'text' else None
+                if match:
+                    attributes = _parse_attributes(match.group(1))
+                    last.content = last.content[:match.start()]
+                    inline.content = inline.content[:len(inline.content) - len(match.group(0))]
+            for key, value in attributes.items():
+                if key != 'id':
+                    token.attrSet(key, value)
+            if 'toc' not in self.extensions and 'id' not in attributes:
+                continue
+            name = ''.join(child.content for child in inline.children or []
+                           if child.type in ('text', 'code_inline')).strip()
+            heading_id = unique_id(attributes.get('id') or _slugify(name), ids, counters)
+            token.attrSet('id', heading_id)
+            headings.append((int(token.tag[1]), heading_id, html.escape(name, quote=False)))
+
+
+def _slugify(value: str) -> str:
+    """Returns the heading id the toc extension derives from its text."""
+    from markdown.extensions.toc import slugify
+    return slugify(value, '-')
+
+
+def _parse_attributes(text: str) -> Dict[str, str]:
+    """Parses the #id, .class and key=value items of an attribute list."""
+    attributes: Dict[str, str] = {}
+    classes: List[str] = []
+    for item in text.split():
+        if item.startswith('#'):
+            attributes['id'] = item[1:]
+        elif item.startswith('.'):
+            classes.append(item[1:])
+        elif '=' in item:
+            key, _, value = item.partition('=')
+            attributes[key] = value.strip('"\'')
+    if classes:
+        attributes['class'] = ' '.join(classes)
+    return attributes
+
+
+def _footnote_order(state) -> None:
+    """Numbers and lists every defined footnote in the order of the definitions.
+
+    markdown-it numbers footnotes as they are referenced and drops the ones
+    never referenced; Python-Markdown keeps them all, by definition.
+    """
+    data = state.env.get('footnotes')
+    if not data:
+        return
+    old_ids = {note['label']: old for old, note in data.get('list', {}).items()}
+    labels = dict.fromkeys(token.meta['label'] for token in state.tokens
+                           if token.type == 'footnote_reference_open')
+    numbers: Dict[int, int] = {}
+    listed: Dict[int, Dict[str, Any]] = {}
+    for number, label in enumerate(labels):
+        old = old_ids.get(label)
+        if old is None:
+            listed[number] = {'label': label, 'count': 0}
+        else:
+            listed[number] = data['list'][old]
+            numbers[old] = number
+        data['refs'][':' + label] = number
+    data['list'] = listed
+    for token in state.tokens:
+        for child in token.children or []:
+            if child.type == 'footnote_ref':
+                child.meta['id'] = numbers[child.meta['id']]
+
+
+def _footnote_label(token: Token) -> str:
+    """Returns the label of a footnote, or its number if it was written inline."""
+    return token.meta.get('label') or str(token.meta['id'] + 1)
+
+
+def _render_footnote_ref(renderer, tokens: List[Token], idx: int, options, env) -> str:
+    token = tokens[idx]
+    label = _footnote_label(token)
+    ref_id = f'fnref{token.meta["subId"] + 1}:{label}' if token.meta['subId'] else f'fnref:{label}'
+    return (f'<sup id="{ref_id}"><a class="footnote-ref" href="#fn:{label}">'
+            f'{token.meta["id"] + 1}</a></sup>')
+
+
+def _render_footnote_open(renderer, tokens: List[Token], idx: int, options, env) -> str:
+    return f'<li id="fn:{_footnote_label(tokens[idx])}">\n'
+
+
+def _render_footnote_anchor(renderer, tokens: List[Token], idx: int, options, env) -> str:
+    """Links back to one reference; a note referenced n times gets n anchors in a row."""
+    token = tokens[idx]
+    label = _footnote_label(token)
+    sub_id = token.meta['subId']
+    ref_id = f'fnref{sub_id + 1}:{label}' if sub_id else f'fnref:{label}'
+    space = '' if sub_id else '&#160;'
+    return (f'{space}<a class="footnote-backref" href="#{ref_id}" '
+            f'title="Jump back to footnote {token.meta["id"] + 1} in the text">&#8617;</a>')
+
+
+def _take_abbreviations(lines: List[str], env: Dict[str, Any]) -> List[str]:
+    """Removes the abbreviation definitions outside code fences, keeping them in env."""
+    definitions: Dict[str, str] = {}
+    kept: List[str] = []
+    fence = None
+    for line in lines:
+        if fence:
+            if line.rstrip(' ') == fence:
+                fence = None
+        elif FENCE_RE.match(line):
+            fence = FENCE_RE.match(line).group(1)
+        else:
+            match = ABBR_DEF_RE.match(line)
+            if match:
+                definitions[match.group(1)] = match.group(2).strip()
+                continue
+        kept.append(line)
+    if definitions:
+        env['abbreviations'] = definitions
+    return kept
+
+
+def _abbreviations(state) -> None:
+    """Wraps defined abbreviations in the text in abbr elements."""
+    definitions: Dict[str, str] = state.env.get('abbreviations', {})
+    if not definitions:
+        return
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(term) for term in
+                                          sorted(definitions, key=len, reverse=True)) + r')\b')
+    for token in state.tokens:
+        if token.type != 'inline' or not token.children:
+            continue
+        children: List[Token] = []
+        for child in token.children:
+            if child.type != 'text' or not pattern.search(child.content):
+                children.append(child)
+                continue
+            position = 0
+            for match in pattern.finditer(child.content):
+                if match.start() > position:
+                    children.append(_text(child.content[position:match.start()]))
+                term = match.group(1)
+                abbr = Token('html_inline', '', 0)
+                abbr.content = (f'<abbr title="{html.escape(definitions[term])}">'
+                                f'{html.escape(term, quote=False)}</abbr>')
+                children.append(abbr)
+                position = match.end()
+            if position < len(child.content):
+                children.append(_text(child.content[position:]))
+        token.children = children
+
+
+def _text(content: str) -> Token:
+    """Returns a text token."""
+    token = Token('text', '', 0)
+    token.content = content
+    return token
@@ -0,0 +1,220 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtGui import QTextBlock, QTextCursor, QTextDocument
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from functools import lru_cache
+from itertools import compress
+import re
+import unicodedata
+
+from .incremental import unique_id
+from .stats import PARAGRAPH_SEPARATOR
+
+# Lines the outline cares about: ATX headings, code fences and the
+# delimiters of front matter; only lines starting with MARK_START are tried
+MARK_RE = re.compile(r'#{1,6}(?:[ \t]|$)|`{3,}|~{3,}|(?:---|\.\.\.)[ \t]*$')
+MARK_START = frozenset('#`~-.')
+HEADING_RE = re.compile(r'(#{1,6})[ \t]*(.*)')
+FENCE_RE = re.compile(r'`{3,}|~{3,}')
+CLOSING_HASHES_RE = re.compile(r'(?:^|[ \t]+)#+[ \t]*$')
+HEADING_ATTRS_RE = re.compile(r'[ \t]*\{:?([^}]*)\}[ \t]*$')
+# Inline markup dropped from heading titles: links and images keep their
+# text, emphasis and code marks go
+LINK_RE = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+MARKUP_RE = re.compile(r'[*_`]+|<[^>]+>')
+MARKUP_CHARS = frozenset('*_`<')
+# Heading lines whose parse is remembered, so reassembling the outline
+# only parses the headings that changed
+HEADING_CACHE_SIZE = 65536
+
+
+class OutlineEntry(NamedTuple):
+    """One heading of the outline; its block follows it as lines are added above."""
+
+    block: QTextBlock
+    level: int
+    title: str
+    # The id set by an attribute list, if any
+    id: str
+
+    @property
+    def line(self) -> int:
+        return self.block.blockNumber()
+
+
+def slugify(title: str) -> str:
+    """Returns the id the toc extension gives a heading with this text."""
+    value = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii')
+    value = re.sub(r'[^\w\s-]', '', value).strip().lower()
+    return re.sub(r'[-\s]+', '-', value)
+
+
+def _marks(lines: List[str]) -> List[Optional[str]]:
+    """Keeps the lines that are headings, fences or front matter delimiters."""
+    return [line if line[:1] in MARK_START and MARK_RE.match(line) else None for line in lines]
+
+
+class DocumentOutline(QObject):
+    """Headings of a document with their levels, lines and anchors.
+
+    Like DocumentStats, the lines that matter to the outline are kept per
+    block and updated from contentsChange, so an edit only looks at the
+    lines it touched. Entries hold their text block, so lines added or
+    removed elsewhere move them for free, and editing the text of a heading
+    updates only its entry (entry_changed). Other changes to headings,
+    fences or front matter reassemble the entries from the kept lines the
+    next time they are asked for (changed). Anchors, which depend on every
+    heading above, are worked out only when asked for.
+    """
+
+    changed = pyqtSignal()
+    entry_changed = pyqtSignal(int)
+
+    def __init__(self, document: QTextDocument) -> None:
+        super().__init__(document)
+        self.document = document
+        self._marks: List[Optional[str]] = []
+        self._entries: Optional[List[OutlineEntry]] = None
+        self._anchors: Optional[List[str]] = None
+        self.reparse()
+        document.contentsChange.connect(self.on_contents_change)
+
+    def entries(self) -> List[OutlineEntry]:
+        """Returns the headings in document order, outside fenced code and front matter."""
+        if self._entries is None:
+            self._entries = self._assemble()
+        return self._entries
+
+    def anchors(self) -> List[str]:
+        """Returns the ids the toc extension gives the headings, in the order of entries()."""
+        if self._anchors is None:
+            ids: Set[str] = set()
+            counters: Dict[str, int] = {}
+            self._anchors = [unique_id(entry.id or slugify(entry.title), ids, counters)
+                             for entry in self.entries()]
+        return self._anchors
+
+    def entry_at(self, line: int) -> Optional[int]:
+        """Returns the index of the heading whose section holds line, or None above the first."""
+        entries = self.entries()
+        low, high = 0, len(entries)
+        while low < high:
+            middle = (low + high) // 2
+            if entries[middle].line <= line:
+                low = middle + 1
+            else:
+                high = middle
+        return low - 1 if low else None
+
+    def reparse(self) -> None:
+        """Parses the whole document from scratch."""
+        lines = self.document.toPlainText().split('\n')
+        if len(lines) != self.document.blockCount():
+            # Line separators inside blocks; split block by block instead
+            lines = []
+            block = self.document.begin()
+            while block.isValid():
+                lines.append(block.text())
+                block = block.next()
+        self._marks = _marks(lines)
+        self._invalidate()
+
+    def on_contents_change(self, position: int, removed: int, added: int) -> None:
+        """Parses the blocks touched by a change again."""
+        document = self.document
+        first = document.findBlock(position)
+        last = document.findBlock(position + added)
+        if not last.isValid():
+            last = document.lastBlock()
+        if not first.isValid():
+            self.reparse()
+            return
+        start = first.blockNumber()
+        old_end = last.blockNumber() - (document.blockCount() - len(self._marks))
+        if old_end < start - 1 or old_end >= len(self._marks):
+            self.reparse()
+            return
+        self._replace(start, old_end + 1, first, last)
+
+    def _replace(self, start: int, end: int, first: QTextBlock, last: QTextBlock) -> None:
+        """Replaces the lines kept for old blocks start..end - 1 with those of blocks first..last."""
+        cursor = QTextCursor(self.document)
+        cursor.setPosition(first.position())
+        cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+        marks = _marks(cursor.selectedText().split(PARAGRAPH_SEPARATOR))
+        old = self._marks[start:end]
+        self._marks[start:end] = marks
+        if marks == old or not any(marks) and not any(old):
+            return
+        if self._entries is None or len(marks) != len(old):
+            self._invalidate()
+            return
+        retitled = []
+        for offset, (before, after) in enumerate(zip(old, marks)):
+            if before == after:
+                continue
+            if before is None or after is None or before[0] != '#' or after[0] != '#':
+                self._invalidate()
+                return
+            retitled.append(start + offset)
+        for line in retitled:
+            index = self.entry_at(line)
+            if index is None or self._entries[index].line != line:
+                # In fenced code or front matter
+                continue
+            self._entries[index] = _entry(self._entries[index].block, self._marks[line])
+            self._anchors = None
+            self.entry_changed.emit(index)
+
+    def _invalidate(self) -> None:
+        """Drops the entries so they are assembled again."""
+        self._entries = self._anchors = None
+        self.changed.emit()
+
+    def _assemble(self) -> List[OutlineEntry]:
+        """Lists the headings outside fenced code and front matter."""
+        entries: List[OutlineEntry] = []
+        fence = None
+        marks = self._marks
+        front_matter = bool(marks) and marks[0] is not None and marks[0].rstrip() == '---'
+        find_block = self.document.findBlockByNumber
+        for line in compress(range(len(marks)), marks):
+            mark = marks[line]
+            if line == 0 and front_matter:
+                continue
+            if front_matter:
+                front_matter = mark[0] not in '-.'
+            elif fence is not None:
+                if mark.rstrip(' ') == fence:
+                    fence = None
+            elif mark[0] in '`~':
+                fence = FENCE_RE.match(mark).group()
+            elif mark[0] == '#':
+                entries.append(_entry(find_block(line), mark))
+        return entries
+
+
+def _entry(block: QTextBlock, line: str) -> OutlineEntry:
+    """Returns the entry of a heading line."""
+    return OutlineEntry(block, *parse_heading(line))
+
+
+@lru_cache(maxsize=HEADING_CACHE_SIZE)
+def parse_heading(line: str) -> Tuple[int, str, str]:
+    """Returns the level and plain title of a heading line, and the id its attribute list sets."""
+    match = HEADING_RE.match(line)
+    text = match.group(2).rstrip()
+    if text.endswith('#'):
+        text = CLOSING_HASHES_RE.sub('', text)
+    heading_id = ''
+    if text.endswith('}'):
+        attributes = HEADING_ATTRS_RE.search(text)
+        if attributes:
+            text = text[:attributes.start()]
+            for item in attributes.group(1).split():
+                if item.startswith('#'):
+                    heading_id = item[1:]
+    if '[' in text:
+        text = LINK_RE.sub(r'\1', text)
+    if MARKUP_CHARS.intersection(text):
+        text = MARKUP_RE.sub('', text).strip()
+    return len(match.group(1)), text, heading_id
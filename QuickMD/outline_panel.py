@@ -0,0 +1,162 @@
+from PyQt5.QtWidgets import (QDockWidget, QLineEdit, QTreeWidget, QTreeWidgetItem,
+                             QVBoxLayout, QWidget)
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from typing import List, Optional, Tuple
+
+from .outline import DocumentOutline, OutlineEntry
+from .profiling import profiled
+
+# Quiet time after a change to the headings before the panel is rebuilt, in milliseconds
+REFRESH_DELAY = 300
+
+
+class OutlinePanel(QDockWidget):
+    """Dockable outline of the current document; activating a heading jumps to it.
+
+    The tree is rebuilt from the document's outline only while the panel is
+    visible, once edits to the headings pause. Typing in a heading updates
+    its item alone.
+    """
+
+    heading_activated = pyqtSignal(int)
+
+    def __init__(self, parent: Optional[QWidget] = None) -> None:
+        super().__init__('Outline', parent)
+        self.setObjectName('outline')
+        self.filter = QLineEdit()
+        self.filter.setPlaceholderText('Filter headings')
+        self.filter.setClearButtonEnabled(True)
+        self.filter.textChanged.connect(self.apply_filter)
+        self.filter.returnPressed.connect(self.activate_first)
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.setUniformRowHeights(True)
+        self.tree.itemActivated.connect(self.on_item_activated)
+        self.tree.itemClicked.connect(self.on_item_activated)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.filter)
+        layout.addWidget(self.tree)
+        widget = QWidget()
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+        self.outline: Optional[DocumentOutline] = None
+        # The entries shown; their blocks keep track of their lines until the next rebuild
+        self._entries: List[OutlineEntry] = []
+        self._items: List[QTreeWidgetItem] = []
+        self._stale = True
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(REFRESH_DELAY)
+        self.timer.timeout.connect(self.refresh)
+
+    def set_outline(self, outline: DocumentOutline) -> None:
+        """Shows the outline of another document."""
+        if outline is self.outline:
+            return
+        if self.outline is not None:
+            try:
+                self.outline.changed.disconnect(self.on_changed)
+                self.outline.entry_changed.disconnect(self.on_entry_changed)
+            except (TypeError, RuntimeError):
+                pass
+        self.outline = outline
+        outline.changed.connect(self.on_changed)
+        outline.entry_changed.connect(self.on_entry_changed)
+        self._stale = True
+        if self.isVisible():
+            self.refresh()
+
+    def on_changed(self) -> None:
+        """Schedules a rebuild after headings were added, removed or moved into code."""
+        self._stale = True
+        if self.isVisible():
+            self.timer.start()
+
+    def on_entry_changed(self, index: int) -> None:
+        """Updates the item of a heading whose text was edited."""
+        if self._stale or index >= len(self._items):
+            return
+        entry = self._entries[index] = self.outline.entries()[index]
+        item = self._items[index]
+        item.setText(0, entry.title)
+        if self.filter.text():
+            self.apply_filter(self.filter.text())
+
+    @profiled('outline.refresh')
+    def refresh(self) -> None:
+        """Rebuilds the tree from the outline, nesting headings by level."""
+        self.timer.stop()
+        if self.outline is None:
+            return
+        self._stale = False
+        self.tree.clear()
+        self._entries = list(self.outline.entries())
+        self._items = []
+        # The open headings above the next one, with their levels
+        stack: List[Tuple[int, QTreeWidgetItem]] = []
+        roots = []
+        for index, entry in enumerate(self._entries):
+            while stack and stack[-1][0] >= entry.level:
+                stack.pop()
+            item = QTreeWidgetItem([entry.title])
+            item.setData(0, Qt.UserRole, index)
+            if stack:
+                stack[-1][1].addChild(item)
+            else:
+                roots.append(item)
+            stack.append((entry.level, item))
+            self._items.append(item)
+        self.tree.addTopLevelItems(roots)
+        self.tree.expandAll()
+        if self.filter.text():
+            self.apply_filter(self.filter.text())
+
+    def apply_filter(self, text: str) -> None:
+        """Shows only the headings containing text, with the headings they are under."""
+        text = text.casefold()
+        for item in self._items:
+            item.setHidden(bool(text))
+        for item in self._items:
+            if text in item.text(0).casefold():
+                while item is not None and item.isHidden():
+                    item.setHidden(False)
+                    item = item.parent()
+
+    def activate_first(self) -> None:
+        """Jumps to the first heading the filter shows."""
+        text = self.filter.text().casefold()
+        for item in self._items:
+            if not item.isHidden() and text in item.text(0).casefold():
+                self.on_item_activated(item)
+                return
+
+    def select_line(self, line: int) -> None:
+        """Selects the heading of the section holding a source line."""
+        if self._stale or not self.isVisible():
+            return
+        index = self.outline.entry_at(line)
+        if index is not None and index < len(self._items):
+            self.tree.setCurrentItem(self._items[index])
+
+    def focus_filter(self) -> None:
+        """Shows the panel and puts the focus in the filter, for jumping to a heading."""
+        self.show()
+        self.raise_()
+        self.filter.setFocus()
+        self.filter.selectAll()
+
+    def on_item_activated(self, item: QTreeWidgetItem) -> None:
+        """Reports the line of an activated heading, unless it has been deleted."""
+        index = item.data(0, Qt.UserRole)
+        if index is not None and index < len(self._entries):
+            line = self._entries[index].line
+            if line >= 0:
+                self.heading_activated.emit(line)
+
+    def showEvent(self, event) -> None:
+        """Catches up with changes made while the panel was hidden."""
+        if self._stale:
+            self.refresh()
+        super().showEvent(event)
@@ -0,0 +1,442 @@
+import asyncio
+import base64
+import hashlib
+import html
+import ipaddress
+import json
+import logging
+import mimetypes
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .incremental import RenderedBlock
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Edits published closer together than this go out as one update, in seconds
+COALESCE_DELAY = 0.05
+# Updates a client may fall behind by before it is sent the whole document instead
+CLIENT_BACKLOG = 8
+MAX_REQUEST_BYTES = 16384
+MAX_FRAME_BYTES = 65536
+START_TIMEOUT = 5.0
+# Host names every server answers to, besides the address it is bound to
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+WILDCARD_HOSTS = {'', '0.0.0.0', '::'}
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<style>
+body {{ max-width: 50em; margin: 2em auto; padding: 0 1em; font-family: sans-serif; line-height: 1.5; }}
+pre {{ overflow-x: auto; }}
+img {{ max-width: 100%; }}
+table {{ border-collapse: collapse; }}
+th, td {{ border: 1px solid #ccc; padding: 0.2em 0.5em; }}
+{code_style}
+</style>
+</head>
+<body>
+<div id="quickmd">{body}</div>
+<script>
+const root = document.getElementById('quickmd');
+let blocks = Array.from(root.children);
+
+function insert(start, fragments) {{
+  const next = blocks[start] || null;
+  const made = fragments.map(fragment => {{
+    const block = document.createElement('div');
+    block.className = 'quickmd-block';
+    block.innerHTML = fragment;
+    root.insertBefore(block, next);
+    return block;
+  }});
+  blocks.splice(start, 0, ...made);
+}}
+
+function connect() {{
+  const scheme = location.protocol === 'https:' ? 'wss://' : 'ws://';
+  const socket = new WebSocket(scheme + location.host + '/ws');
+  socket.onmessage = event => {{
+    const update = JSON.parse(event.data);
+    document.title = update.title;
+    if (update.type === 'reset') {{
+      root.replaceChildren();
+      blocks = [];
+      insert(0, update.html);
+    }} else {{
+      blocks.splice(update.start, update.remove).forEach(block => block.remove());
+      insert(update.start, update.html);
+    }}
+  }};
+  socket.onclose = () => setTimeout(connect, 1000);
+}}
+connect();
+</script>
+</body>
+</html>
+'''
+
+
+class _Document:
+    """The state of the preview last sent to the clients."""
+
+    def __init__(self, version: int = 0, title: str = '', keys: Sequence[str] = (),
+                 fragments: Sequence[str] = (), base: Optional[Path] = None) -> None:
+        self.version = version
+        self.title = title
+        self.keys = list(keys)
+        self.fragments = list(fragments)
+        self.base = base
+        self._reset: Optional[bytes] = None
+
+    def reset_frame(self) -> bytes:
+        """Returns the frame replacing a client's whole preview with this one, built once."""
+        if self._reset is None:
+            self._reset = _frame(json.dumps({'type': 'reset', 'version': self.version,
+                                             'title': self.title, 'html': self.fragments}))
+        return self._reset
+
+
+class _Client:
+    """A connected browser and the frames waiting to be sent to it."""
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.queue: 'asyncio.Queue[Optional[bytes]]' = asyncio.Queue()
+
+    def send(self, frame: bytes, document: _Document) -> None:
+        """Queues a frame; a client too far behind gets the whole document instead."""
+        if self.queue.qsize() >= CLIENT_BACKLOG:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            frame = document.reset_frame()
+        self.queue.put_nowait(frame)
+
+
+class PreviewServer:
+    """Serves the preview of the current document to browsers and pushes edits to them.
+
+    An asyncio loop on a thread of its own answers HTTP requests for the
+    page and for files next to the document, such as images, and keeps a
+    WebSocket open to each browser. publish() only hands the rendered
+    blocks over to that loop, so the editor never waits for the network.
+    Publishes coming faster than COALESCE_DELAY are coalesced, and each
+    update sends just the blocks that changed, found from the block keys
+    as the embedded viewer patches its own document. Every client has its
+    own send queue, so a slow browser never holds up the others; one that
+    falls too far behind is sent the whole document instead.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        self.host = host
+        self.port = port
+        self.updates = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._document = _Document()
+        self._pending: Optional[Tuple[str, Sequence[RenderedBlock], Optional[Path]]] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._last_flush = 0.0
+        self._clients: Set[_Client] = set()
+        self._code_style: Optional[str] = None
+
+    @property
+    def url(self) -> str:
+        """Returns the address of the preview page."""
+        host = 'localhost' if self.host in ('', '0.0.0.0', '127.0.0.1') else self.host
+        return f'http://{host}:{self.port}/'
+
+    def is_running(self) -> bool:
+        """Returns True while the server accepts connections."""
+        return self._thread is not None
+
+    def start(self) -> int:
+        """Starts serving and returns the port, which is picked by the system if 0 was asked for.
+
+        Raises OSError if the address cannot be bound.
+        """
+        if self._thread is not None:
+            return self.port
+        started = threading.Event()
+        errors: List[BaseException] = []
+        self._thread = threading.Thread(target=self._run, args=(started, errors),
+                                        name='preview-server', daemon=True)
+        self._thread.start()
+        if not started.wait(START_TIMEOUT):
+            errors.append(OSError('the preview server did not start'))
+        if errors:
+            self._thread.join(START_TIMEOUT)
+            self._thread = None
+            raise errors[0]
+        logging.info(f'Serving the preview at {self.url}')
+        return self.port
+
+    def stop(self) -> None:
+        """Closes every connection and stops the server."""
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(START_TIMEOUT)
+        self._thread = None
+        logging.info('Stopped the preview server')
+
+    def publish(self, title: str, blocks: Sequence[RenderedBlock],
+                base: Optional[Path] = None) -> None:
+        """Sends a rendered document to the browsers; safe to call from any thread.
+
+        blocks must not be changed afterwards. base is the folder files
+        linked from the document, such as images, are served from.
+        """
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._update, title, blocks, base)
+
+    def client_count(self) -> int:
+        """Returns the number of connected browsers."""
+        return len(self._clients)
+
+    def page(self) -> str:
+        """Returns the preview page with the last document sent."""
+        document = self._document
+        if self._code_style is None:
+            self._code_style = _code_style()
+        body = ''.join(f'<div class="quickmd-block">{fragment}</div>' for fragment in document.fragments)
+        return PAGE.format(title=html.escape(document.title), code_style=self._code_style, body=body)
+
+    def _run(self, started: threading.Event, errors: List[BaseException]) -> None:
+        """Runs the event loop of the server thread."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        try:
+            self._server = loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, limit=MAX_REQUEST_BYTES)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+        except BaseException as e:
+            errors.append(e)
+            loop.close()
+            started.set()
+            return
+        started.set()
+        try:
+            loop.run_forever()
+        finally:
+            self._server.close()
+            for client in list(self._clients):
+                client.writer.close()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(self._server.wait_closed())
+            loop.close()
+            self._clients.clear()
+            self._flush_handle = None
+
+    def _update(self, title: str, blocks: Sequence[RenderedBlock], base: Optional[Path]) -> None:
+        """Keeps the newest document and schedules sending it."""
+        self._pending = (title, blocks, base)
+        if self._flush_handle is None:
+            delay = max(0.0, self._last_flush + COALESCE_DELAY - self._loop.time())
+            self._flush_handle = self._loop.call_later(delay, self._flush)
+
+    def _flush(self) -> None:
+        """Sends the blocks that changed since the last update to every client."""
+        self._flush_handle = None
+        self._last_flush = self._loop.time()
+        title, blocks, base = self._pending
+        self._pending = None
+        old = self._document
+        keys = [block.key for block in blocks]
+        if keys == old.keys and title == old.title:
+            old.base = base
+            return
+        # Blocks are keyed by their source, so unchanged blocks keep their keys
+        limit = min(len(keys), len(old.keys))
+        prefix = 0
+        while prefix < limit and keys[prefix] == old.keys[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and keys[-1 - suffix] == old.keys[-1 - suffix]:
+            suffix += 1
+        document = _Document(old.version + 1, title, keys, [block.html for block in blocks], base)
+        self._document = document
+        self.updates += 1
+        if not self._clients:
+            return
+        frame = _frame(json.dumps({
+            'type': 'patch', 'version': document.version, 'title': title, 'start': prefix,
+            'remove': len(old.keys) - prefix - suffix,
+            'html': document.fragments[prefix:len(keys) - suffix]
+        }))
+        for client in self._clients:
+            client.send(frame, document)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers one HTTP request, or serves a WebSocket until the browser leaves."""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = lines[0].split(' ', 2)
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            path = unquote(urlsplit(target).path)
+            host = headers.get('host', '')
+            if not self._is_own_host(host):
+                # A page on another site reaching the server through DNS rebinding
+                await _respond(writer, 403, 'text/plain', b'Forbidden')
+            elif method != 'GET':
+                await _respond(writer, 405, 'text/plain', b'Method not allowed')
+            elif path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                # Browsers let any page open sockets to localhost, but say which page did
+                if headers.get('origin') != f'http://{host}':
+                    await _respond(writer, 403, 'text/plain', b'Forbidden')
+                else:
+                    await self._serve_socket(reader, writer, headers)
+            elif path == '/':
+                await _respond(writer, 200, 'text/html; charset=utf-8', self.page().encode('utf-8'))
+            else:
+                await self._serve_file(writer, path)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _is_own_host(self, host: str) -> bool:
+        """Returns True if a Host header names this server rather than another site.
+
+        Besides the bound address and the loopback names, a server bound to
+        all interfaces answers to any IP address, which unlike a host name
+        cannot be pointed at it by another site.
+        """
+        try:
+            address = urlsplit(f'//{host}')
+            hostname, port = address.hostname or '', address.port or 80
+        except ValueError:
+            return False
+        if port != self.port:
+            return False
+        if hostname in LOCAL_HOSTS or hostname == self.host.lower():
+            return True
+        if self.host in WILDCARD_HOSTS:
+            try:
+                ipaddress.ip_address(hostname)
+            except ValueError:
+                return False
+            return True
+        return False
+
+    async def _serve_file(self, writer: asyncio.StreamWriter, path: str) -> None:
+        """Serves a file from the document's folder, such as an image it shows."""
+        base = self._document.base
+        if base is not None:
+            file = (base / path.lstrip('/')).resolve()
+            inside = base.resolve() in file.parents
+            if inside and file.is_file() and not any(
+                    part.startswith('.') for part in file.relative_to(base.resolve()).parts):
+                content_type = mimetypes.guess_type(file.name)[0] or 'application/octet-stream'
+                body = await asyncio.get_running_loop().run_in_executor(None, file.read_bytes)
+                await _respond(writer, 200, content_type, body)
+                return
+        await _respond(writer, 404, 'text/plain', b'Not found')
+
+    async def _serve_socket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                            headers: Dict[str, str]) -> None:
+        """Completes the WebSocket handshake and pushes updates until the browser leaves."""
+        key = headers.get('sec-websocket-key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n'
+                      f'Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+        client = _Client(writer)
+        client.send(self._document.reset_frame(), self._document)
+        self._clients.add(client)
+        sender = asyncio.ensure_future(self._send(client))
+        try:
+            while True:
+                opcode, payload = await _read_frame(reader)
+                if opcode == OP_CLOSE:
+                    client.send(_frame(payload[:2], OP_CLOSE), self._document)
+                    client.queue.put_nowait(None)
+                    await sender
+                    break
+                if opcode == OP_PING:
+                    client.send(_frame(payload, OP_PONG), self._document)
+        finally:
+            self._clients.discard(client)
+            sender.cancel()
+
+    async def _send(self, client: _Client) -> None:
+        """Writes a client's queued frames as the connection takes them."""
+        try:
+            while True:
+                frame = await client.queue.get()
+                if frame is None:
+                    return
+                client.writer.write(frame)
+                await client.writer.drain()
+        except ConnectionError:
+            client.writer.close()
+
+
+async def _respond(writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes) -> None:
+    """Writes a complete HTTP response."""
+    reasons = {200: 'OK', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed'}
+    writer.write((f'HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: {content_type}\r\n'
+                  f'Content-Length: {len(body)}\r\nCache-Control: no-cache\r\n'
+                  'Connection: close\r\n\r\n').encode() + body)
+    await writer.drain()
+
+
+def _frame(payload, opcode: int = OP_TEXT) -> bytes:
+    """Returns an unmasked WebSocket frame, as servers send them."""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Reads one masked frame from a client; fragments are not expected from a viewer."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > MAX_FRAME_BYTES:
+        raise ValueError('frame too large')
+    mask = await reader.readexactly(4) if second & 0x80 else b'\0\0\0\0'
+    data = await reader.readexactly(length)
+    payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(data))
+    return first & 0x0F, payload
+
+
+def _code_style() -> str:
+    """Returns the CSS of the Pygments classes codehilite puts on code, if Pygments is installed."""
+    try:
+        from pygments.formatters import HtmlFormatter
+    except ImportError:
+        return ''
+    return HtmlFormatter().get_style_defs('.codehilite')
@@ -0,0 +1,54 @@
+from PyQt5.QtWidgets import QDialog, QPlainTextEdit, QPushButton, QVBoxLayout, QWidget
+from PyQt5.QtGui import QFontDatabase
+from PyQt5.QtCore import QTimer
+from typing import Optional
+
+from .profiling import format_summary, is_enabled, reset
+
+# How often the open panel refreshes, in milliseconds
+REFRESH_INTERVAL = 1000
+
+
+class ProfilePanel(QDialog):
+    """Debug panel showing live hot-path timings; opened with Ctrl+Shift+F12."""
+
+    def __init__(self, parent: Optional[QWidget] = None) -> None:
+        super().__init__(parent)
+        self.setWindowTitle('QuickMD Profile')
+        self.resize(720, 360)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.reset_button = QPushButton('Reset')
+        self.reset_button.clicked.connect(self.on_reset)
+        layout = QVBoxLayout()
+        layout.addWidget(self.text)
+        layout.addWidget(self.reset_button)
+        self.setLayout(layout)
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_INTERVAL)
+        self.timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Shows the current timings."""
+        if is_enabled():
+            self.text.setPlainText(format_summary())
+        else:
+            self.text.setPlainText('Profiling is off; start QuickMD with --profile.')
+
+    def on_reset(self) -> None:
+        """Drops the samples recorded so far."""
+        reset()
+        self.refresh()
+
+    def showEvent(self, event) -> None:
+        """Starts refreshing while the panel is visible."""
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event) -> None:
+        """Stops refreshing while the panel is hidden."""
+        self.timer.stop()
+        super().hideEvent(event)
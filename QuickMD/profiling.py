@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Callable, ContextManager, Dict, Iterator, NamedTuple, Optional
+
+# Recent samples kept per metric for the percentiles; counts, totals and
+# maxima cover every sample
+WINDOW = 4096
+
+_NULL = nullcontext()
+
+
+class Summary(NamedTuple):
+    """Latency statistics of one metric, in seconds."""
+
+    count: int
+    total: float
+    p50: float
+    p95: float
+    max: float
+    last: float
+
+
+class Histogram:
+    """Latency samples of one instrumented hot path."""
+
+    def __init__(self, window: int = WINDOW) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self._recent: 'deque[float]' = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        """Records one sample."""
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            if seconds > self.max:
+                self.max = seconds
+            self._recent.append(seconds)
+
+    def summary(self) -> Summary:
+        """Returns the statistics, with percentiles over the recent samples."""
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total, maximum, last = self.count, self.total, self.max, self.last
+        if not recent:
+            return Summary(0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        return Summary(count, total, _percentile(recent, 0.5), _percentile(recent, 0.95),
+                       maximum, last)
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    """Returns the nearest-rank percentile of sorted samples."""
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+_enabled = os.environ.get('QUICKMD_PROFILE', '') not in ('', '0')
+_histograms: Dict[str, Histogram] = {}
+_lock = threading.Lock()
+
+
+def enable(enabled: bool = True) -> None:
+    """Turns instrumentation on or off.
+
+    Functions decorated with profiled() are only wrapped if instrumentation
+    is enabled when their module is imported, so that they cost nothing
+    otherwise; main.py enables it for --profile before importing the GUI.
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    """Returns True if instrumentation is on."""
+    return _enabled
+
+
+def histogram(name: str) -> Histogram:
+    """Returns the histogram of a metric, creating it on first use."""
+    found = _histograms.get(name)
+    if found is None:
+        with _lock:
+            found = _histograms.setdefault(name, Histogram())
+    return found
+
+
+def record(name: str, seconds: float) -> None:
+    """Records a latency sample if instrumentation is on."""
+    if _enabled:
+        histogram(name).add(seconds)
+
+
+@contextmanager
+def _timing(name: str) -> Iterator[None]:
+    """Times the body of a with statement."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram(name).add(time.perf_counter() - started)
+
+
+def span(name: str) -> ContextManager[None]:
+    """Returns a context manager timing its body, or a no-op one when disabled."""
+    return _timing(name) if _enabled else _NULL
+
+
+def profiled(name: str) -> Callable[[Callable], Callable]:
+    """Decorator timing every call of a function, if enabled at import time."""
+    def decorate(function: Callable) -> Callable:
+        if not _enabled:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram(name).add(time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def summaries() -> Dict[str, Summary]:
+    """Returns the statistics of every metric with samples."""
+    with _lock:
+        items = list(_histograms.items())
+    return {name: found.summary() for name, found in sorted(items) if found.count}
+
+
+def reset() -> None:
+    """Drops all samples."""
+    with _lock:
+        _histograms.clear()
+
+
+def format_summary(stats: Optional[Dict[str, Summary]] = None) -> str:
+    """Formats the statistics as a table, in milliseconds."""
+    stats = summaries() if stats is None else stats
+    if not stats:
+        return 'No samples recorded.'
+    width = max(len(name) for name in stats)
+    lines = [f'{"metric":<{width}}  {"count":>8}  {"p50 ms":>9}  {"p95 ms":>9}  {"max ms":>9}  {"total s":>9}']
+    for name, s in stats.items():
+        lines.append(f'{name:<{width}}  {s.count:>8}  {s.p50 * 1000:>9.3f}  {s.p95 * 1000:>9.3f}  '
+                     f'{s.max * 1000:>9.3f}  {s.total:>9.3f}')
+    return '\n'.join(lines)
@@ -0,0 +1,246 @@
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+CACHE_FILE = 'render.sqlite3'
+# Bumped whenever the layout of the database or of the stored values changes
+SCHEMA_VERSION = 1
+DEFAULT_MAX_BYTES = 256 << 20
+# Eviction frees space down to this share of the cap, so it does not run on every write
+EVICTION_TARGET = 0.9
+# Keys per statement, well below SQLite's limit on bound parameters
+QUERY_CHUNK = 500
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS entries (
+        fingerprint TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        used REAL NOT NULL,
+        PRIMARY KEY (fingerprint, key)
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS entries_used ON entries (used)',
+    # The total size is kept up to date by triggers, in the same transaction as each write
+    'CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO totals VALUES (0, 0)',
+    '''CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+       BEGIN UPDATE totals SET size = size + new.size; END''',
+    '''CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+       BEGIN UPDATE totals SET size = size - old.size; END''',
+)
+
+
+def user_cache_dir() -> Path:
+    """Returns the platform's per-user cache directory for QuickMD."""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local'
+        return Path(base) / 'QuickMD' / 'Cache'
+    if sys.platform == 'darwin':
+        return Path.home() / 'Library' / 'Caches' / 'QuickMD'
+    return Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'quickmd'
+
+
+def resolve_cache_dir(setting: str) -> Optional[Path]:
+    """Returns the cache directory for a config value: empty disables, 'auto' is the default."""
+    setting = setting.strip()
+    if not setting:
+        return None
+    if setting.lower() == 'auto':
+        return user_cache_dir()
+    return Path(setting).expanduser()
+
+
+class RenderCache:
+    """Rendered HTML kept on disk across sessions, shared by every QuickMD process.
+
+    Entries are stored in a SQLite database under a fingerprint of the
+    extension setup that rendered them and a hash of their source, so a
+    change of extensions or library versions never serves stale HTML. The
+    total size is capped and the least recently used entries are evicted
+    first. The database runs in WAL mode with a busy timeout, so several
+    windows and batch renders can read and write it at the same time. Any
+    database error disables the cache instead of failing the render.
+    """
+
+    def __init__(self, directory: Union[str, Path], fingerprint: str,
+                 max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path = Path(directory) / CACHE_FILE
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._clock = 0.0
+        self._db: Optional[sqlite3.Connection] = None
+        try:
+            self._db = self._connect()
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f'Render cache {self.path} is unavailable: {e}')
+
+    @property
+    def enabled(self) -> bool:
+        """Returns True while the database is usable."""
+        return self._db is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database, creating or upgrading it as needed."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.path), timeout=10, isolation_level=None,
+                             check_same_thread=False)
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('BEGIN IMMEDIATE')
+            if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                db.execute('DROP TABLE IF EXISTS entries')
+                db.execute('DROP TABLE IF EXISTS totals')
+                db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            for statement in SCHEMA:
+                db.execute(statement)
+            db.execute('COMMIT')
+        except BaseException:
+            db.close()
+            raise
+        return db
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Returns the cached values of those keys that are in the cache."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, str] = {}
+        if not keys or self._db is None:
+            return found
+        with self._lock:
+            # Closed while waiting for the lock, as when the window closes during a render
+            if self._db is None:
+                return found
+            try:
+                for chunk in _chunks(keys):
+                    marks = ','.join('?' * len(chunk))
+                    found.update(self._db.execute(
+                        f'SELECT key, value FROM entries WHERE fingerprint = ? AND key IN ({marks})',
+                        [self.fingerprint, *chunk]
+                    ))
+                if found:
+                    self._touch(list(found))
+            except sqlite3.Error as e:
+                self._fail(e)
+        return found
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached value of key, or None."""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, str]) -> None:
+        """Stores values by key, evicting the least recently used entries if needed."""
+        if not items or self._db is None:
+            return
+        now = self._now()
+        rows = [(self.fingerprint, key, value, len(value), now) for key, value in items.items()]
+        with self._lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute('BEGIN IMMEDIATE')
+                try:
+                    # Values are addressed by their source, so an existing entry is identical
+                    self._db.executemany('INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?)', rows)
+                    self._evict()
+                    self._db.execute('COMMIT')
+                except BaseException:
+                    self._db.execute('ROLLBACK')
+                    raise
+            except sqlite3.Error as e:
+                self._fail(e)
+
+    def put(self, key: str, value: str) -> None:
+        """Stores one value."""
+        self.put_many({key: value})
+
+    def size(self) -> int:
+        """Returns the total size of the cached values, counting characters as bytes."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            if self._db is None:
+                return 0
+            try:
+                return self._db.execute('SELECT size FROM totals').fetchone()[0]
+            except sqlite3.Error as e:
+                self._fail(e)
+                return 0
+
+    def clear(self) -> None:
+        """Deletes every entry, of all fingerprints."""
+        if self._db is None:
+            return
+        with self._lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute('DELETE FROM entries')
+            except sqlite3.Error as e:
+                self._fail(e)
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _touch(self, keys: List[str]) -> None:
+        """Marks entries as used now."""
+        now = self._now()
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            for chunk in _chunks(keys):
+                marks = ','.join('?' * len(chunk))
+                self._db.execute(
+                    f'UPDATE entries SET used = ? WHERE fingerprint = ? AND key IN ({marks})',
+                    [now, self.fingerprint, *chunk]
+                )
+            self._db.execute('COMMIT')
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+
+    def _now(self) -> float:
+        """Returns the current time, strictly increasing so uses within one tick stay ordered."""
+        self._clock = max(time.time(), self._clock + 1e-6)
+        return self._clock
+
+    def _evict(self) -> None:
+        """Deletes the least recently used entries when the cache is over its cap."""
+        total = self._db.execute('SELECT size FROM totals').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * EVICTION_TARGET)
+        # Oldest entries first, up to and including the one that frees enough space
+        self._db.execute(
+            'DELETE FROM entries WHERE (fingerprint, key) IN ('
+            ' SELECT fingerprint, key FROM ('
+            '  SELECT fingerprint, key, size,'
+            '   SUM(size) OVER (ORDER BY used ROWS UNBOUNDED PRECEDING) AS freed'
+            '  FROM entries'
+            ' ) WHERE freed - size < ?'
+            ')', (excess,)
+        )
+
+    def _fail(self, error: sqlite3.Error) -> None:
+        """Logs a database error and disables the cache."""
+        logging.warning(f'Render cache {self.path} disabled: {error}')
+        try:
+            self._db.close()
+        except sqlite3.Error:
+            pass
+        self._db = None
+
+
+def _chunks(keys: List[str]) -> Iterable[List[str]]:
+    """Splits keys into lists of at most QUERY_CHUNK."""
+    for start in range(0, len(keys), QUERY_CHUNK):
+        yield keys[start:start + QUERY_CHUNK]
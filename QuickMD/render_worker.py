@@ -0,0 +1,142 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from typing import Any, Callable, Optional, Tuple
+import logging
+import threading
+
+
+class _RenderSignals(QObject):
+    """Carries render results from the pool thread back to the GUI thread."""
+
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class _RenderJob(QRunnable):
+    """A single render of one text snapshot."""
+
+    def __init__(self, render: Callable[[str], Any], generation: int,
+                 text: str, signals: _RenderSignals) -> None:
+        super().__init__()
+        self.render = render
+        self.generation = generation
+        self.text = text
+        self.signals = signals
+
+    def run(self) -> None:
+        """Renders the snapshot and reports the result."""
+        try:
+            result = self.render(self.text)
+        except Exception as e:
+            logging.exception('Render failed')
+            self.signals.failed.emit(self.generation, str(e))
+        else:
+            self.signals.finished.emit(self.generation, result)
+
+
+class _WarmUpJob(QRunnable):
+    """Loads the render pipeline before the first render needs it."""
+
+    def __init__(self, warm_up: Callable[[], Any], worker: 'WarmUpWorker') -> None:
+        super().__init__()
+        self.warm_up = warm_up
+        self.worker = worker
+
+    def run(self) -> None:
+        """Runs the warm-up and reports its result, or None if it failed."""
+        try:
+            result = self.warm_up()
+        except Exception:
+            logging.exception('Warm-up failed')
+            result = None
+        self.worker.warmed_up.emit(result)
+
+
+class WarmUpWorker(QObject):
+    """Runs the warm-up of the render pipeline off the GUI thread.
+
+    Its owner, rather than any one document's RenderWorker, receives
+    warmed_up, so the result is not lost if that document is closed first.
+    """
+
+    warmed_up = pyqtSignal(object)
+
+    def __init__(self, pool: Optional[QThreadPool] = None,
+                 parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+
+    def start(self, function: Callable[[], Any]) -> None:
+        """Runs function on the pool; warmed_up carries its result."""
+        self.pool.start(_WarmUpJob(function, self))
+
+
+class RenderWorker(QObject):
+    """Renders Markdown snapshots off the GUI thread.
+
+    At most one render is in flight at a time. Snapshots submitted while a
+    render is running replace each other, so only the newest one is rendered
+    next, and results for superseded snapshots are dropped instead of being
+    posted to the viewer.
+    """
+
+    rendered = pyqtSignal(int, object)
+
+    def __init__(self, render: Callable[[str], Any],
+                 pool: Optional[QThreadPool] = None,
+                 parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self.render = render
+        self.pool = pool or QThreadPool.globalInstance()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._pending: Optional[Tuple[int, str]] = None
+        self._busy = False
+        self._signals = _RenderSignals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+
+    @property
+    def generation(self) -> int:
+        """Returns the generation of the most recently submitted snapshot."""
+        return self._generation
+
+    def submit(self, text: str) -> int:
+        """Queues a text snapshot for rendering and returns its generation."""
+        with self._lock:
+            self._generation += 1
+            self._pending = (self._generation, text)
+            generation = self._generation
+        self._start_next()
+        return generation
+
+    def is_idle(self) -> bool:
+        """Returns True when no render is running or waiting."""
+        with self._lock:
+            return not self._busy and self._pending is None
+
+    def _start_next(self) -> None:
+        """Starts rendering the pending snapshot if no render is running."""
+        with self._lock:
+            if self._busy or self._pending is None:
+                return
+            generation, text = self._pending
+            self._pending = None
+            self._busy = True
+        self.pool.start(_RenderJob(self.render, generation, text, self._signals))
+
+    def _on_finished(self, generation: int, result: Any) -> None:
+        """Posts the result if it is still the newest one."""
+        with self._lock:
+            self._busy = False
+            current = generation == self._generation
+        if current:
+            self.rendered.emit(generation, result)
+        else:
+            logging.debug(f'Dropped stale render {generation}')
+        self._start_next()
+
+    def _on_failed(self, generation: int, message: str) -> None:
+        """Releases the worker after a failed render."""
+        with self._lock:
+            self._busy = False
+        self._start_next()
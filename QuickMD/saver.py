@@ -0,0 +1,109 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+import logging
+import threading
+
+from .fileio import atomic_write
+from .profiling import span
+
+
+class _SaveSignals(QObject):
+    """Carries save results from the pool thread back to the GUI thread."""
+
+    saved = pyqtSignal(object, object)
+    failed = pyqtSignal(object, object, str)
+
+
+class _SaveJob(QRunnable):
+    """Writes queued snapshots until the queue is empty."""
+
+    def __init__(self, saver: 'FileSaver') -> None:
+        super().__init__()
+        self.saver = saver
+
+    def run(self) -> None:
+        """Writes the pending snapshots, oldest path first."""
+        while True:
+            job = self.saver._next_job()
+            if job is None:
+                return
+            path, text, tag = job
+            try:
+                with span('file.save'):
+                    atomic_write(path, text)
+            except Exception as e:
+                logging.exception(f'Saving {path} failed')
+                self.saver._signals.failed.emit(path, tag, str(e))
+            else:
+                self.saver._signals.saved.emit(path, tag)
+
+
+class FileSaver(QObject):
+    """Saves text snapshots atomically off the GUI thread.
+
+    Each file is written to a temporary file, flushed to disk and renamed
+    over the target, so a crash never leaves a truncated file. One writer
+    runs at a time; saving a path again while an earlier save of it is
+    queued replaces the queued snapshot, so only the newest text is written.
+    Small snapshots are written right away when nothing is queued.
+    """
+
+    saved = pyqtSignal(Path, object)
+    failed = pyqtSignal(Path, object, str)
+
+    def __init__(self, sync_limit: int = 1 << 20,
+                 pool: Optional[QThreadPool] = None,
+                 parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self.sync_limit = sync_limit
+        self.pool = pool or QThreadPool.globalInstance()
+        self._lock = threading.Lock()
+        self._pending: 'OrderedDict[Path, tuple]' = OrderedDict()
+        self._busy = False
+        self._idle = threading.Event()
+        self._idle.set()
+        self._signals = _SaveSignals()
+        self._signals.saved.connect(self.saved)
+        self._signals.failed.connect(self.failed)
+
+    def save(self, path: Path, text: str, tag: Any = None) -> None:
+        """Saves text to path; tag is passed back with saved or failed."""
+        with self._lock:
+            write_now = not self._busy and len(text) < self.sync_limit
+            if not write_now:
+                self._pending.pop(path, None)
+                self._pending[path] = (text, tag)
+                start = not self._busy
+                self._busy = True
+                self._idle.clear()
+        if write_now:
+            try:
+                with span('file.save'):
+                    atomic_write(path, text)
+            except Exception as e:
+                logging.exception(f'Saving {path} failed')
+                self.failed.emit(path, tag, str(e))
+            else:
+                self.saved.emit(path, tag)
+        elif start:
+            self.pool.start(_SaveJob(self))
+
+    def is_idle(self) -> bool:
+        """Returns True when no save is running or queued."""
+        return self._idle.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until all queued saves are written; returns False on timeout."""
+        return self._idle.wait(timeout)
+
+    def _next_job(self) -> Optional[tuple]:
+        """Takes the oldest queued snapshot, or marks the saver idle."""
+        with self._lock:
+            if not self._pending:
+                self._busy = False
+                self._idle.set()
+                return None
+            path, (text, tag) = self._pending.popitem(last=False)
+            return path, text, tag
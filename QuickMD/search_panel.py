@@ -0,0 +1,258 @@
+from PyQt5.QtWidgets import (QDockWidget, QFileDialog, QHBoxLayout, QLabel, QLineEdit,
+                             QListWidget, QListWidgetItem, QPushButton, QVBoxLayout, QWidget)
+from PyQt5.QtCore import QObject, QRunnable, Qt, QThreadPool, QTimer, pyqtSignal
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+import logging
+import threading
+import time
+
+if TYPE_CHECKING:
+    # SQLite loads with the first workspace searched, not with the window
+    from .workspace_index import IndexStats, SearchHit, WorkspaceIndex
+
+# Quiet time after typing before the query runs, in milliseconds
+SEARCH_DELAY = 150
+RESULT_LIMIT = 200
+
+
+class _IndexSignals(QObject):
+    """Carries indexing progress from the pool thread back to the GUI thread."""
+
+    progress = pyqtSignal(int, int, int)
+    finished = pyqtSignal(int, object)
+
+
+class _IndexJob(QRunnable):
+    """Updates a workspace index on a connection of its own."""
+
+    def __init__(self, path: Path, root: Path, files: Optional[List[Path]], generation: int,
+                 signals: _IndexSignals, cancelled: threading.Event) -> None:
+        super().__init__()
+        self.path = path
+        self.root = root
+        self.files = files
+        self.generation = generation
+        self.signals = signals
+        self.cancelled = cancelled
+
+    def run(self) -> None:
+        """Indexes the changed files under the root, or only the files given."""
+        from .workspace_index import IndexStats, WorkspaceIndex
+        stats = None
+        index = WorkspaceIndex(self.path, self.root)
+        try:
+            if self.files is None:
+                stats = index.update(self.cancelled, self._progress)
+            else:
+                indexed = sum(index.update_file(path) for path in self.files)
+                stats = IndexStats(len(self.files), indexed, 0)
+        except Exception:
+            logging.exception(f'Indexing {self.root} failed')
+        finally:
+            index.close()
+        self.signals.finished.emit(self.generation, stats)
+
+    def _progress(self, done: int, total: int) -> None:
+        self.signals.progress.emit(self.generation, done, total)
+
+
+class SearchPanel(QDockWidget):
+    """Dockable full-text search over the Markdown files of a workspace folder.
+
+    Queries run against the folder's on-disk index as they are typed and
+    list ranked sections with snippets; activating one opens its file at
+    the matching line. The index is brought up to date in the background
+    when the panel is shown or the folder changes, and saved files are
+    indexed again as they are written.
+    """
+
+    hit_activated = pyqtSignal(Path, int)
+
+    def __init__(self, index_dir: str = 'auto', parent: Optional[QWidget] = None) -> None:
+        super().__init__('Search', parent)
+        self.setObjectName('search')
+        self.index_dir = index_dir
+        self.folder_button = QPushButton('Folder...')
+        self.folder_button.clicked.connect(self.choose_folder)
+        self.query = QLineEdit()
+        self.query.setPlaceholderText('Search workspace')
+        self.query.setClearButtonEnabled(True)
+        self.query.textChanged.connect(self.on_query_changed)
+        self.query.returnPressed.connect(self.activate_first)
+        self.status = QLabel()
+        self.results = QListWidget()
+        self.results.setWordWrap(True)
+        self.results.itemActivated.connect(self.on_item_activated)
+        self.results.itemClicked.connect(self.on_item_activated)
+        top = QHBoxLayout()
+        top.addWidget(self.query)
+        top.addWidget(self.folder_button)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(top)
+        layout.addWidget(self.status)
+        layout.addWidget(self.results)
+        widget = QWidget()
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+        self.root: Optional[Path] = None
+        # The connection queries run on; index jobs open their own
+        self.index: Optional['WorkspaceIndex'] = None
+        # One indexing thread, so a long update never holds up rendering on the global pool
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._generation = 0
+        self._jobs = 0
+        self._cancelled = threading.Event()
+        self._signals = _IndexSignals()
+        self._signals.progress.connect(self.on_index_progress)
+        self._signals.finished.connect(self.on_index_finished)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(SEARCH_DELAY)
+        self.timer.timeout.connect(self.search)
+
+    def set_root(self, root: Path) -> None:
+        """Searches another folder, indexing what changed in it since it was last searched."""
+        from .workspace_index import WorkspaceIndex, index_path
+        root = root.resolve()
+        if root == self.root:
+            return
+        self._close_index()
+        self.root = root
+        self.folder_button.setText(root.name or str(root))
+        self.folder_button.setToolTip(str(root))
+        self.results.clear()
+        path = index_path(root, self.index_dir)
+        if path is None:
+            self.status.setText('Workspace search is disabled')
+            return
+        self.index = WorkspaceIndex(path, root)
+        if not self.index.enabled:
+            self.status.setText('The search index could not be opened')
+            return
+        self.update_index()
+
+    def choose_folder(self) -> None:
+        """Asks for the folder to search."""
+        start = str(self.root) if self.root is not None else str(Path.home())
+        folder = QFileDialog.getExistingDirectory(self, 'Search Folder', start)
+        if folder:
+            self.set_root(Path(folder))
+
+    def update_index(self, files: Optional[List[Path]] = None) -> None:
+        """Indexes the changed files under the root, or only the files given, in the background."""
+        if self.index is None or not self.index.enabled:
+            return
+        self._jobs += 1
+        self.pool.start(_IndexJob(self.index.path, self.root, files, self._generation,
+                                  self._signals, self._cancelled))
+
+    def file_saved(self, path: Path) -> None:
+        """Indexes a saved file again if it belongs to the workspace."""
+        if self.index is None:
+            return
+        from .workspace_index import SUFFIXES
+        if not path.name.lower().endswith(SUFFIXES):
+            return
+        path = path.resolve()
+        if self.root in path.parents:
+            self.update_index([path])
+
+    def is_indexing(self) -> bool:
+        """Returns True while index updates are queued or running."""
+        return self._jobs > 0
+
+    def on_index_progress(self, generation: int, done: int, total: int) -> None:
+        """Shows how far an update has got."""
+        if generation == self._generation:
+            self.status.setText(f'Indexing {done + 1} of {total} files...')
+
+    def on_index_finished(self, generation: int, stats: Optional['IndexStats']) -> None:
+        """Runs the query again over the updated index."""
+        if generation != self._generation:
+            return
+        self._jobs -= 1
+        if stats is not None and stats.indexed + stats.removed:
+            logging.info(f'Indexed {stats.indexed} and removed {stats.removed} files under {self.root}')
+        if self.query.text().strip():
+            self.search()
+        elif not self._jobs:
+            self.status.setText('' if stats is None else f'{stats.files} files indexed')
+
+    def on_query_changed(self) -> None:
+        """Runs the query once typing pauses."""
+        self.timer.start()
+
+    def search(self) -> None:
+        """Lists the sections matching the query, best first."""
+        self.timer.stop()
+        self.results.clear()
+        text = self.query.text()
+        if self.index is None or not text.strip():
+            return
+        started = time.perf_counter()
+        hits = self.index.search(text, RESULT_LIMIT)
+        elapsed = (time.perf_counter() - started) * 1000
+        for hit in hits:
+            self.results.addItem(self._item(hit))
+        suffix = ' (indexing...)' if self._jobs else ''
+        self.status.setText(f'{len(hits)} results in {elapsed:.0f} ms{suffix}')
+
+    def activate_first(self) -> None:
+        """Opens the best result."""
+        self.search()
+        if self.results.count():
+            self.on_item_activated(self.results.item(0))
+
+    def focus_query(self) -> None:
+        """Shows the panel and puts the focus in the query field."""
+        self.show()
+        self.raise_()
+        self.query.setFocus()
+        self.query.selectAll()
+
+    def on_item_activated(self, item: QListWidgetItem) -> None:
+        """Reports the file and line of an activated result."""
+        hit = item.data(Qt.UserRole)
+        if hit is not None:
+            self.hit_activated.emit(hit.path, hit.line)
+
+    def shutdown(self) -> None:
+        """Stops indexing and closes the index; called when the window closes."""
+        self._close_index()
+        self.pool.waitForDone()
+
+    def showEvent(self, event) -> None:
+        """Catches up with files changed outside the editor."""
+        if not self._jobs:
+            self.update_index()
+        super().showEvent(event)
+
+    def _item(self, hit: 'SearchHit') -> QListWidgetItem:
+        """Returns the list item of a result: its place and title over its snippet."""
+        from .workspace_index import MATCH_END, MATCH_START
+        try:
+            name = str(hit.path.relative_to(self.root))
+        except ValueError:
+            name = str(hit.path)
+        heading = f'{name}:{hit.line + 1}'
+        if hit.title:
+            heading += f' — {hit.title}'
+        snippet = ' '.join(hit.snippet.replace(MATCH_START, '').replace(MATCH_END, '').split())
+        item = QListWidgetItem(f'{heading}\n{snippet}')
+        item.setData(Qt.UserRole, hit)
+        item.setToolTip(str(hit.path))
+        return item
+
+    def _close_index(self) -> None:
+        """Cancels the jobs of the current root and closes its connection."""
+        self._cancelled.set()
+        self._cancelled = threading.Event()
+        self._generation += 1
+        self._jobs = 0
+        if self.index is not None:
+            self.index.close()
+            self.index = None
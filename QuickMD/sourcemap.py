@@ -0,0 +1,76 @@
+from bisect import bisect_right
+from typing import List, Sequence
+
+from .incremental import RenderedBlock
+
+
+class SourceMap:
+    """Maps source lines to preview text blocks and back, in O(log n).
+
+    Every rendered block contributes two points: its first source line with
+    the number of its first text block in the preview, and its end line with
+    the number just past its last text block. Both coordinates grow along
+    the list, so either one can be searched with bisect, and positions
+    between two points are interpolated linearly. Positions are floats so
+    that scrolling through a long block moves smoothly through the other
+    side.
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[int] = []
+        self.positions: List[int] = []
+        self._blocks: List[RenderedBlock] = []
+        self._spans: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def update(self, blocks: Sequence[RenderedBlock], spans: Sequence[int], leading: int = 0) -> None:
+        """Maps a new render, given the number of text blocks each block spans.
+
+        Points are kept up to the first block that moved or changed its
+        span, so an edit only recomputes the map from where it happened.
+        """
+        old_blocks, old_spans = self._blocks, self._spans
+        keep = 0
+        if self.positions[:1] == [leading]:
+            limit = min(len(old_blocks), len(blocks))
+            while (keep < limit and old_spans[keep] == spans[keep]
+                   and old_blocks[keep].start_line == blocks[keep].start_line
+                   and old_blocks[keep].end_line == blocks[keep].end_line):
+                keep += 1
+        del self.lines[2 * keep:], self.positions[2 * keep:]
+        position = self.positions[-1] if keep else leading
+        for block, span in zip(blocks[keep:], spans[keep:]):
+            self.lines += (block.start_line, block.end_line)
+            self.positions += (position, position + span)
+            position += span
+        self._blocks = list(blocks)
+        self._spans = list(spans)
+
+    def clear(self) -> None:
+        """Forgets the mapped blocks."""
+        self.update([], [])
+
+    def position(self, line: float) -> float:
+        """Returns the preview text block position of a source line."""
+        return _interpolate(self.lines, self.positions, line)
+
+    def line(self, position: float) -> float:
+        """Returns the source line of a preview text block position."""
+        return _interpolate(self.positions, self.lines, position)
+
+
+def _interpolate(keys: List[int], values: List[int], key: float) -> float:
+    """Looks key up in the sorted keys and interpolates between the matching values."""
+    if not keys:
+        return 0.0
+    index = bisect_right(keys, key) - 1
+    if index < 0:
+        return float(values[0])
+    if index >= len(keys) - 1:
+        return float(values[-1])
+    low, high = keys[index], keys[index + 1]
+    if high == low:
+        return float(values[index + 1])
+    return values[index] + (values[index + 1] - values[index]) * (key - low) / (high - low)
@@ -0,0 +1,76 @@
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Iterator, List, NamedTuple, Optional
+
+
+class Phase(NamedTuple):
+    """One step of the startup, with times in seconds since launch."""
+
+    name: str
+    start: float
+    seconds: float
+    imports: List[str]
+
+
+class StartupTrace:
+    """Time spent in each startup phase and the packages each one imported."""
+
+    def __init__(self, started: Optional[float] = None) -> None:
+        self.started = time.perf_counter() if started is None else started
+        self.phases: List[Phase] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Times the body of a with statement as a phase."""
+        loaded = set(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            imports = sorted({module.partition('.')[0] for module in sys.modules.keys() - loaded
+                              if not module.startswith('_')})
+            self.phases.append(Phase(name, start - self.started, seconds, imports))
+
+    def mark(self, name: str) -> None:
+        """Records the moment a milestone is reached."""
+        self.phases.append(Phase(name, time.perf_counter() - self.started, 0.0, []))
+
+    def report(self) -> str:
+        """Formats the phases as a table in order of starting time, in milliseconds."""
+        width = max([len(phase.name) for phase in self.phases] + [5])
+        lines = [f'{"phase":<{width}}  {"at ms":>8}  {"took ms":>8}  imports']
+        for phase in sorted(self.phases, key=lambda phase: phase.start):
+            took = f'{phase.seconds * 1000:>8.1f}' if phase.seconds else f'{"":>8}'
+            lines.append(f'{phase.name:<{width}}  {phase.start * 1000:>8.1f}  {took}  '
+                         f'{", ".join(phase.imports)}'.rstrip())
+        return '\n'.join(lines)
+
+
+_trace: Optional[StartupTrace] = None
+
+
+def start_trace(started: Optional[float] = None) -> StartupTrace:
+    """Starts recording the startup phases; main.py does this for --startup-trace."""
+    global _trace
+    _trace = StartupTrace(started)
+    return _trace
+
+
+def phase(name: str) -> ContextManager[None]:
+    """Returns a context manager timing a startup phase, or a no-op one when not tracing."""
+    return _trace.phase(name) if _trace is not None else nullcontext()
+
+
+def mark(name: str) -> None:
+    """Records a startup milestone when tracing."""
+    if _trace is not None:
+        _trace.mark(name)
+
+
+def finish_trace() -> Optional[str]:
+    """Stops tracing and returns the report, or None when not tracing."""
+    global _trace
+    trace, _trace = _trace, None
+    return trace.report() if trace is not None else None
@@ -0,0 +1,81 @@
+from PyQt5.QtCore import QObject
+from PyQt5.QtGui import QTextCursor, QTextDocument
+from typing import List
+import re
+
+# ATX headings; setext headings and headings inside fenced code are not told apart
+HEADING_RE = re.compile(r'#{1,6}(?:[ \t]|$)')
+# QTextCursor.selectedText() separates blocks with the Unicode paragraph separator
+PARAGRAPH_SEPARATOR = '\u2029'
+
+
+class DocumentStats(QObject):
+    """Word, character, line and heading counts of a document.
+
+    The counts are kept per block and updated from contentsChange, so an
+    edit only recounts the lines it touched instead of the whole document.
+    """
+
+    def __init__(self, document: QTextDocument) -> None:
+        super().__init__(document)
+        self.document = document
+        self.words = 0
+        self.headings = 0
+        self._chars = 0
+        self._words: List[int] = []
+        self._lengths: List[int] = []
+        self._headings: List[bool] = []
+        self.recount()
+        document.contentsChange.connect(self.on_contents_change)
+
+    @property
+    def characters(self) -> int:
+        """Returns the number of characters, counting line breaks."""
+        return self._chars + len(self._lengths) - 1
+
+    @property
+    def lines(self) -> int:
+        """Returns the number of lines."""
+        return len(self._lengths)
+
+    def recount(self) -> None:
+        """Counts the whole document from scratch."""
+        self._words = []
+        self._lengths = []
+        self._headings = []
+        self.words = self._chars = self.headings = 0
+        self._replace(0, 0, self.document.begin(), self.document.lastBlock())
+
+    def on_contents_change(self, position: int, removed: int, added: int) -> None:
+        """Recounts the blocks touched by a change."""
+        document = self.document
+        first = document.findBlock(position)
+        last = document.findBlock(position + added)
+        if not last.isValid():
+            last = document.lastBlock()
+        if not first.isValid():
+            self.recount()
+            return
+        start = first.blockNumber()
+        # Blocks start..old_end of the old document became first..last
+        old_end = last.blockNumber() - (document.blockCount() - len(self._lengths))
+        if old_end < start - 1 or old_end >= len(self._lengths):
+            self.recount()
+            return
+        self._replace(start, old_end + 1, first, last)
+
+    def _replace(self, start: int, end: int, first, last) -> None:
+        """Replaces the counts of old blocks start..end - 1 with blocks first..last."""
+        cursor = QTextCursor(self.document)
+        cursor.setPosition(first.position())
+        cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+        lines = cursor.selectedText().split(PARAGRAPH_SEPARATOR)
+        words = [len(line.split()) for line in lines]
+        lengths = list(map(len, lines))
+        headings = list(map(bool, map(HEADING_RE.match, lines)))
+        self.words += sum(words) - sum(self._words[start:end])
+        self._chars += sum(lengths) - sum(self._lengths[start:end])
+        self.headings += sum(headings) - sum(self._headings[start:end])
+        self._words[start:end] = words
+        self._lengths[start:end] = lengths
+        self._headings[start:end] = headings
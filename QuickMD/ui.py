@@ -1,22 +1,52 @@
 from PyQt5.QtWidgets import (QMainWindow, QTextEdit, QWidget, QVBoxLayout, 
                            QApplication, QMenuBar, QMenu, QAction, QFileDialog,
-                           QColorDialog, QFontDialog, QToolBar, QStatusBar)
-from PyQt5.QtCore import Qt, QSize
-from PyQt5.QtGui import QIcon, QKeySequence
+                           QColorDialog, QFontDialog, QToolBar, QStatusBar,
+                           QProgressBar, QPushButton, QLabel, QShortcut, QTabWidget)
+from PyQt5.QtCore import Qt, QSize, QTimer, QEvent, QUrl, pyqtSignal
+from PyQt5.QtGui import QDesktopServices, QIcon, QKeySequence
+from functools import partial
 from pathlib import Path
-import markdown
-from markdown.extensions.tables import TableExtension
-from markdown.extensions.fenced_code import FencedCodeExtension
-from markdown.extensions.codehilite import CodeHiliteExtension
-from typing import Optional, Dict
+from typing import TYPE_CHECKING, Optional, Dict, List
 import logging
 
 from .config import Config
 from .editor import Editor
 from .viewer import Viewer
+from .render_worker import RenderWorker, WarmUpWorker
+from .converter import DEFAULT_ENGINE, available_engines, get_converter, warm_up
+from .highlight_cache import DEFAULT_CACHE_SIZE, get_highlight_cache
+from .images import DEFAULT_IMAGE_CACHE_SIZE, get_image_cache
+from .incremental import BlockRenderer
+from .loader import FileLoader
+from .saver import FileSaver
+from .journal import EditJournal, JournalLock, find_journals, recover
+from .document_tab import DocumentTab, TabMemory
+from .profiling import histogram, is_enabled, profiled
+from .profile_panel import ProfilePanel
+from .outline_panel import OutlinePanel
+from .find_bar import FindBar
+from .search_panel import SearchPanel
+from . import startup
+
+if TYPE_CHECKING:
+    from .preview_server import PreviewServer
+    from .render_cache import RenderCache
+
+# Memory the previews and highlighting of hidden tabs may keep before the
+# least recently used ones are evicted, in bytes
+DEFAULT_HIDDEN_TAB_BUDGET = 64 << 20
+
+
+def format_size(size: int) -> str:
+    """Formats a size in bytes as megabytes."""
+    return f'{size / (1 << 20):.1f} MB'
+
 
 class MainWindow(QMainWindow):
-    """Main application window."""
+    """Main application window, with one tab per open document."""
+
+    # The render pipeline has been warmed up and the render cache opened
+    renderer_ready = pyqtSignal()
 
     def __init__(self, config: Config) -> None:
         super().__init__()
@@ -26,51 +56,273 @@ class MainWindow(QMainWindow):
     def __init__(self, config: 'Config') -> None:
         super().__init__()
         self.config = config
-        self.current_file: Optional[Path] = None
-        self.init_ui()
-        self.setup_markdown_extensions()
-        self.setup_statusbar()
+        with startup.phase('window.ui'):
+            self.init_ui()
+        with startup.phase('window.renderer'):
+            self.setup_markdown_extensions()
+            self.setup_renderer()
+        with startup.phase('window.io'):
+            self.setup_autosave()
+        with startup.phase('window.statusbar'):
+            self.setup_statusbar()
+        with startup.phase('window.tabs'):
+            self.add_tab()
+            self.tab_widget.currentChanged.connect(self.on_tab_changed)
+            self.update_memory_report()
+        # Markdown, Pygments and the render cache load once the window is up
+        QTimer.singleShot(0, self.start_warm_up)
         
     def init_ui(self) -> None:
         """Initializes the enhanced UI components."""
         self.setWindowTitle('QuickMD')
         self.setMinimumSize(800, 600)
         
-        # Create central widget and layout
-        central_widget = QWidget()
+        # One tab per document, each with its editor and viewer
+        self.tab_widget = QTabWidget()
+        self.tab_widget.setDocumentMode(True)
+        self.tab_widget.setTabsClosable(True)
+        self.tab_widget.setMovable(True)
+        self.tab_widget.tabCloseRequested.connect(self.close_tab)
+
+        # Find and replace in the current document, below the tabs
+        self.find_bar = FindBar()
+        self.find_bar.hide()
         layout = QVBoxLayout()
-        
-        # Initialize editor and viewer
-        self.editor = Editor(self.config.get_editor_config())
-        self.viewer = Viewer(self.config.get_viewer_config())
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(self.tab_widget)
+        layout.addWidget(self.find_bar)
+        central = QWidget()
+        central.setLayout(layout)
+        self.setCentralWidget(central)
+
+        # Headings of the current document, hidden until asked for
+        self.outline_panel = OutlinePanel(self)
+        self.outline_panel.heading_activated.connect(self.go_to_heading)
+        self.addDockWidget(Qt.LeftDockWidgetArea, self.outline_panel)
+        self.outline_panel.hide()
+
+        # Full-text search over a workspace folder
+        editor_config = self.config.get_editor_config()
+        self.search_panel = SearchPanel(editor_config.get('search_index_dir', 'auto'), self)
+        self.search_panel.hit_activated.connect(self.open_search_hit)
+        self.addDockWidget(Qt.LeftDockWidgetArea, self.search_panel)
+        self.search_panel.hide()
+        workspace = editor_config.get('workspace', '').strip()
+        if workspace:
+            self.search_panel.set_root(Path(workspace).expanduser())
+
+        # Live preview for browsers, started from the View menu or with --serve
+        self.preview_server: Optional['PreviewServer'] = None
         
         # Setup UI components
         self.create_menubar()
         self.create_toolbar()
         
-        # Add widgets to layout
-        layout.addWidget(self.editor)
-        layout.addWidget(self.viewer)
-        central_widget.setLayout(layout)
-        self.setCentralWidget(central_widget)
-        
-        # Connect signals
-        self.editor.textChanged.connect(self.update_viewer)
-        self.editor.textChanged.connect(self.update_status)
-        
     def setup_markdown_extensions(self) -> None:
         """Sets up advanced Markdown extensions."""
-        self.markdown_extensions = [
-            TableExtension(),
-            FencedCodeExtension(),
-            CodeHiliteExtension(guess_lang=False),
-            'markdown.extensions.toc',
-            'markdown.extensions.footnotes',
-            'markdown.extensions.attr_list',
-            'markdown.extensions.def_list',
-            'markdown.extensions.abbr',
-            'markdown.extensions.meta'
-        ]
+        engine = self.config.get_renderer_config().get('engine', DEFAULT_ENGINE)
+        if engine not in available_engines():
+            logging.warning(f'Markdown engine {engine} is not available; using {DEFAULT_ENGINE}')
+            engine = DEFAULT_ENGINE
+        self.converter = get_converter(engine)
+        self.converter.set_pool_size(
+            int(self.config.get_viewer_config().get('converter_pool_size', '2'))
+        )
+        get_highlight_cache().max_size = int(
+            self.config.get_viewer_config().get('highlight_cache_size', str(DEFAULT_CACHE_SIZE))
+        )
+        get_image_cache().max_size = int(
+            self.config.get_viewer_config().get('image_cache_size', str(DEFAULT_IMAGE_CACHE_SIZE))
+        )
+        self.markdown_extensions = self.converter.extensions
+
+    def setup_renderer(self) -> None:
+        """Sets up what the tabs' renderers share and the memory budget of hidden tabs."""
+        # Opened by the warm-up: its key needs the Markdown and Pygments versions
+        self.render_cache = None
+        self.hidden_tab_budget = int(self.config.get_editor_config().get(
+            'hidden_tab_budget', str(DEFAULT_HIDDEN_TAB_BUDGET)))
+        self._activations = 0
+        self._closed = False
+
+    def start_warm_up(self) -> None:
+        """Loads the render pipeline on a pool thread, after the window is shown."""
+        startup.mark('event loop')
+        self.warm_up_worker = WarmUpWorker(parent=self)
+        self.warm_up_worker.warmed_up.connect(self.on_warmed_up)
+        self.warm_up_worker.start(self.warm_up_renderer)
+
+    def warm_up_renderer(self) -> Optional['RenderCache']:
+        """Builds a converter and opens the render cache. Runs on a worker thread."""
+        from .render_cache import DEFAULT_MAX_BYTES, RenderCache, resolve_cache_dir
+
+        warm_up(self.converter)
+        viewer_config = self.config.get_viewer_config()
+        cache_dir = resolve_cache_dir(viewer_config.get('render_cache_dir', ''))
+        if cache_dir is None:
+            return None
+        return RenderCache(
+            cache_dir, self.converter.fingerprint,
+            max_bytes=int(viewer_config.get('render_cache_size', str(DEFAULT_MAX_BYTES)))
+        )
+
+    def on_warmed_up(self, render_cache: Optional['RenderCache']) -> None:
+        """Lets the renderer use the render cache opened by the warm-up."""
+        startup.mark('renderer ready')
+        if self._closed:
+            if render_cache is not None:
+                render_cache.close()
+        else:
+            self.render_cache = render_cache
+            for tab in self.tabs():
+                tab.block_renderer.persistent = render_cache
+        self.renderer_ready.emit()
+
+    def setup_autosave(self) -> None:
+        """Sets up background saving and the autosave journal."""
+        editor_config = self.config.get_editor_config()
+        self.saver = FileSaver(parent=self)
+        self.saver.saved.connect(self.on_file_saved)
+        self.saver.failed.connect(self.on_save_failed)
+        journal_dir = editor_config.get('journal_dir', '')
+        self.journal_dir = Path(journal_dir).expanduser() if journal_dir else None
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setInterval(int(float(editor_config.get('autosave_interval', '30')) * 1000))
+        self.autosave_timer.timeout.connect(self.autosave)
+        if self.journal_dir is not None:
+            self.autosave_timer.start()
+
+    @property
+    def current_tab(self) -> DocumentTab:
+        """Returns the tab shown."""
+        return self.tab_widget.currentWidget()
+
+    def tabs(self) -> List[DocumentTab]:
+        """Returns the open tabs in the order they are shown."""
+        return [self.tab_widget.widget(index) for index in range(self.tab_widget.count())]
+
+    # The document of the current tab
+    @property
+    def editor(self) -> Editor:
+        return self.current_tab.editor
+
+    @property
+    def viewer(self) -> Viewer:
+        return self.current_tab.viewer
+
+    @property
+    def current_file(self) -> Optional[Path]:
+        return self.current_tab.current_file
+
+    @current_file.setter
+    def current_file(self, file_path: Optional[Path]) -> None:
+        self.current_tab.set_current_file(file_path)
+
+    @property
+    def loader(self) -> FileLoader:
+        return self.current_tab.loader
+
+    @property
+    def journal(self) -> Optional[EditJournal]:
+        return self.current_tab.journal
+
+    @property
+    def block_renderer(self) -> BlockRenderer:
+        return self.current_tab.block_renderer
+
+    @property
+    def render_worker(self) -> RenderWorker:
+        return self.current_tab.render_worker
+
+    def add_tab(self) -> DocumentTab:
+        """Opens an empty tab and shows it."""
+        tab = DocumentTab(
+            self.config.get_editor_config(), self.config.get_viewer_config(),
+            self.converter, self.saver, self.render_cache, self.journal_dir, parent=self
+        )
+        tab.editor.textChanged.connect(self.update_status)
+        tab.file_changed.connect(partial(self.on_file_changed, tab))
+        tab.loading.connect(partial(self.on_tab_loading, tab))
+        tab.load_progress.connect(partial(self.on_load_progress, tab))
+        tab.load_failed.connect(partial(self.on_load_failed, tab))
+        tab.message.connect(partial(self.show_tab_message, tab))
+        tab.rendered.connect(self.update_render_latency)
+        tab.preview_updated.connect(partial(self.publish_preview, tab))
+        tab.editor.cursorPositionChanged.connect(partial(self.on_cursor_moved, tab))
+        self._activations += 1
+        tab.last_active = self._activations
+        self.tab_widget.setCurrentIndex(self.tab_widget.addTab(tab, tab.title))
+        self.outline_panel.set_outline(tab.editor.outline)
+        self.find_bar.set_editor(tab.editor)
+        return tab
+
+    def close_tab(self, index: int) -> None:
+        """Closes a tab, keeping its unsaved edits in the journal."""
+        tab = self.tab_widget.widget(index)
+        tab.loader.cancel()
+        # Saves of the tab rebase its journal when they finish
+        self.saver.wait()
+        QApplication.sendPostedEvents(self.saver, QEvent.MetaCall)
+        tab.close_journal()
+        self.tab_widget.removeTab(index)
+        tab.deleteLater()
+        if self.tab_widget.count() == 0:
+            self.add_tab()
+
+    def close_current_tab(self) -> None:
+        """Closes the tab shown."""
+        self.close_tab(self.tab_widget.currentIndex())
+
+    def on_tab_changed(self, index: int) -> None:
+        """Rebuilds the shown tab if it was evicted and evicts others over the budget."""
+        tab = self.tab_widget.widget(index)
+        if tab is None:
+            return
+        self._activations += 1
+        tab.last_active = self._activations
+        tab.restore()
+        self.outline_panel.set_outline(tab.editor.outline)
+        self.find_bar.set_editor(tab.editor)
+        self.setWindowTitle(f'QuickMD - {tab.title}')
+        self._show_loading(tab.loader.is_running())
+        self.update_status()
+        self.enforce_memory_budget()
+        self.publish_preview(tab)
+
+    def enforce_memory_budget(self) -> None:
+        """Evicts the least recently shown hidden tabs until the rest fit the budget."""
+        current = self.current_tab
+        hidden = sorted((tab for tab in self.tabs() if tab is not current and not tab.evicted),
+                        key=lambda tab: tab.last_active)
+        usage = {tab: tab.memory_usage().evictable for tab in hidden}
+        total = sum(usage.values())
+        for tab in hidden:
+            if total <= self.hidden_tab_budget:
+                break
+            if tab.can_evict():
+                tab.evict()
+                total -= usage[tab]
+        self.update_memory_report()
+
+    def memory_usage(self) -> Dict[DocumentTab, TabMemory]:
+        """Returns the estimated memory use of every tab."""
+        return {tab: tab.memory_usage() for tab in self.tabs()}
+
+    def update_memory_report(self) -> None:
+        """Shows the memory of each tab in its tooltip and the total in the status bar."""
+        usage = self.memory_usage()
+        for tab, memory in usage.items():
+            lines = [str(tab.current_file) if tab.current_file else tab.title,
+                     f'Text: {format_size(memory.text)}',
+                     f'Highlighting: {format_size(memory.highlighting)}',
+                     f'Preview: {format_size(memory.preview)}',
+                     f'Rendered blocks: {format_size(memory.blocks)}']
+            if tab.evicted:
+                lines.append('Evicted until shown')
+            self.tab_widget.setTabToolTip(self.tab_widget.indexOf(tab), '\n'.join(lines))
+        total = sum(memory.total for memory in usage.values())
+        self.memory_label.setText(f'{len(usage)} tabs, {format_size(total)}')
         
     def create_menubar(self) -> None:
         """Creates the enhanced menu bar with all options."""
@@ -101,6 +353,11 @@ class MainWindow(QMainWindow):
         
         file_menu.addSeparator()
         
+        close_tab_action = QAction('&Close Tab', self)
+        close_tab_action.setShortcut(QKeySequence.Close)
+        close_tab_action.triggered.connect(self.close_current_tab)
+        file_menu.addAction(close_tab_action)
+        
         exit_action = QAction('&Exit', self)
         exit_action.setShortcut(QKeySequence.Quit)
         exit_action.triggered.connect(self.close)
@@ -111,15 +368,65 @@ class MainWindow(QMainWindow):
         
         undo_action = QAction('&Undo', self)
         undo_action.setShortcut(QKeySequence.Undo)
-        undo_action.triggered.connect(self.editor.undo)
+        undo_action.triggered.connect(lambda: self.editor.undo())
         edit_menu.addAction(undo_action)
         
         redo_action = QAction('&Redo', self)
         redo_action.setShortcut(QKeySequence.Redo)
-        redo_action.triggered.connect(self.editor.redo)
+        redo_action.triggered.connect(lambda: self.editor.redo())
         edit_menu.addAction(redo_action)
         
         edit_menu.addSeparator()
+
+        find_action = QAction('&Find...', self)
+        find_action.setShortcut(QKeySequence.Find)
+        find_action.triggered.connect(lambda: self.find_bar.show_find())
+        edit_menu.addAction(find_action)
+
+        replace_action = QAction('R&eplace...', self)
+        replace_action.setShortcut(QKeySequence('Ctrl+H'))
+        replace_action.triggered.connect(lambda: self.find_bar.show_find(replace=True))
+        edit_menu.addAction(replace_action)
+
+        find_next_action = QAction('Find &Next', self)
+        find_next_action.setShortcut(QKeySequence.FindNext)
+        find_next_action.triggered.connect(self.find_bar.find_next)
+        edit_menu.addAction(find_next_action)
+
+        find_previous_action = QAction('Find &Previous', self)
+        find_previous_action.setShortcut(QKeySequence.FindPrevious)
+        find_previous_action.triggered.connect(self.find_bar.find_previous)
+        edit_menu.addAction(find_previous_action)
+
+        search_action = QAction('&Search Workspace...', self)
+        search_action.setShortcut(QKeySequence('Ctrl+Shift+F'))
+        search_action.triggered.connect(self.search_workspace)
+        edit_menu.addAction(search_action)
+
+        edit_menu.addSeparator()
+
+        go_to_heading_action = QAction('Go to &Heading...', self)
+        go_to_heading_action.setShortcut(QKeySequence('Ctrl+Shift+O'))
+        go_to_heading_action.triggered.connect(self.outline_panel.focus_filter)
+        edit_menu.addAction(go_to_heading_action)
+
+        # View Menu
+        view_menu = menubar.addMenu('&View')
+
+        outline_action = self.outline_panel.toggleViewAction()
+        outline_action.setText('&Outline')
+        view_menu.addAction(outline_action)
+
+        search_panel_action = self.search_panel.toggleViewAction()
+        search_panel_action.setText('&Search')
+        view_menu.addAction(search_panel_action)
+
+        view_menu.addSeparator()
+
+        self.serve_action = QAction('Serve Preview in &Browser', self)
+        self.serve_action.setCheckable(True)
+        self.serve_action.triggered.connect(self.toggle_preview_server)
+        view_menu.addAction(self.serve_action)
         
         # Format Menu
         format_menu = menubar.addMenu('F&ormat')
@@ -168,20 +475,38 @@ class MainWindow(QMainWindow):
         self.statusbar = QStatusBar()
         self.setStatusBar(self.statusbar)
         self.statusbar.showMessage('Ready')
-        
+        self.load_progress = QProgressBar()
+        self.load_progress.setMaximumWidth(200)
+        self.load_progress.setRange(0, 1000)
+        self.statusbar.addPermanentWidget(self.load_progress)
+        self.cancel_load_button = QPushButton('Cancel')
+        self.cancel_load_button.clicked.connect(self.cancel_load)
+        self.statusbar.addPermanentWidget(self.cancel_load_button)
+        self.load_progress.hide()
+        self.cancel_load_button.hide()
+        # Live render latency and a hidden panel with all timings, for --profile
+        self.render_latency_label = QLabel()
+        self.statusbar.addPermanentWidget(self.render_latency_label)
+        self.render_latency_label.setVisible(is_enabled())
+        # Estimated memory of all tabs; the tab tooltips break it down
+        self.memory_label = QLabel()
+        self.statusbar.addPermanentWidget(self.memory_label)
+        self.profile_panel: Optional[ProfilePanel] = None
+        QShortcut(QKeySequence('Ctrl+Shift+F12'), self, self.show_profile_panel)
+        
+    @profiled('status.update')
     def update_status(self) -> None:
         """Updates the status bar with current document info."""
-        text = self.editor.toPlainText()
-        words = len(text.split())
-        chars = len(text)
+        stats = self.editor.stats
         filename = self.current_file.name if self.current_file else 'Untitled'
-        self.statusbar.showMessage(f'{filename} - Words: {words}, Characters: {chars}')
+        self.statusbar.showMessage(
+            f'{filename} - Words: {stats.words}, Characters: {stats.characters}, '
+            f'Lines: {stats.lines}, Headings: {stats.headings}'
+        )
         
     def new_file(self) -> None:
-        """Creates a new file."""
-        self.editor.clear()
-        self.current_file = None
-        self.setWindowTitle('QuickMD - Untitled')
+        """Creates a new file in a new tab."""
+        self.add_tab()
         
     def open_file(self) -> None:
         """Opens a Markdown file."""
@@ -189,21 +514,148 @@ class MainWindow(QMainWindow):
             self, 'Open File', '', 'Markdown Files (*.md);;All Files (*)'
         )
         if file_path:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    self.editor.setPlainText(file.read())
-                self.current_file = Path(file_path)
-                self.setWindowTitle(f'QuickMD - {self.current_file.name}')
-                logging.info(f'Opened file: {file_path}')
-            except Exception as e:
-                logging.error(f'Error opening file: {e}')
+            self.load_file(Path(file_path))
+
+    def load_file(self, file_path: Path) -> None:
+        """Opens a file in a tab, or shows the tab it is already open in.
+
+        An empty untitled tab is reused; otherwise the file gets a new tab.
+        """
+        for tab in self.tabs():
+            if tab.current_file is not None and tab.current_file.resolve() == file_path.resolve():
+                self.tab_widget.setCurrentWidget(tab)
+                return
+        tab = self.current_tab if self.current_tab.is_blank() else self.add_tab()
+        tab.load_file(file_path)
+
+    def on_load_progress(self, tab: DocumentTab, read: int, size: int) -> None:
+        """Updates the progress bar of a streaming load."""
+        if tab is self.current_tab:
+            self.load_progress.setValue(read * 1000 // max(size, 1))
+
+    def on_tab_loading(self, tab: DocumentTab, loading: bool) -> None:
+        """Shows the load progress widgets while the current tab streams a file."""
+        if tab is self.current_tab:
+            self._show_loading(loading)
+            if not loading:
+                self.update_status()
+        if not loading:
+            self.update_memory_report()
+
+    def on_load_failed(self, tab: DocumentTab, message: str) -> None:
+        """Reports a file that could not be opened and closes the tab opened for it."""
+        self.statusbar.showMessage(f'Could not open file: {message}')
+        self._discard_blank_tab(tab)
+
+    def cancel_load(self) -> None:
+        """Cancels a streaming load, keeping the current document."""
+        tab = self.current_tab
+        tab.cancel_load()
+        self._discard_blank_tab(tab)
+        self.update_status()
+
+    def _discard_blank_tab(self, tab: DocumentTab) -> None:
+        """Closes a tab left empty by a failed or cancelled load, unless it is the last."""
+        if tab.is_blank() and self.tab_widget.count() > 1:
+            self.close_tab(self.tab_widget.indexOf(tab))
+
+    def _show_loading(self, loading: bool) -> None:
+        """Shows or hides the load progress widgets."""
+        self.load_progress.setVisible(loading)
+        self.cancel_load_button.setVisible(loading)
+
+    def on_file_changed(self, tab: DocumentTab) -> None:
+        """Shows the name of the file a tab edits."""
+        self.tab_widget.setTabText(self.tab_widget.indexOf(tab), tab.title)
+        if tab is self.current_tab:
+            self.setWindowTitle(f'QuickMD - {tab.title}')
+            # A streamed file comes with a new document and outline
+            self.outline_panel.set_outline(tab.editor.outline)
+            self.publish_preview(tab)
+        self.update_memory_report()
+
+    def on_cursor_moved(self, tab: DocumentTab) -> None:
+        """Selects the heading of the section the cursor is in."""
+        if tab is self.current_tab:
+            self.outline_panel.select_line(tab.editor.textCursor().blockNumber())
+
+    def go_to_heading(self, line: int) -> None:
+        """Shows a heading of the current document."""
+        self.current_tab.show_line(line)
+
+    def search_workspace(self) -> None:
+        """Opens the workspace search, searching the current file's folder if none is set."""
+        if self.search_panel.root is None:
+            if self.current_file is not None:
+                self.search_panel.set_root(self.current_file.parent)
+            else:
+                self.search_panel.choose_folder()
+                if self.search_panel.root is None:
+                    return
+        self.search_panel.focus_query()
+
+    def open_search_hit(self, file_path: Path, line: int) -> None:
+        """Opens a file found by the workspace search at the line of the match."""
+        self.load_file(file_path)
+        tab = self.current_tab
+        # A file that failed to open leaves another tab current
+        if tab.loader.is_running() or tab.current_file is not None \
+                and tab.current_file.resolve() == file_path.resolve():
+            tab.show_line(line)
+
+    def start_preview_server(self) -> bool:
+        """Serves the preview of the current tab to browsers; returns False if it cannot."""
+        # asyncio loads with the first preview served, not with the window
+        from .preview_server import DEFAULT_HOST, DEFAULT_PORT, PreviewServer
+        if self.preview_server is None:
+            viewer_config = self.config.get_viewer_config()
+            host = viewer_config.get('preview_server_host', DEFAULT_HOST)
+            port = int(viewer_config.get('preview_server_port', str(DEFAULT_PORT)))
+            self.preview_server = PreviewServer(host, port)
+        try:
+            self.preview_server.start()
+        except OSError as e:
+            logging.error(f'Could not start the preview server: {e}')
+            self.statusbar.showMessage(f'Could not serve the preview: {e}')
+            self.serve_action.setChecked(False)
+            return False
+        self.publish_preview(self.current_tab)
+        self.serve_action.setChecked(True)
+        self.statusbar.showMessage(f'Serving the preview at {self.preview_server.url}')
+        return True
+
+    def stop_preview_server(self) -> None:
+        """Stops serving the preview to browsers."""
+        if self.preview_server is not None:
+            self.preview_server.stop()
+        self.serve_action.setChecked(False)
+
+    def toggle_preview_server(self, checked: bool) -> None:
+        """Starts the preview server and opens it in the browser, or stops it."""
+        if not checked:
+            self.stop_preview_server()
+        elif self.start_preview_server():
+            QDesktopServices.openUrl(QUrl(self.preview_server.url))
+
+    def publish_preview(self, tab: DocumentTab) -> None:
+        """Pushes the preview of the current tab to the browsers watching it."""
+        if self.preview_server is None or not self.preview_server.is_running() \
+                or tab is not self.current_tab:
+            return
+        base = tab.current_file.parent if tab.current_file is not None else None
+        self.preview_server.publish(tab.title, tab.blocks, base)
+
+    def show_tab_message(self, tab: DocumentTab, message: str) -> None:
+        """Shows a message of the current tab in the status bar."""
+        if tab is self.current_tab:
+            self.statusbar.showMessage(message)
                 
     def save_file(self) -> None:
         """Saves the current file."""
         if self.current_file is None:
             self.save_file_as()
         else:
-            self._save_to_file(self.current_file)
+            self.current_tab.save(self.current_file)
             
     def save_file_as(self) -> None:
         """Saves the file with a new name."""
@@ -211,18 +663,60 @@ class MainWindow(QMainWindow):
             self, 'Save File', '', 'Markdown Files (*.md);;All Files (*)'
         )
         if file_path:
-            self.current_file = Path(file_path)
-            self._save_to_file(self.current_file)
-            self.setWindowTitle(f'QuickMD - {self.current_file.name}')
-            
-    def _save_to_file(self, file_path: Path) -> None:
-        """Helper method to save content to file."""
-        try:
-            with open(file_path, 'w', encoding='utf-8') as file:
-                file.write(self.editor.toPlainText())
-            logging.info(f'Saved file: {file_path}')
-        except Exception as e:
-            logging.error(f'Error saving file: {e}')
+            self.current_tab.save(Path(file_path))
+
+    def on_file_saved(self, file_path: Path, tag: tuple) -> None:
+        """Makes the saved text the base of the tab's autosave journal."""
+        logging.info(f'Saved file: {file_path}')
+        tab, generation, mark, text = tag
+        tab.on_file_saved(file_path, generation, mark, text)
+        self.search_panel.file_saved(file_path)
+
+    def on_save_failed(self, file_path: Path, tag: tuple, message: str) -> None:
+        """Reports a failed save; the file on disk is left as it was."""
+        logging.error(f'Error saving file: {message}')
+        self.statusbar.showMessage(f'Could not save {file_path.name}: {message}')
+
+    def autosave(self) -> None:
+        """Writes the edits made since the last autosave to the journals of all tabs."""
+        for tab in self.tabs():
+            tab.autosave()
+
+    def recover_from_journal(self) -> bool:
+        """Reopens the unsaved edits left behind by an earlier session, one tab each.
+
+        Journals still locked by a running editor, this one or another, are left alone.
+        """
+        if self.journal_dir is None:
+            return False
+        open_journals = {tab.journal.path for tab in self.tabs()}
+        recovered = False
+        for path in find_journals(self.journal_dir):
+            if path in open_journals:
+                continue
+            try:
+                lock = JournalLock.acquire(path)
+            except OSError as e:
+                logging.error(f'Cannot lock {path}: {e}')
+                continue
+            if lock is None:
+                logging.info(f'Not recovering {path}: another window is using it')
+                continue
+            if not path.exists():
+                # Discarded by its owner since the directory was listed
+                lock.release(remove=True)
+                continue
+            try:
+                file_path, text = recover(path)
+            except (OSError, ValueError) as e:
+                logging.error(f'Cannot recover {path}: {e}')
+                path.rename(path.with_suffix('.broken'))
+                lock.release(remove=True)
+                continue
+            tab = self.current_tab if self.current_tab.is_blank() else self.add_tab()
+            tab.recover(path, file_path, text, lock)
+            recovered = True
+        return recovered
             
     def change_font(self) -> None:
         """Opens font dialog and changes editor font."""
@@ -263,11 +757,34 @@ class MainWindow(QMainWindow):
         cursor = self.editor.textCursor()
         cursor.insertText('![alt text](image_url)')
         
-    def update_viewer(self) -> None:
-        """Updates the viewer with the latest Markdown content."""
-        markdown_text = self.editor.toPlainText()
-        html = markdown.markdown(
-            markdown_text,
-            extensions=self.markdown_extensions
+    def update_render_latency(self) -> None:
+        """Shows the latest render latency in the status bar."""
+        latency = histogram('render.latency').summary()
+        self.render_latency_label.setText(
+            f'Render: {latency.last * 1000:.0f} ms (p95 {latency.p95 * 1000:.0f} ms)'
         )
-        self.viewer.setHtml(html)
+
+    def show_profile_panel(self) -> None:
+        """Shows the panel with the hot-path timings."""
+        if self.profile_panel is None:
+            self.profile_panel = ProfilePanel(self)
+        self.profile_panel.show()
+        self.profile_panel.raise_()
+
+    def closeEvent(self, event) -> None:
+        """Finishes pending saves and keeps unsaved edits in the journals."""
+        for tab in self.tabs():
+            tab.loader.cancel()
+        self.saver.wait()
+        QApplication.sendPostedEvents(self.saver, QEvent.MetaCall)
+        for tab in self.tabs():
+            tab.close_journal()
+        self._closed = True
+        if self.render_cache is not None:
+            self.render_cache.close()
+        self.search_panel.shutdown()
+        if self.preview_server is not None:
+            self.preview_server.stop()
+        logging.info(f'Code highlight cache: {get_highlight_cache().stats()}')
+        logging.info(f'Image cache: {get_image_cache().stats()}')
+        super().closeEvent(event)
@@ -1,12 +1,92 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+from typing import Optional
 
-def setup_logging(log_file: str = 'logs/app.log') -> None:
-    """Sets up logging configuration."""
-    os.makedirs(os.path.dirname(log_file), exist_ok=True)
-    logging.basicConfig(
-        level=logging.DEBUG,
-        filename=log_file,
-        filemode='a',
-        format='%(asctime)s - %(levelname)s - %(message)s'
-    )
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queues records with the message merged and the traceback kept apart."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(log_file: str = 'logs/app.log', level: str = 'INFO', max_bytes: int = 0,
+                  backup_count: int = 3, when: str = '', json_lines: bool = False) -> None:
+    """Sets up logging configuration.
+
+    Records are put on a queue and written by a listener thread, so logging
+    never blocks the caller on disk. The file is rotated at midnight or
+    another interval if when is set (see TimedRotatingFileHandler), else
+    once it reaches max_bytes, if that is not 0.
+    """
+    global _listener, _queue_handler
+    stop_logging()
+    directory = os.path.dirname(log_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if when:
+        handler: logging.Handler = logging.handlers.TimedRotatingFileHandler(
+            log_file, when=when, backupCount=backup_count, encoding='utf-8')
+    elif max_bytes:
+        handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    else:
+        handler = logging.FileHandler(log_file, encoding='utf-8')
+    handler.setFormatter(JsonFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+    records: 'queue.SimpleQueue[logging.LogRecord]' = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(records)
+    _listener = logging.handlers.QueueListener(records, handler)
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.addHandler(_queue_handler)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Writes the queued records and stops the listener thread started by setup_logging."""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -1,17 +1,81 @@
 from PyQt5.QtWidgets import QTextEdit
-from PyQt5.QtGui import QTextOption
-from PyQt5.QtCore import Qt
-from markdown import markdown
-from typing import Dict
+from PyQt5.QtGui import (QImage, QTextBlock, QTextBlockFormat, QTextCursor, QTextDocument, QTextFormat,
+                         QTextList, QTextOption)
+from PyQt5.QtCore import QPoint, Qt, QTimer, QUrl, pyqtSignal
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import re
+from .converter import get_converter
+from .images import ImageLoader, image_key, placeholder
+from .incremental import RenderedBlock
+from .profiling import profiled
+from .sourcemap import SourceMap
+
+# HTML of a block that Qt always lays out as exactly one text block
+SINGLE_BLOCK_RE = re.compile(r'^<(p|h[1-6])[ >](?:(?!<(?:p|div|ul|ol|pre|table|blockquote|hr|dl)[ >/]).)*</\1>$',
+                             re.DOTALL)
+
+# Paragraph placed around fragments so they are laid out as inside a document
+PADDING = '<p>-</p>'
+
+# Narrowest width, in pixels, images are scaled down to; widths are
+# rounded down to a multiple of IMAGE_WIDTH_STEP so resizing rarely decodes again
+IMAGE_MIN_WIDTH = 320
+IMAGE_WIDTH_STEP = 64
+
+# Sections of a virtual preview start at headings
+HEADING_TAGS = ('<h1', '<h2', '<h3', '<h4', '<h5', '<h6')
+
 
 class Viewer(QTextEdit):
-    """Markdown viewer widget."""
+    """Markdown viewer widget.
+
+    Above a configurable size the preview is virtual: the blocks are grouped
+    into sections starting at headings, and only the sections around the
+    visible part are laid out, within a fixed budget of HTML. Scrolling
+    close to either end of them, or to a source line outside them, moves the
+    window, so the document stays small however large the source is.
+
+    Local images are taken from the shared image cache. Missing ones are
+    shown as a placeholder while they are decoded and scaled down to the
+    preview width on a worker thread.
+    """
+
+    # Source line of a double-clicked position
+    line_activated = pyqtSignal(int)
 
     def __init__(self, config: Dict[str, str]) -> None:
         super().__init__()
         self.config = config
         self.setReadOnly(True)
+        self.full_resets = 0
+        self.patches = 0
+        self._keys: List[str] = []
+        self._spans: List[int] = []
+        self._leading = 0
+        self._span_cache: Dict[str, int] = {}
+        self.source_map = SourceMap()
+        self.virtual = False
+        self._blocks: Sequence[RenderedBlock] = []
+        self._block_lines: List[int] = []
+        self._sections: List[Tuple[int, int]] = []
+        self._section_starts: List[int] = []
+        self._section_sizes: List[int] = []
+        self._window = (0, 0)
+        self._window_line = 0
+        self._moving = False
+        self.base_path: Optional[Path] = None
+        self.image_loader = ImageLoader(parent=self)
+        self.image_loader.loaded.connect(self._on_image_loaded)
+        self._images_added = False
+        self._arrived: Set[str] = set()
+        self._image_timer = QTimer(self)
+        self._image_timer.setSingleShot(True)
+        self._image_timer.setInterval(0)
+        self._image_timer.timeout.connect(self._refresh_images)
         self.apply_config()
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
 
     def apply_config(self) -> None:
         """Applies configuration settings to the viewer."""
@@ -20,8 +84,425 @@ class Viewer(QTextEdit):
             color: {self.config.get('text_color', '#000000')};
         """)
         self.setWordWrapMode(QTextOption.WordWrap)
+        self.patch_limit = float(self.config.get('patch_limit', '0.5'))
+        self.virtual_threshold = int(self.config.get('virtual_threshold', '1048576'))
+        self.virtual_window = int(self.config.get('virtual_window', '65536'))
 
     def render_markdown(self, text: str) -> None:
         """Renders Markdown text to HTML."""
-        html = markdown(text)
+        html = get_converter().convert(text)
         self.setHtml(html)
+
+    @profiled('viewer.set_html')
+    def setHtml(self, html: str) -> None:
+        """Replaces the whole document, forgetting the block layout."""
+        self._leave_virtual()
+        self._drop_images()
+        super().setHtml(html)
+        self._keys = []
+        self._spans = []
+        self.source_map.clear()
+
+    @profiled('viewer.show_blocks')
+    def show_blocks(self, blocks: Sequence[RenderedBlock]) -> None:
+        """Shows rendered blocks, virtually if their HTML exceeds the threshold."""
+        if sum(len(block.html) for block in blocks) < self.virtual_threshold:
+            self._leave_virtual()
+            self._show(blocks)
+            return
+        anchor = self._top_line() if len(self.source_map) else 0.0
+        self.virtual = True
+        self._blocks = blocks
+        self._block_lines = [block.start_line for block in blocks]
+        self._split_sections()
+        # Keep the sections shown, so that an edit patches them in place,
+        # unless the top of the view is no longer among them
+        window = self._window_from(self._section_of_line(self._window_line))
+        if not window[0] <= self._section_of_line(anchor) < window[1]:
+            window = self._window_around(self._section_of_line(anchor))
+        self._show_window(window, anchor)
+
+    def _leave_virtual(self) -> None:
+        """Forgets the blocks of a virtual preview."""
+        if self.virtual:
+            self.virtual = False
+            self._blocks = []
+            self._block_lines = []
+            self._sections = []
+            self._section_starts = []
+            self._section_sizes = []
+            self._window = (0, 0)
+            self._window_line = 0
+
+    def _split_sections(self) -> None:
+        """Groups the blocks into sections that start at headings.
+
+        Sections are also cut at a quarter of the window size, so that a
+        long stretch without headings still fits the window in parts.
+        """
+        limit = max(self.virtual_window // 4, 1)
+        sections: List[Tuple[int, int]] = []
+        sizes: List[int] = []
+        start = size = 0
+        for index, block in enumerate(self._blocks):
+            if index > start and (size >= limit or block.html.startswith(HEADING_TAGS)):
+                sections.append((start, index))
+                sizes.append(size)
+                start, size = index, 0
+            size += len(block.html)
+        if start < len(self._blocks):
+            sections.append((start, len(self._blocks)))
+            sizes.append(size)
+        self._sections = sections
+        self._section_starts = [start for start, _ in sections]
+        self._section_sizes = sizes
+
+    def _section_of_line(self, line: float) -> int:
+        """Returns the section holding the block of a source line."""
+        block = max(bisect_right(self._block_lines, line) - 1, 0)
+        return max(bisect_right(self._section_starts, block) - 1, 0)
+
+    def _top_line(self) -> float:
+        """Returns the source line at the top of the viewport."""
+        return self.source_map.line(self._block_at(self.verticalScrollBar().value()))
+
+    def _block_at(self, y: float) -> int:
+        """Returns the number of the last block starting at or above y, by bisection.
+
+        Hit testing is not used, since it misses in the margins between blocks.
+        """
+        document = self.document()
+        layout = document.documentLayout()
+        low, high = 0, document.blockCount() - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if layout.blockBoundingRect(document.findBlockByNumber(middle)).top() <= y:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _window_around(self, section: int) -> Tuple[int, int]:
+        """Returns the sections around section that fit the window, alternately after and before."""
+        count = len(self._sections)
+        if not count:
+            return (0, 0)
+        first = last = section
+        size = self._section_sizes[section]
+        while size < self.virtual_window and (first > 0 or last < count - 1):
+            if last < count - 1:
+                last += 1
+                size += self._section_sizes[last]
+            if first > 0 and size < self.virtual_window:
+                first -= 1
+                size += self._section_sizes[first]
+        return (first, last + 1)
+
+    def _window_from(self, section: int) -> Tuple[int, int]:
+        """Returns the sections from section on that fit the window."""
+        count = len(self._sections)
+        if not count:
+            return (0, 0)
+        last = section
+        size = self._section_sizes[section]
+        while size < self.virtual_window and last < count - 1:
+            last += 1
+            size += self._section_sizes[last]
+        return (section, last + 1)
+
+    def _show_window(self, window: Tuple[int, int], anchor: Optional[float] = None) -> None:
+        """Lays out the blocks of a range of sections.
+
+        When the range moved and an anchor line is given, the view is
+        scrolled to keep that line at the top.
+        """
+        moved = window != self._window
+        self._window = window
+        start = self._sections[window[0]][0] if window[1] else 0
+        end = self._sections[window[1] - 1][1] if window[1] else 0
+        self._window_line = self._blocks[start].start_line if end else 0
+        self._moving = True
+        try:
+            self._show(self._blocks[start:end])
+            if moved and anchor is not None:
+                self._scroll_to(anchor)
+        finally:
+            self._moving = False
+
+    def _on_scroll(self, value: int) -> None:
+        """Moves the window of a virtual preview when scrolling nears one of its ends."""
+        if not self.virtual or self._moving:
+            return
+        scrollbar = self.verticalScrollBar()
+        margin = scrollbar.pageStep() // 2
+        first, last = self._window
+        if (value <= margin and first > 0) \
+                or (value >= scrollbar.maximum() - margin and last < len(self._sections)):
+            line = self._top_line()
+            window = self._window_around(self._section_of_line(line))
+            if window != self._window:
+                self._show_window(window, line)
+
+    def _show(self, blocks: Sequence[RenderedBlock]) -> None:
+        """Shows rendered blocks, replacing only the ones that changed.
+
+        Blocks shared with the previous update at the start and at the end are
+        kept; the text blocks of the changed ones in between are replaced in
+        place. The document is reset instead when there is nothing to patch
+        or when most of it changed.
+        """
+        keys = [block.key for block in blocks]
+        old = self._keys
+        prefix = 0
+        limit = min(len(old), len(keys))
+        while prefix < limit and old[prefix] == keys[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old[-1 - suffix] == keys[-1 - suffix]:
+            suffix += 1
+        if prefix == len(old) == len(keys):
+            # Blank lines may still have moved the blocks in the source
+            self.source_map.update(blocks, self._spans, self._leading)
+            return
+        # Replace at least one old and one new block so the patch never has
+        # to create or drop a paragraph separator on its own.
+        if prefix + suffix == len(old) or prefix + suffix == len(keys):
+            if suffix:
+                suffix -= 1
+            elif prefix:
+                prefix -= 1
+        changed = len(keys) - prefix - suffix
+        # Whether the document starts with the empty block put in front of
+        # a table can only change with its first block, so that resets
+        leading_changes = prefix == 0 and (self._leading or blocks[0].html.startswith('<table'))
+        if not old or prefix + suffix == 0 or leading_changes \
+                or changed > self.patch_limit * len(keys):
+            self._reset(blocks)
+            return
+
+        scrollbar = self.verticalScrollBar()
+        scroll = scrollbar.value()
+        middle = blocks[prefix:len(blocks) - suffix]
+        spans = [self._span(block) for block in middle]
+        first = self._leading + sum(self._spans[:prefix])
+        count = sum(self._spans[prefix:len(old) - suffix])
+        expected = self.document().blockCount() - count + sum(spans)
+        if not self._replace(first, count, '\n'.join(block.html for block in middle)) \
+                or self.document().blockCount() != expected:
+            self._reset(blocks)
+            return
+        self._keys = keys
+        self._spans[prefix:len(old) - suffix] = spans
+        self.source_map.update(blocks, self._spans, self._leading)
+        self.patches += 1
+        scrollbar.setValue(scroll)
+
+    def _reset(self, blocks: Sequence[RenderedBlock]) -> None:
+        """Replaces the whole document with the given blocks."""
+        scrollbar = self.verticalScrollBar()
+        scroll = scrollbar.value()
+        self._drop_images()
+        super().setHtml('\n'.join(block.html for block in blocks))
+        self._keys = [block.key for block in blocks]
+        self._spans = [self._span(block) for block in blocks]
+        # A document starting with a table gets an extra empty block in front
+        self._leading = self.document().blockCount() - sum(self._spans)
+        if self._leading not in (0, 1):
+            # Unknown layout; the next update resets again rather than patching
+            self._keys = []
+        self.source_map.update(blocks, self._spans, self._leading)
+        self.full_resets += 1
+        scrollbar.setValue(scroll)
+
+    def loadResource(self, resource_type: int, name: QUrl) -> Any:
+        """Returns local images from the image cache, decoding missing ones in the background."""
+        path = self._image_path(name) if resource_type == QTextDocument.ImageResource else None
+        if path is None:
+            return super().loadResource(resource_type, name)
+        key = image_key(path, self._image_width())
+        if key is None:
+            return None
+        image = self.image_loader.cache.get(key)
+        if image is not None:
+            return image
+        self.image_loader.load(name.toString(), path, key)
+        return placeholder()
+
+    def _image_path(self, name: QUrl) -> Optional[Path]:
+        """Returns the file of a local image, relative to the base path, or None."""
+        if name.scheme() not in ('', 'file'):
+            return None
+        path = Path(name.toLocalFile() if name.isLocalFile() else name.path())
+        if not path.is_absolute() and self.base_path is not None:
+            path = self.base_path / path
+        return path
+
+    def _image_width(self) -> int:
+        """Returns the width images are scaled down to."""
+        width = self.viewport().width() - 2 * int(self.document().documentMargin())
+        return max(width // IMAGE_WIDTH_STEP * IMAGE_WIDTH_STEP, IMAGE_MIN_WIDTH)
+
+    def _on_image_loaded(self, name: str, image: QImage) -> None:
+        """Replaces the placeholder of a decoded image."""
+        self.document().addResource(QTextDocument.ImageResource, QUrl(name), image)
+        self._images_added = True
+        self._arrived.add(name)
+        self._image_timer.start()
+
+    def _refresh_images(self) -> None:
+        """Lays out again the images decoded since the last refresh, all in one pass."""
+        names, self._arrived = self._arrived, set()
+        document = self.document()
+        block = document.begin()
+        while block.isValid():
+            fragments = block.begin()
+            while not fragments.atEnd():
+                fragment = fragments.fragment()
+                format = fragment.charFormat()
+                if format.isImageFormat() and format.toImageFormat().name() in names:
+                    document.markContentsDirty(fragment.position(), fragment.length())
+                fragments += 1
+            block = block.next()
+
+    def _drop_images(self) -> None:
+        """Forgets the images added to the document, so changed files are seen on the next reset."""
+        if self._images_added:
+            self.document().clear()
+            self._images_added = False
+
+    def scroll_to_line(self, line: float) -> None:
+        """Scrolls the preview so that the given source line is at the top."""
+        if self.virtual and not self._moving:
+            section = self._section_of_line(line)
+            if not self._window[0] <= section < self._window[1]:
+                self._show_window(self._window_around(section))
+        self._scroll_to(line)
+
+    def _scroll_to(self, line: float) -> None:
+        """Scrolls the laid out blocks so that the given source line is at the top."""
+        position = self.source_map.position(line)
+        number = int(position)
+        block = self.document().findBlockByNumber(number)
+        if not block.isValid():
+            return
+        rect = self.document().documentLayout().blockBoundingRect(block)
+        self.verticalScrollBar().setValue(int(rect.top() + (position - number) * rect.height()))
+
+    def line_at(self, point: QPoint) -> int:
+        """Returns the source line of the preview at a viewport position."""
+        return int(self.source_map.line(self.cursorForPosition(point).blockNumber()))
+
+    def mouseDoubleClickEvent(self, event) -> None:
+        """Reports the source line of the double-clicked position."""
+        super().mouseDoubleClickEvent(event)
+        if len(self.source_map):
+            self.line_activated.emit(self.line_at(event.pos()))
+
+    def _replace(self, first: int, count: int, html: str) -> bool:
+        """Replaces count text blocks starting at block number first with html."""
+        document = self.document()
+        start = document.findBlockByNumber(first)
+        end = document.findBlockByNumber(first + count - 1)
+        if not start.isValid() or not end.isValid():
+            return False
+        scratch = QTextDocument()
+        scratch.setDefaultFont(document.defaultFont())
+        scratch.setHtml(f'{PADDING}\n{html}\n{PADDING}')
+        selection = QTextCursor(scratch)
+        selection.setPosition(scratch.begin().next().position())
+        last = scratch.lastBlock().previous()
+        selection.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+        # Qt merges the edges of an inserted fragment into the blocks around
+        # it, which around rules, quotes and lists can leave old text or
+        # formats behind, so the patch is checked before it is kept
+        around = (_block_state(start.previous()), _block_state(end.next()))
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        cursor.setPosition(start.position())
+        cursor.setPosition(end.position() + end.length() - 1, QTextCursor.KeepAnchor)
+        cursor.insertFragment(selection.selection())
+        self._copy_block_formats(scratch.begin().next(), last,
+                                 document.findBlockByNumber(first))
+        cursor.endEditBlock()
+        block = document.findBlockByNumber(first)
+        if _block_state(block.previous()) != around[0]:
+            return False
+        source = scratch.begin().next()
+        while True:
+            if not block.isValid() or _block_state(block) != _block_state(source):
+                return False
+            if source == last:
+                return _block_state(block.next()) == around[1]
+            source = source.next()
+            block = block.next()
+
+    @staticmethod
+    def _copy_block_formats(source: QTextBlock, last: QTextBlock, block: QTextBlock) -> None:
+        """Makes inserted blocks match the formats and lists of the fragment.
+
+        The first block of an inserted fragment is merged into the block it
+        replaces and keeps that block's format and list, so formats are
+        copied over and list membership is rebuilt from the other blocks.
+        """
+        pairs = []
+        while block.isValid():
+            pairs.append((source, block))
+            if source == last:
+                break
+            source = source.next()
+            block = block.next()
+        lists: Dict[int, QTextList] = {}
+        for source, block in pairs[1:]:
+            if source.textList() is not None and block.textList() is not None:
+                lists.setdefault(source.textList().objectIndex(), block.textList())
+        cursor = QTextCursor(block.document())
+        for source, block in pairs:
+            source_list = source.textList()
+            target = lists.get(source_list.objectIndex()) if source_list is not None else None
+            current = block.textList()
+            if current is not None and (target is None
+                                        or current.objectIndex() != target.objectIndex()):
+                current.remove(block)
+                current = None
+            expected = source.blockFormat()
+            if current is not None:
+                expected.setObjectIndex(current.objectIndex())
+            else:
+                expected.clearProperty(QTextFormat.ObjectIndex)
+            if block.blockFormat() != expected:
+                cursor.setPosition(block.position())
+                cursor.setBlockFormat(expected)
+            if source_list is not None and current is None:
+                if target is None:
+                    cursor.setPosition(block.position())
+                    lists[source_list.objectIndex()] = cursor.createList(source_list.format())
+                else:
+                    target.add(block)
+
+    def _span(self, block: RenderedBlock) -> int:
+        """Returns the number of text blocks Qt creates for a rendered block."""
+        span = self._span_cache.get(block.key)
+        if span is None:
+            if SINGLE_BLOCK_RE.match(block.html):
+                span = 1
+            else:
+                # Measured between two paragraphs, since Qt adds blocks and
+                # drops margins around elements at the edges of a document
+                scratch = QTextDocument()
+                scratch.setHtml(f'{PADDING}\n{block.html}\n{PADDING}')
+                span = scratch.blockCount() - 2
+            if len(self._span_cache) > 8192:
+                self._span_cache.clear()
+            self._span_cache[block.key] = span
+        return span
+
+
+def _block_state(block: QTextBlock) -> Optional[Tuple[str, QTextBlockFormat, Optional[int]]]:
+    """Returns what a patch must keep of a block: its text, format and list style."""
+    if not block.isValid():
+        return None
+    block_format = block.blockFormat()
+    # Which list object a block is in differs between documents; its style does not
+    block_format.clearProperty(QTextFormat.ObjectIndex)
+    text_list = block.textList()
+    return block.text(), block_format, text_list.format().style() if text_list is not None else None
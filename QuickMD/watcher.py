@@ -0,0 +1,204 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple, Union
+
+# Events and flags from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+# wd, mask, cookie and name length, followed by the name
+EVENT = struct.Struct('iIII')
+READ_SIZE = 1 << 16
+
+# Quiet time after a change before changes are reported, so a save that
+# writes several files, or one file in steps, comes as one batch
+SETTLE_DELAY = 0.05
+DEFAULT_POLL_INTERVAL = 0.5
+
+# A set of changed paths, or None when changes were lost and everything must be checked
+Changes = Optional[Set[Path]]
+
+
+class PollingWatcher:
+    """Finds changed files by comparing modification times and sizes at intervals.
+
+    Works everywhere, at the cost of a walk of the tree per interval.
+    """
+
+    kind = 'polling'
+
+    def __init__(self, root: Union[str, Path], exclude: Optional[Path] = None,
+                 interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        self.root = Path(root).resolve()
+        self.exclude = exclude
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def wait(self, timeout: Optional[float] = None) -> Changes:
+        """Blocks until files change or timeout seconds pass; returns the changed paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if changed:
+                return changed
+            remaining = self.interval if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                return set()
+            time.sleep(min(self.interval, remaining))
+
+    def close(self) -> None:
+        """Releases nothing; polling holds no resources."""
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        """Returns the modification time and size of every file under the root."""
+        snapshot = {}
+        for directory, folders, files in os.walk(self.root):
+            if self.exclude is not None:
+                folders[:] = [name for name in folders if Path(directory, name) != self.exclude]
+            for name in files:
+                path = Path(directory, name)
+                try:
+                    status = path.stat()
+                except OSError:
+                    continue
+                snapshot[path] = (status.st_mtime_ns, status.st_size)
+        return snapshot
+
+
+class InotifyWatcher:
+    """Finds changed files from Linux inotify events, without walking the tree.
+
+    Every directory under the root is watched, including ones created
+    later. Files are reported once written and closed, moved or deleted.
+    If the kernel's event queue overflows, or a directory is moved away,
+    wait() returns None so the caller checks everything.
+    """
+
+    kind = 'inotify'
+
+    def __init__(self, root: Union[str, Path], exclude: Optional[Path] = None) -> None:
+        self.root = Path(root).resolve()
+        self.exclude = exclude
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise _errno_error('inotify_init1')
+        self._directories: Dict[int, Path] = {}
+        try:
+            self._watch_tree(self.root)
+        except OSError:
+            self.close()
+            raise
+
+    def wait(self, timeout: Optional[float] = None) -> Changes:
+        """Blocks until files change or timeout seconds pass; returns the changed paths."""
+        changed: Set[Path] = set()
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return changed
+        while True:
+            found = self._read()
+            if found is None:
+                return None
+            changed |= found
+            if not select.select([self._fd], [], [], SETTLE_DELAY)[0]:
+                return changed
+
+    def close(self) -> None:
+        """Stops watching."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _watch_tree(self, top: Path) -> Set[Path]:
+        """Watches a directory and those below it; returns the files already in them."""
+        files = set()
+        for directory, folders, names in os.walk(top):
+            if self.exclude is not None:
+                folders[:] = [name for name in folders if Path(directory, name) != self.exclude]
+            descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if descriptor < 0:
+                # Most likely the limit on watches; polling copes with any tree
+                raise _errno_error(f'inotify_add_watch {directory}')
+            self._directories[descriptor] = Path(directory)
+            files.update(Path(directory, name) for name in names)
+        return files
+
+    def _read(self) -> Changes:
+        """Reads the queued events; returns the paths they name, or None if some were lost."""
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        lost = False
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                lost = True
+                continue
+            if mask & IN_IGNORED:
+                self._directories.pop(descriptor, None)
+                continue
+            directory = self._directories.get(descriptor)
+            if directory is None or not name:
+                continue
+            path = directory / os.fsdecode(name)
+            if not mask & IN_ISDIR:
+                changed.add(path)
+            elif path == self.exclude:
+                continue
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                changed |= self._watch_tree(path)
+            else:
+                # The files of a directory moved away are not known here
+                lost = True
+        return None if lost else changed
+
+
+def open_watcher(root: Union[str, Path], exclude: Optional[Path] = None, polling: bool = False,
+                 interval: float = DEFAULT_POLL_INTERVAL) -> Union[InotifyWatcher, PollingWatcher]:
+    """Watches a tree with inotify where available, falling back to polling."""
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root, exclude)
+        except OSError as e:
+            logging.warning(f'inotify is unavailable ({e}); polling for changes instead')
+    return PollingWatcher(root, exclude, interval)
+
+
+def _load_libc() -> ctypes.CDLL:
+    """Returns the C library with the inotify functions declared."""
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    try:
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except AttributeError as e:
+        raise OSError(f'no inotify in the C library: {e}') from None
+    return libc
+
+
+def _errno_error(call: str) -> OSError:
+    """Returns the OSError for the errno a failed C call left."""
+    number = ctypes.get_errno()
+    return OSError(number, f'{call}: {os.strerror(number)}')
@@ -0,0 +1,342 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from .fileio import read_text
+from .incremental import meta_length
+from .outline import FENCE_RE, parse_heading
+from .render_cache import resolve_cache_dir
+
+# Bumped whenever the layout of the database changes
+SCHEMA_VERSION = 1
+SUFFIXES = ('.md', '.markdown')
+# Sections of a file get rowids id << SECTION_BITS | n, so deleting the
+# sections of one file is a range scan; later sections of a file with more
+# join its last one
+SECTION_BITS = 20
+MAX_SECTIONS = 1 << SECTION_BITS
+HEADING_LINE_RE = re.compile(r'#{1,6}(?:[ \t]|$)')
+# Quoted phrases and bare words of a query
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+WORD_RE = re.compile(r'\w+')
+# Marks around the matched terms of a snippet
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+SNIPPET_TOKENS = 16
+# A title match counts this many times a match in the body
+TITLE_WEIGHT = 10.0
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        mtime INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )''',
+    # Prefix indexes keep the prefix queries of search-as-you-type fast
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS sections USING fts5(
+        title, body, line UNINDEXED, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )''',
+)
+
+
+class SearchHit(NamedTuple):
+    """One section matching a query, with the line of its first match."""
+
+    path: Path
+    line: int
+    title: str
+    # Text around the matches, which are marked by MATCH_START and MATCH_END
+    snippet: str
+    rank: float
+
+
+class IndexStats(NamedTuple):
+    """What an update of the index did."""
+
+    files: int
+    indexed: int
+    removed: int
+
+
+def index_path(root: Union[str, Path], setting: str = 'auto') -> Optional[Path]:
+    """Returns the database of a folder's index under the cache directory set, or None if disabled."""
+    directory = resolve_cache_dir(setting)
+    if directory is None:
+        return None
+    digest = hashlib.sha1(str(Path(root).resolve()).encode('utf-8')).hexdigest()[:16]
+    return directory / 'search' / f'{digest}.sqlite3'
+
+
+def fts_query(text: str) -> str:
+    """Turns what the user typed into an FTS5 query.
+
+    Every word must appear, matching as a prefix so results show up while
+    typing; quoted text must appear as a phrase. Operators are not passed on.
+    """
+    terms = []
+    for phrase, word in QUERY_RE.findall(text):
+        if phrase:
+            words = WORD_RE.findall(phrase)
+            if words:
+                terms.append('"' + ' '.join(words) + '"')
+        else:
+            terms.extend(f'"{part}"*' for part in WORD_RE.findall(word))
+    return ' '.join(terms)
+
+
+def split_sections(text: str) -> List[Tuple[int, str, str]]:
+    """Splits a document at its headings into (line, title, text) sections.
+
+    Headings in fenced code and front matter do not split; the text before
+    the first heading is a section with an empty title.
+    """
+    lines = text.split('\n')
+    sections: List[Tuple[int, str, str]] = []
+    start = 0
+    title = ''
+    fence = None
+    for index in range(meta_length(lines), len(lines)):
+        line = lines[index]
+        if fence is not None:
+            if line.rstrip(' ') == fence:
+                fence = None
+        elif line[:1] in '`~':
+            match = FENCE_RE.match(line)
+            if match:
+                fence = match.group()
+        elif line[:1] == '#' and HEADING_LINE_RE.match(line) and len(sections) < MAX_SECTIONS - 1:
+            if index > start:
+                sections.append((start, title, '\n'.join(lines[start:index])))
+            start = index
+            title = parse_heading(line)[1]
+    sections.append((start, title, '\n'.join(lines[start:])))
+    return sections
+
+
+def markdown_files(root: Path) -> Iterator[Path]:
+    """Yields the Markdown files under root, skipping hidden folders."""
+    for directory, folders, files in os.walk(root):
+        folders[:] = [folder for folder in folders if not folder.startswith('.')]
+        for name in files:
+            if name.lower().endswith(SUFFIXES):
+                yield Path(directory) / name
+
+
+class WorkspaceIndex:
+    """Full-text index of the Markdown files in a folder, kept on disk.
+
+    Files are split into sections at their headings and stored in an SQLite
+    FTS5 table, so a query is answered from the inverted index with ranked
+    results and snippets instead of reading the files. update() re-indexes
+    only the files whose modification time or size changed since they were
+    last indexed. Like the render cache, the database runs in WAL mode, so
+    one connection can search while another updates, and any database error
+    disables the index instead of failing the caller.
+    """
+
+    def __init__(self, path: Union[str, Path], root: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        try:
+            self._db = self._connect()
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f'Search index {self.path} is unavailable: {e}')
+
+    @property
+    def enabled(self) -> bool:
+        """Returns True while the database is usable."""
+        return self._db is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database, creating or upgrading it as needed."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.path), timeout=10, isolation_level=None,
+                             check_same_thread=False)
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('BEGIN IMMEDIATE')
+            if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                db.execute('DROP TABLE IF EXISTS files')
+                db.execute('DROP TABLE IF EXISTS sections')
+                db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            for statement in SCHEMA:
+                db.execute(statement)
+            db.execute('COMMIT')
+        except BaseException:
+            db.close()
+            raise
+        return db
+
+    def update(self, cancelled: Optional[threading.Event] = None,
+               progress: Optional[Callable[[int, int], None]] = None) -> IndexStats:
+        """Brings the index up to date with the files under the root.
+
+        Each changed file is indexed in a transaction of its own, so searches
+        see the files done so far and a cancelled update keeps them.
+        """
+        if self._db is None:
+            return IndexStats(0, 0, 0)
+        found: Dict[str, Tuple[int, int]] = {}
+        for path in markdown_files(self.root):
+            try:
+                status = path.stat()
+            except OSError:
+                continue
+            found[str(path)] = (status.st_mtime_ns, status.st_size)
+        with self._lock:
+            try:
+                known = {path: (mtime, size) for path, mtime, size
+                         in self._db.execute('SELECT path, mtime, size FROM files')}
+            except sqlite3.Error as e:
+                self._fail(e)
+                return IndexStats(len(found), 0, 0)
+        removed = [path for path in known if path not in found]
+        changed = [path for path, stamp in found.items() if known.get(path) != stamp]
+        for path in removed:
+            self._remove(path)
+        indexed = 0
+        for done, path in enumerate(changed):
+            if cancelled is not None and cancelled.is_set() or self._db is None:
+                break
+            if progress is not None:
+                progress(done, len(changed))
+            if self._index(Path(path), found[path]):
+                indexed += 1
+        return IndexStats(len(found), indexed, len(removed))
+
+    def update_file(self, path: Union[str, Path]) -> bool:
+        """Indexes one file again if it changed, or drops it if it is gone; returns True if indexed."""
+        path = Path(path)
+        try:
+            status = path.stat()
+        except OSError:
+            self._remove(str(path))
+            return False
+        return self._index(path, (status.st_mtime_ns, status.st_size))
+
+    def search(self, text: str, limit: int = 100) -> List[SearchHit]:
+        """Returns the sections matching a query, best first."""
+        query = fts_query(text)
+        if not query or self._db is None:
+            return []
+        with self._lock:
+            try:
+                rows = self._db.execute(
+                    'SELECT files.path, sections.line, sections.title, sections.body,'
+                    f' snippet(sections, 1, ?, ?, ?, {SNIPPET_TOKENS}),'
+                    f' bm25(sections, {TITLE_WEIGHT}, 1.0) AS rank'
+                    f' FROM sections JOIN files ON files.id = sections.rowid >> {SECTION_BITS}'
+                    ' WHERE sections MATCH ? ORDER BY rank LIMIT ?',
+                    (MATCH_START, MATCH_END, '…', query, limit)
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                # A query FTS5 cannot parse is no reason to disable the index
+                logging.debug(f'Search for {query!r} failed: {e}')
+                return []
+            except sqlite3.Error as e:
+                self._fail(e)
+                return []
+        words = [word.lower() for word in WORD_RE.findall(text)]
+        return [SearchHit(Path(path), line + _match_offset(body, words), title, snippet, rank)
+                for path, line, title, body, snippet, rank in rows]
+
+    def close(self) -> None:
+        """Closes the database."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _index(self, path: Path, stamp: Tuple[int, int]) -> bool:
+        """Replaces the sections of a file with those of its current text."""
+        try:
+            text = read_text(path)
+        except OSError as e:
+            logging.warning(f'Could not index {path}: {e}')
+            return False
+        sections = split_sections(text)
+        with self._lock:
+            if self._db is None:
+                return False
+            try:
+                self._db.execute('BEGIN IMMEDIATE')
+                try:
+                    file_id = self._file_id(str(path))
+                    self._delete_sections(file_id)
+                    base = file_id << SECTION_BITS
+                    self._db.executemany(
+                        'INSERT INTO sections (rowid, title, body, line) VALUES (?, ?, ?, ?)',
+                        [(base + number, title, body, line)
+                         for number, (line, title, body) in enumerate(sections)]
+                    )
+                    self._db.execute('UPDATE files SET mtime = ?, size = ? WHERE id = ?',
+                                     (*stamp, file_id))
+                    self._db.execute('COMMIT')
+                except BaseException:
+                    self._db.execute('ROLLBACK')
+                    raise
+            except sqlite3.Error as e:
+                self._fail(e)
+                return False
+        return True
+
+    def _remove(self, path: str) -> None:
+        """Drops a file and its sections from the index."""
+        with self._lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute('BEGIN IMMEDIATE')
+                try:
+                    row = self._db.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+                    if row is not None:
+                        self._delete_sections(row[0])
+                        self._db.execute('DELETE FROM files WHERE id = ?', row)
+                    self._db.execute('COMMIT')
+                except BaseException:
+                    self._db.execute('ROLLBACK')
+                    raise
+            except sqlite3.Error as e:
+                self._fail(e)
+
+    def _file_id(self, path: str) -> int:
+        """Returns the id of a file, adding it with a stamp that never matches if it is new."""
+        row = self._db.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self._db.execute('INSERT INTO files (path, mtime, size) VALUES (?, -1, -1)',
+                                (path,)).lastrowid
+
+    def _delete_sections(self, file_id: int) -> None:
+        """Deletes the sections of a file by their range of rowids."""
+        base = file_id << SECTION_BITS
+        self._db.execute('DELETE FROM sections WHERE rowid >= ? AND rowid < ?',
+                         (base, base + MAX_SECTIONS))
+
+    def _fail(self, error: sqlite3.Error) -> None:
+        """Logs a database error and disables the index."""
+        logging.warning(f'Search index {self.path} disabled: {error}')
+        try:
+            self._db.close()
+        except sqlite3.Error:
+            pass
+        self._db = None
+
+
+def _match_offset(body: str, words: List[str]) -> int:
+    """Returns the offset of the first line of a section holding one of the words, or 0."""
+    if not words:
+        return 0
+    for offset, line in enumerate(body.lower().split('\n')):
+        if any(word in line for word in words):
+            return offset
+    return 0
@@ -0,0 +1,161 @@
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.documents import DEFAULT_MIX, generate_document, parse_size, size_label
+from benchmarks.report import compare, format_table, load_metrics, summarize, write_results
+
+DEFAULT_SIZES = '1K,100K,1M'
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parses a document mix such as prose=0.6,code=0.4."""
+    mix = {}
+    for item in text.split(','):
+        kind, _, share = item.partition('=')
+        mix[kind.strip()] = float(share)
+    return mix
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses command-line arguments."""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='QuickMD performance benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Run the benchmarks and write the results as JSON')
+    run.add_argument('--sizes', default=DEFAULT_SIZES,
+                     help=f'Comma-separated document sizes, e.g. 1K,10M,50M (default: {DEFAULT_SIZES})')
+    run.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                     help='Share of each kind of block, e.g. prose=0.5,tables=0.15,code=0.2,lists=0.15')
+    run.add_argument('--repeat', type=int, default=3, help='Runs per document size (default: 3)')
+    run.add_argument('--seed', type=int, default=0, help='Seed of the generated documents')
+    run.add_argument('--output', '-o', type=Path, default=Path('benchmark-results.json'),
+                     help='Where to write the results (default: benchmark-results.json)')
+    run.add_argument('--baseline', type=Path, help='Compare against these results when done')
+    run.add_argument('--threshold', type=float, default=0.2,
+                     help='Allowed slowdown against the baseline (default: 0.2 = 20%%)')
+
+    engines = commands.add_parser('engines',
+                                  help='Compare the output and speed of the Markdown engines')
+    engines.add_argument('--sizes', default='100K,1M',
+                         help='Comma-separated document sizes (default: 100K,1M)')
+    engines.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                         help='Share of each kind of block, e.g. prose=0.5,tables=0.15,code=0.2,lists=0.15')
+    engines.add_argument('--repeat', type=int, default=3, help='Runs per document size (default: 3)')
+    engines.add_argument('--seed', type=int, default=0, help='Seed of the generated documents')
+
+    check = commands.add_parser('compare', help='Compare results against a baseline')
+    check.add_argument('baseline', type=Path)
+    check.add_argument('current', type=Path)
+    check.add_argument('--threshold', type=float, default=0.2,
+                       help='Allowed slowdown against the baseline (default: 0.2 = 20%%)')
+    return parser.parse_args(argv)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Dict]:
+    """Runs the benchmarks for every size and returns the summarized metrics."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from benchmarks.suite import Benchmark
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    metrics: Dict[str, Dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        benchmark = Benchmark(Path(tmp))
+        try:
+            for size in [parse_size(size) for size in args.sizes.split(',')]:
+                label = size_label(size)
+                text = generate_document(size, args.mix, args.seed)
+                samples: Dict[str, List[float]] = {}
+                for _ in range(args.repeat):
+                    for metric, timings in benchmark.run(text).items():
+                        samples.setdefault(metric, []).extend(timings)
+                for metric, timings in samples.items():
+                    metrics[f'{metric}[{label}]'] = summarize(timings)
+                print(f'{label}: done', file=sys.stderr, flush=True)
+        finally:
+            benchmark.close()
+    return metrics
+
+
+def run_engines(args: argparse.Namespace) -> int:
+    """Prints how closely and how fast each installed engine renders; 1 if one regresses."""
+    from benchmarks.engines import (FEATURES, KNOWN_DIFFERENCES, conformance, document_blocks,
+                                    time_engine)
+    from QuickMD.converter import DEFAULT_ENGINE, available_engines
+
+    others = [engine for engine in available_engines() if engine != DEFAULT_ENGINE]
+    if not others:
+        print(f'Only {DEFAULT_ENGINE} is installed; nothing to compare')
+        return 0
+    status = 0
+    for engine in others:
+        print(f'{engine} against {DEFAULT_ENGINE}')
+        for feature, source in FEATURES.items():
+            matched = conformance([source], engine).matched
+            note = 'ok' if matched else 'known difference' if feature in KNOWN_DIFFERENCES else 'DIFFERS'
+            if not matched and feature not in KNOWN_DIFFERENCES:
+                status = 1
+            print(f'  {feature:<20} {note}')
+    metrics: Dict[str, Dict] = {}
+    for size in [parse_size(size) for size in args.sizes.split(',')]:
+        label = size_label(size)
+        text = generate_document(size, args.mix, args.seed)
+        blocks = document_blocks(text)
+        for engine in others:
+            result = conformance(blocks, engine)
+            print(f'{label}: {engine} renders {result.matched}/{result.total} blocks '
+                  f'({result.share:.1%}) like {DEFAULT_ENGINE}')
+        for engine in [DEFAULT_ENGINE] + others:
+            for metric, timings in time_engine(text, engine, args.repeat).items():
+                metrics[f'{metric}[{label},{engine}]'] = summarize(timings)
+    print(format_table(metrics))
+    for key, summary in metrics.items():
+        if DEFAULT_ENGINE in key:
+            continue
+        reference = metrics[key.rsplit(',', 1)[0] + f',{DEFAULT_ENGINE}]']
+        print(f'{key}: {reference["min"] / summary["min"]:.2f}x the speed of {DEFAULT_ENGINE}')
+    return status
+
+
+def report(baseline_path: Path, current: Dict[str, Dict], threshold: float) -> int:
+    """Prints the regressions against a baseline and returns the exit status."""
+    baseline = load_metrics(baseline_path)
+    regressions = compare(baseline, current, threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression.metric}: {regression.baseline * 1000:.2f} ms -> '
+              f'{regression.current * 1000:.2f} ms ({regression.ratio:.2f}x)')
+    if not regressions:
+        print(f'No regressions beyond {threshold:.0%} against {baseline_path}')
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Runs the command given on the command line."""
+    args = parse_args(argv)
+    if args.command == 'engines':
+        return run_engines(args)
+    if args.command == 'compare':
+        current = load_metrics(args.current)
+        print(format_table(current, load_metrics(args.baseline)))
+        return report(args.baseline, current, args.threshold)
+    metrics = run(args)
+    write_results(args.output, metrics, {
+        'sizes': args.sizes, 'mix': args.mix, 'repeat': args.repeat, 'seed': args.seed,
+    })
+    baseline = load_metrics(args.baseline) if args.baseline else None
+    print(format_table(metrics, baseline))
+    print(f'Results written to {args.output}')
+    return report(args.baseline, metrics, args.threshold) if args.baseline else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
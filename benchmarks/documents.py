@@ -0,0 +1,130 @@
+import random
+import re
+from typing import Dict, List, Optional
+
+# Default share of each kind of block, by size
+DEFAULT_MIX: Dict[str, float] = {
+    'prose': 0.5,
+    'tables': 0.15,
+    'code': 0.2,
+    'lists': 0.15,
+}
+
+SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)b?\s*$', re.IGNORECASE)
+SIZE_UNITS = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+    'incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud '
+    'exercitation ullamco laboris nisi aliquip ex ea commodo consequat duis aute irure '
+    'in reprehenderit voluptate velit esse cillum fugiat nulla pariatur excepteur sint'
+).split()
+LANGUAGES = ['python', 'javascript', 'bash', 'json', 'text']
+CODE_LINES = [
+    'def handle(request, *args, **kwargs):',
+    '    result = compute(request.data, limit=42)',
+    '    if result is None:',
+    '        raise ValueError("no result for %s" % request.id)',
+    '    return {"status": "ok", "items": [x * 2 for x in result]}',
+    'const total = items.reduce((sum, item) => sum + item.price, 0);',
+    'for f in *.md; do echo "$f"; done',
+    '    # TODO: cache this lookup',
+]
+
+
+def parse_size(text: str) -> int:
+    """Parses a size such as 1K, 10MB or 512 into bytes."""
+    match = SIZE_RE.match(text)
+    if not match:
+        raise ValueError(f'Invalid size: {text}')
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def size_label(size: int) -> str:
+    """Returns a short label for a size, the inverse of parse_size."""
+    for unit in ('G', 'M', 'K'):
+        factor = SIZE_UNITS[unit.lower()]
+        if size >= factor and size % factor == 0:
+            return f'{size // factor}{unit}'
+    return str(size)
+
+
+def generate_document(size: int, mix: Optional[Dict[str, float]] = None, seed: int = 0) -> str:
+    """Generates a Markdown document of about size characters.
+
+    The document is a sequence of sections, each a heading followed by
+    blocks of prose, tables, fenced code and lists, chosen so that each kind
+    takes about its share of mix. The same size, mix and seed always give
+    the same document.
+    """
+    mix = {kind: share for kind, share in (mix or DEFAULT_MIX).items() if share > 0}
+    unknown = set(mix) - set(BLOCKS)
+    if unknown or not mix:
+        raise ValueError(f'Invalid document mix: {sorted(unknown) or "empty"}')
+    rng = random.Random(seed)
+    kinds = list(mix)
+    total = sum(mix.values())
+    produced = {kind: 0 for kind in kinds}
+    parts: List[str] = []
+    length = 0
+    section = 0
+    while length < size:
+        if section == 0 or rng.random() < 0.08:
+            section += 1
+            block = f'{"#" * rng.randint(1, 3)} Section {section}\n'
+        else:
+            # The kind furthest behind its share goes next
+            kind = min(kinds, key=lambda k: produced[k] / mix[k] * total)
+            block = BLOCKS[kind](rng)
+            produced[kind] += len(block)
+        parts.append(block)
+        length += len(block) + 1
+    return '\n'.join(parts)[:max(size, 0)]
+
+
+def _sentence(rng: random.Random) -> str:
+    """Returns a sentence with some inline markup."""
+    words = rng.choices(WORDS, k=rng.randint(6, 16))
+    index = rng.randrange(len(words))
+    words[index] = rng.choice([f'*{words[index]}*', f'**{words[index]}**', f'`{words[index]}`',
+                               f'[{words[index]}](https://example.com/{words[index]})'])
+    return ' '.join(words).capitalize() + '.'
+
+
+def _prose(rng: random.Random) -> str:
+    """Returns a paragraph."""
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(2, 6))) + '\n'
+
+
+def _table(rng: random.Random) -> str:
+    """Returns a table."""
+    columns = rng.randint(2, 5)
+    rows = [' | '.join(rng.choice(WORDS) for _ in range(columns)) for _ in range(rng.randint(2, 8))]
+    header = ' | '.join(f'Col {i}' for i in range(columns))
+    return '\n'.join([header, ' | '.join(['---'] * columns)] + rows) + '\n'
+
+
+def _code(rng: random.Random) -> str:
+    """Returns a fenced code block."""
+    lines = rng.choices(CODE_LINES, k=rng.randint(3, 20))
+    return f'```{rng.choice(LANGUAGES)}\n' + '\n'.join(lines) + '\n```\n'
+
+
+def _list(rng: random.Random) -> str:
+    """Returns a bullet or numbered list."""
+    ordered = rng.random() < 0.3
+    items = []
+    for i in range(rng.randint(2, 8)):
+        marker = f'{i + 1}.' if ordered else '-'
+        items.append(f'{marker} {_sentence(rng)}')
+        if rng.random() < 0.2:
+            items.append(f'    - {_sentence(rng)}')
+    return '\n'.join(items) + '\n'
+
+
+BLOCKS = {
+    'prose': _prose,
+    'tables': _table,
+    'code': _code,
+    'lists': _list,
+}
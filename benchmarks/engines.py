@@ -0,0 +1,114 @@
+import re
+import time
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from QuickMD.converter import DEFAULT_ENGINE, MarkdownConverter
+from QuickMD.highlight_cache import get_highlight_cache
+from QuickMD.incremental import BlockRenderer, meta_length, split_blocks
+
+# One document per extension feature the engines should render alike
+FEATURES: Dict[str, str] = {
+    'paragraphs': 'Some *emphasis*, **strong** and `code` with a [link](http://example.com "title").\n'
+                  'A second line & an <span>inline tag</span>.',
+    'headings': '# Title\n\n## Second *level*\n\n### Third\n\n## Second *level*',
+    'lists': '- one\n- two\n    - nested\n\n1. first\n2. second',
+    'block quotes': '> quoted\n> text\n>\n> > nested',
+    'tables': '| Name | Value |\n| --- | ---: |\n| a | 1 |\n| b | 2 |',
+    'fenced code': '```python\ndef f(x):\n    return x * 2\n```\n\n```\nplain\n```',
+    'footnotes': 'Text with a note[^a] and another[^b].\n\n[^a]: First note.\n[^b]: Second *note*.',
+    'repeated footnotes': 'Twice[^a] in one block[^a].\n\nAgain[^a], once[^b].\n\n'
+                          '[^a]: First note.\n[^b]: Second note.',
+    'definition lists': 'Term\n:   Definition one\n\nOther term\n:   Definition two',
+    'abbreviations': 'The HTML spec and the W3C.\n\n*[HTML]: Hyper Text Markup Language\n*[W3C]: World Wide Web Consortium',
+    'meta data': 'Title: Document\nAuthor: Someone\n\n# Body',
+    'table of contents': '[TOC]\n\n# One\n\n## Two\n\n# Three',
+    'heading attributes': '# Title {#custom .big}\n\nText',
+    'html blocks': '<div class="note">\n<p>Raw HTML</p>\n</div>\n\nAfter',
+    'horizontal rules': 'Above\n\n---\n\nBelow',
+}
+
+# Features where Python-Markdown departs from CommonMark: it needs four
+# spaces to nest a list and does not start a new list on a new marker type
+KNOWN_DIFFERENCES = {'lists'}
+
+TAG_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)((?:\s+[^\s=>/]+(?:="[^"]*")?)*)\s*/?>')
+ATTRIBUTE_RE = re.compile(r'\s+([^\s=>/]+(?:="[^"]*")?)')
+STYLE_SPACE_RE = re.compile(r'\s*([:;])\s*')
+
+
+class Conformance(NamedTuple):
+    """How many documents an engine renders like the reference engine."""
+
+    matched: int
+    total: int
+    mismatches: List[Tuple[str, str, str]]
+
+    @property
+    def share(self) -> float:
+        return self.matched / self.total if self.total else 1.0
+
+
+def normalize_html(html: str) -> str:
+    """Normalizes HTML so that equivalent markup compares equal.
+
+    Whitespace between tags and in style attributes, the order of
+    attributes and the self-closing slash of void elements do not matter.
+    """
+    html = TAG_RE.sub(lambda m: '<' + m.group(1) + ''.join(
+        ' ' + _normalize_attribute(attribute)
+        for attribute in sorted(ATTRIBUTE_RE.findall(m.group(2)))) + '>', html)
+    html = re.sub(r'>\s+', '>', html.strip())
+    html = re.sub(r'\s+<', '<', html)
+    return re.sub(r'\s+', ' ', html)
+
+
+def _normalize_attribute(attribute: str) -> str:
+    """Drops the optional spaces and final semicolon of a style attribute."""
+    if attribute.startswith('style="'):
+        return 'style="' + STYLE_SPACE_RE.sub(r'\1', attribute[7:-1]).rstrip(';') + '"'
+    return attribute
+
+
+def document_blocks(text: str) -> List[str]:
+    """Returns the top-level blocks of a document, as the block renderer splits it."""
+    lines = text.split('\n')
+    return ['\n'.join(lines[start:end]) for start, end in split_blocks(lines, meta_length(lines))]
+
+
+def conformance(sources: Iterable[str], engine: str, reference: str = DEFAULT_ENGINE) -> Conformance:
+    """Renders each source with both engines and compares the normalized HTML."""
+    expected_converter = MarkdownConverter(engine=reference)
+    actual_converter = MarkdownConverter(engine=engine)
+    matched = total = 0
+    mismatches = []
+    for source in sources:
+        total += 1
+        expected = expected_converter.convert(source)
+        actual = actual_converter.convert(source)
+        if normalize_html(expected) == normalize_html(actual):
+            matched += 1
+        else:
+            mismatches.append((source, expected, actual))
+    return Conformance(matched, total, mismatches)
+
+
+def time_engine(text: str, engine: str, repeat: int = 3) -> Dict[str, List[float]]:
+    """Times a whole-document conversion and a cold block render with an engine.
+
+    The shared code highlight cache is cleared before each run, so that no
+    engine reuses code blocks highlighted for another.
+    """
+    converter = MarkdownConverter(engine=engine)
+    converter.convert('warm-up')
+    samples: Dict[str, List[float]] = {'engine.convert': [], 'engine.blocks': []}
+    for _ in range(repeat):
+        get_highlight_cache().clear()
+        started = time.perf_counter()
+        converter.convert(text)
+        samples['engine.convert'].append(time.perf_counter() - started)
+        renderer = BlockRenderer(converter)
+        get_highlight_cache().clear()
+        started = time.perf_counter()
+        renderer.render(text)
+        samples['engine.blocks'].append(time.perf_counter() - started)
+    return samples
@@ -0,0 +1,93 @@
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Union
+
+# Differences below this many seconds are treated as noise when comparing
+NOISE_FLOOR = 0.002
+
+
+class Regression(NamedTuple):
+    """A metric that got slower than its baseline allows."""
+
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        """Returns current / baseline."""
+        return self.current / self.baseline if self.baseline else float('inf')
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """Returns the statistics kept for the timings of one metric."""
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'max': max(samples),
+        'runs': len(samples),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Returns a description of the machine and libraries the results come from."""
+    info: Dict[str, Any] = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+    for module in ('PyQt5.QtCore', 'markdown', 'pygments'):
+        loaded = sys.modules.get(module)
+        if loaded is not None:
+            info[module.split('.')[0]] = getattr(loaded, 'PYQT_VERSION_STR', None) or \
+                getattr(loaded, '__version__', None)
+    return info
+
+
+def write_results(path: Union[str, Path], metrics: Dict[str, Dict[str, Any]],
+                  settings: Dict[str, Any]) -> None:
+    """Writes benchmark results as JSON."""
+    data = {'environment': environment(), 'settings': settings, 'metrics': metrics}
+    Path(path).write_text(json.dumps(data, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+
+
+def load_metrics(path: Union[str, Path]) -> Dict[str, Dict[str, Any]]:
+    """Reads the metrics of a results file."""
+    return json.loads(Path(path).read_text(encoding='utf-8'))['metrics']
+
+
+def compare(baseline: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]],
+            threshold: float = 0.2, statistic: str = 'min') -> List[Regression]:
+    """Returns the metrics that are more than threshold slower than the baseline.
+
+    Only metrics present in both results are compared, by their fastest run
+    by default, which is the least sensitive to noise from the rest of the
+    machine.
+    """
+    regressions = []
+    for metric in sorted(baseline.keys() & current.keys()):
+        before = baseline[metric][statistic]
+        after = current[metric][statistic]
+        if after > before * (1 + threshold) and after - before > NOISE_FLOOR:
+            regressions.append(Regression(metric, before, after))
+    return regressions
+
+
+def format_table(metrics: Dict[str, Dict[str, Any]],
+                 baseline: Union[Dict[str, Dict[str, Any]], None] = None) -> str:
+    """Formats results as a text table, with the change against a baseline if given."""
+    lines = []
+    width = max((len(metric) for metric in metrics), default=10)
+    for metric in sorted(metrics):
+        entry = metrics[metric]
+        line = f'{metric:<{width}}  {entry["min"] * 1000:10.2f} ms  (median {entry["median"] * 1000:.2f} ms)'
+        if baseline and metric in baseline and baseline[metric]['min']:
+            change = entry['min'] / baseline[metric]['min'] - 1
+            line += f'  {change:+.0%}'
+        lines.append(line)
+    return '\n'.join(lines)
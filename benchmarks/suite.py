@@ -0,0 +1,162 @@
+import configparser
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from PyQt5.QtCore import QEventLoop, QTimer
+from PyQt5.QtGui import QTextCursor, QTextDocument
+from PyQt5.QtWidgets import QApplication, QPlainTextDocumentLayout
+
+from QuickMD.highlight_cache import get_highlight_cache
+from QuickMD.config import Config
+from QuickMD.highlighter import MarkdownHighlighter
+from QuickMD.ui import MainWindow
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CONFIG = ROOT / 'resources' / 'styles.ini'
+# Longest wait for a render, load or save before the run is aborted
+TIMEOUT = 600.0
+
+Samples = Dict[str, List[float]]
+
+
+def wait_for(signal, start: Callable[[], None], timeout: float = TIMEOUT) -> None:
+    """Calls start and processes events until signal is emitted."""
+    loop = QEventLoop()
+    fired = []
+
+    def done(*args) -> None:
+        fired.append(True)
+        loop.quit()
+
+    signal.connect(done)
+    timer = QTimer()
+    timer.setSingleShot(True)
+    timer.timeout.connect(loop.quit)
+    timer.start(int(timeout * 1000))
+    try:
+        start()
+        if not fired:
+            loop.exec_()
+    finally:
+        timer.stop()
+        signal.disconnect(done)
+    if not fired:
+        raise TimeoutError(f'Timed out after {timeout} s')
+
+
+def timed(function: Callable[[], None]) -> float:
+    """Returns the wall-clock time function takes."""
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+class Benchmark:
+    """Times the editor's hot paths on one document in a headless MainWindow.
+
+    The window is built from the default configuration with the render
+    delay, journal and persistent render cache turned off, so every timing
+    covers the work itself rather than debouncing or earlier runs.
+    """
+
+    def __init__(self, directory: Path, config_file: Path = DEFAULT_CONFIG) -> None:
+        self.directory = directory
+        parser = configparser.ConfigParser()
+        parser.read(config_file)
+        parser['Editor']['journal_dir'] = ''
+        parser['Viewer']['render_delay'] = '0'
+        parser['Viewer']['render_cache_dir'] = ''
+        self.config_path = directory / 'benchmark.ini'
+        with open(self.config_path, 'w') as file:
+            parser.write(file)
+        self.window = MainWindow(Config(str(self.config_path)))
+
+    def run(self, text: str) -> Samples:
+        """Runs every benchmark once on text and returns the timings by metric."""
+        window = self.window
+        samples: Samples = {}
+
+        def record(metric: str, seconds: float) -> None:
+            samples.setdefault(metric, []).append(seconds)
+
+        path = self.directory / 'document.md'
+        path.write_text(text, encoding='utf-8')
+        # An open file would only be switched to; closing the last tab leaves a blank one
+        for index in reversed(range(window.tab_widget.count())):
+            window.close_tab(index)
+        self.settle()
+        record('file.open', timed(lambda: self._open(path)))
+        self.settle()
+        tab = window.current_tab
+        editor = tab.editor
+
+        tab.block_renderer.clear()
+        get_highlight_cache().clear()
+        record('render.full', timed(lambda: wait_for(tab.render_worker.rendered,
+                                                     tab.update_viewer)))
+        self.settle()
+
+        cursor = self._middle_cursor(editor.document())
+        record('render.edit', timed(lambda: wait_for(tab.render_worker.rendered,
+                                                     lambda: cursor.insertText(' edit'))))
+        self.settle()
+
+        record('editor.keystroke', timed(lambda: cursor.insertText('x')))
+        record('status.update', timed(window.update_status))
+        record('stats.recount', timed(editor.stats.recount))
+        self.settle()
+
+        save_path = self.directory / 'saved.md'
+        record('file.save', timed(lambda: self._save(save_path)))
+
+        document = QTextDocument()
+        document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        document.setPlainText(text)
+        highlighter = MarkdownHighlighter(document)
+        record('highlight.full', timed(highlighter.rehighlight))
+        cursor = self._middle_cursor(document)
+        record('highlight.edit', timed(lambda: cursor.insertText('`')))
+        highlighter.setDocument(None)
+        return samples
+
+    def settle(self, timeout: float = TIMEOUT) -> None:
+        """Processes events until no render or background highlighting is pending."""
+        tab = self.window.current_tab
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            QApplication.processEvents()
+            if (tab.render_worker.is_idle() and not tab.render_timer.isActive()
+                    and not tab.editor.lazy_timer.isActive() and not tab.loader.is_running()):
+                QApplication.processEvents()
+                return
+            time.sleep(0.001)
+        raise TimeoutError(f'Editor did not settle within {timeout} s')
+
+    def close(self) -> None:
+        """Closes the window."""
+        self.settle()
+        self.window.close()
+
+    def _open(self, path: Path) -> None:
+        """Opens a file and waits until it is shown in the editor."""
+        window = self.window
+        tab = window.current_tab
+        if path.stat().st_size >= tab.stream_threshold:
+            wait_for(tab.loader.loaded, lambda: window.load_file(path))
+        else:
+            window.load_file(path)
+
+    def _save(self, path: Path) -> None:
+        """Saves the document and waits until it is on disk."""
+        self.window.current_tab.save(path)
+        self.window.saver.wait(TIMEOUT)
+        QApplication.processEvents()
+
+    @staticmethod
+    def _middle_cursor(document: QTextDocument) -> QTextCursor:
+        """Returns a cursor at the end of the block in the middle of document."""
+        block = document.findBlockByNumber(document.blockCount() // 2)
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.EndOfBlock)
+        return cursor
@@ -1,12 +1,17 @@
 import sys
+import time
 import logging
-from QuickMD.ui import MainWindow
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
 from QuickMD.config import Config
 from QuickMD.utils import setup_logging
-from PyQt5.QtWidgets import QApplication
+import configparser
 import argparse
 
-def parse_args() -> argparse.Namespace:
+# Launch time, for --startup-trace
+STARTED = time.perf_counter()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     """Parses command-line arguments."""
     parser = argparse.ArgumentParser(description='Markdown Editor and Viewer')
     parser.add_argument(
@@ -15,18 +20,264 @@ def parse_args() -> argparse.Namespace:
         default='resources/styles.ini',
         help='Path to the configuration file'
     )
-    return parser.parse_args()
+    parser.add_argument(
+        '--log-level',
+        type=str.upper,
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+        default=None,
+        help='Log level, overriding the config file'
+    )
+    parser.add_argument(
+        '--log-json',
+        action='store_true',
+        help='Write the log as JSON lines'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Time the hot paths and print a latency summary on exit'
+    )
+    parser.add_argument(
+        '--startup-trace',
+        action='store_true',
+        help='Print the time taken by each startup phase once the editor is ready'
+    )
+    parser.add_argument(
+        '--profile-output',
+        type=str,
+        default=None,
+        help='With --profile, also write cProfile statistics to this file'
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='Serve the live preview to browsers at the address set in the config file'
+    )
+    commands = parser.add_subparsers(dest='command')
+    render = commands.add_parser(
+        'render',
+        help='Render a directory of Markdown files to HTML without starting the GUI'
+    )
+    add_render_options(render)
+    watch = commands.add_parser(
+        'watch',
+        help='Render a directory of Markdown files to HTML, then re-render files as they change'
+    )
+    add_render_options(watch)
+    watch.add_argument(
+        '--poll',
+        action='store_true',
+        help='Poll for changes instead of using inotify'
+    )
+    watch.add_argument(
+        '--interval',
+        type=float,
+        default=0.5,
+        help='Seconds between polls (default: 0.5)'
+    )
+    return parser.parse_args(argv)
 
-def main() -> None:
-    """Main entry point of the application."""
-    setup_logging()
-    args = parse_args()
+def add_render_options(command: argparse.ArgumentParser) -> None:
+    """Adds the arguments shared by the render and watch commands."""
+    command.add_argument('src', type=Path, help='Directory to read .md files from')
+    command.add_argument('out', type=Path, help='Directory to write .html files to')
+    command.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=None,
+        help='Number of worker processes (default: number of CPUs)'
+    )
+    command.add_argument(
+        '--cache-dir',
+        type=str,
+        default='auto',
+        help="Render cache directory shared with the editor ('auto': the user cache directory)"
+    )
+    command.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not use the render cache'
+    )
+    command.add_argument(
+        '--engine',
+        type=str,
+        default=None,
+        help="Markdown engine, 'python-markdown' or 'markdown-it' (default: from the config file)"
+    )
+    command.add_argument(
+        '--quiet', '-q',
+        action='store_true',
+        help='Only print the summary'
+    )
+
+def load_settings(args: argparse.Namespace, section: str) -> Dict[str, str]:
+    """Returns a section of the config file, empty if the file cannot be read."""
+    try:
+        config = Config(config_file=args.config)
+    except (FileNotFoundError, configparser.Error):
+        return {}
+    return dict(config.parser.items(section)) if config.parser.has_section(section) else {}
+
+def start_logging(args: argparse.Namespace) -> None:
+    """Starts logging with the config file settings, overridden on the command line."""
+    settings = load_settings(args, 'Logging')
+    setup_logging(
+        log_file=settings.get('file', 'logs/app.log'),
+        level=args.log_level or settings.get('level', 'INFO'),
+        max_bytes=int(settings.get('max_bytes', '1048576')),
+        backup_count=int(settings.get('backup_count', '3')),
+        when=settings.get('rotate_when', ''),
+        json_lines=args.log_json or settings.get('json', 'false').lower() == 'true'
+    )
+
+def render_engine(args: argparse.Namespace) -> Optional[str]:
+    """Returns the engine for the render and watch commands, or None after reporting why not."""
+    from QuickMD.converter import DEFAULT_ENGINE, ENGINES, available_engines
+
+    if not args.src.is_dir():
+        print(f'{args.src} is not a directory', file=sys.stderr)
+        return None
+    engine = args.engine or load_settings(args, 'Renderer').get('engine', DEFAULT_ENGINE)
+    if engine not in ENGINES:
+        print(f'Unknown Markdown engine {engine}; choose one of {", ".join(ENGINES)}', file=sys.stderr)
+        return None
+    if engine not in available_engines():
+        print(f'Markdown engine {engine} is not installed', file=sys.stderr)
+        return None
+    return engine
+
+def result_reporter(args: argparse.Namespace) -> Callable[[Any], None]:
+    """Returns the callback printing the outcome of each rendered file."""
+    def report(result) -> None:
+        if result.status == 'failed':
+            print(f'failed    {result.source}: {result.error}', file=sys.stderr)
+        elif not args.quiet:
+            print(f'{result.status:<9} {result.source}', flush=True)
+    return report
+
+def print_summary(summary) -> None:
+    """Prints the totals of a batch render."""
+    print(
+        f'{summary.rendered} rendered, {summary.skipped} skipped, {summary.failed} failed '
+        f'in {summary.seconds:.2f}s ({summary.files_per_second:.1f} files/s, '
+        f'{summary.megabytes_per_second:.2f} MB/s)', flush=True
+    )
+
+def run_render(args: argparse.Namespace) -> int:
+    """Renders a directory headlessly and returns the exit status."""
+    # Imported here so the headless path never loads PyQt5
+    from QuickMD.batch import render_tree
+    from QuickMD.render_cache import resolve_cache_dir
+
+    engine = render_engine(args)
+    if engine is None:
+        return 2
+    cache_dir = None if args.no_cache else resolve_cache_dir(args.cache_dir)
+    summary = render_tree(args.src, args.out, jobs=args.jobs, on_result=result_reporter(args),
+                          cache_dir=cache_dir, engine=engine)
+    print_summary(summary)
+    return 1 if summary.failed else 0
+
+def run_watch(args: argparse.Namespace) -> int:
+    """Renders a directory, then keeps its output up to date until interrupted."""
+    from QuickMD.batch import WatchSession
+    from QuickMD.render_cache import resolve_cache_dir
+    from QuickMD.watcher import open_watcher
+
+    engine = render_engine(args)
+    if engine is None:
+        return 2
+    cache_dir = None if args.no_cache else resolve_cache_dir(args.cache_dir)
+    session = WatchSession(args.src, args.out, on_result=result_reporter(args),
+                           cache_dir=cache_dir, engine=engine)
+    # Watching starts first, so files saved during the first build are not missed
+    watcher = open_watcher(session.src_dir, exclude=session.out_dir, polling=args.poll,
+                           interval=args.interval)
     try:
+        print_summary(session.build(jobs=args.jobs))
+        print(f'Watching {args.src} ({watcher.kind}); press Ctrl+C to stop', flush=True)
+
+        def report(summary) -> None:
+            print(f'{summary.rendered} rendered, {summary.failed} failed '
+                  f'in {summary.seconds * 1000:.0f} ms', flush=True)
+
+        session.run(watcher, on_rebuild=report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        session.close()
+    return 0
+
+def run_gui(args: argparse.Namespace) -> int:
+    """Starts the editor and returns its exit status."""
+    from QuickMD import startup
+    with startup.phase('import Qt'):
+        from PyQt5.QtWidgets import QApplication
+        from PyQt5.QtCore import QTimer
+    with startup.phase('application'):
         app = QApplication(sys.argv)
+    with startup.phase('import ui'):
+        from QuickMD.ui import MainWindow
+    with startup.phase('config'):
         config = Config(config_file=args.config)
+    with startup.phase('window'):
         window = MainWindow(config)
+    with startup.phase('show'):
         window.show()
-        sys.exit(app.exec_())
+        window.recover_from_journal()
+    if args.serve:
+        window.start_preview_server()
+    if args.startup_trace:
+        def report() -> None:
+            trace = startup.finish_trace()
+            if trace is not None:
+                print(trace, file=sys.stderr, flush=True)
+        # Queued behind the paint events of the first show
+        QTimer.singleShot(0, lambda: startup.mark('first paint'))
+        window.renderer_ready.connect(report)
+    return app.exec_()
+
+def run(args: argparse.Namespace) -> int:
+    """Runs the command given on the command line."""
+    if args.command == 'render':
+        return run_render(args)
+    if args.command == 'watch':
+        return run_watch(args)
+    return run_gui(args)
+
+def run_profiled(args: argparse.Namespace) -> int:
+    """Runs the command with hot-path timing and prints the timings on exit."""
+    # Enabled before the instrumented modules are imported, so they get wrapped
+    from QuickMD import profiling
+    profiling.enable()
+    profiler = None
+    if args.profile_output:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return run(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile_output)
+            logging.info(f'Wrote profile to {args.profile_output}')
+        summary = profiling.format_summary()
+        logging.info(f'Profile summary:\n{summary}')
+        print(summary, file=sys.stderr)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Main entry point of the application."""
+    args = parse_args(argv)
+    start_logging(args)
+    if args.startup_trace:
+        from QuickMD import startup
+        startup.start_trace(STARTED)
+    try:
+        if args.profile or args.profile_output:
+            sys.exit(run_profiled(args))
+        sys.exit(run(args))
     except Exception as e:
         logging.exception("An unexpected error occurred:")
         sys.exit(1)
@@ -0,0 +1,148 @@
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from QuickMD import batch
+from QuickMD.batch import MANIFEST_NAME, WatchSession, render_tree
+from QuickMD.watcher import PollingWatcher, open_watcher
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class TestBatchRender(unittest.TestCase):
+    """Test cases for the headless batch renderer."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = Path(self.tmp.name) / 'src'
+        self.out = Path(self.tmp.name) / 'out'
+        (self.src / 'guide').mkdir(parents=True)
+        for i in range(40):
+            (self.src / 'guide' / f'page{i}.md').write_text(f'# Page {i}\n\nText *{i}*\n')
+        (self.src / 'index.md').write_text('# Index\n\n```python\nprint(1)\n```\n')
+        (self.src / 'notes.txt').write_text('not markdown')
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.tmp.cleanup()
+
+    def test_render_and_skip_unchanged(self):
+        """Test that a second run only renders the files that changed."""
+        results = []
+        summary = render_tree(self.src, self.out, jobs=2, on_result=results.append)
+        self.assertEqual((summary.rendered, summary.skipped, summary.failed), (41, 0, 0))
+        self.assertEqual(len(results), 41)
+        page = (self.out / 'guide' / 'page3.html').read_text()
+        self.assertIn('<h1 id="page-3">Page 3</h1>', page)
+        self.assertIn('<em>3</em>', page)
+        self.assertIn('codehilite', (self.out / 'index.html').read_text())
+        self.assertFalse((self.out / 'notes.html').exists())
+
+        (self.src / 'guide' / 'page7.md').write_text('# Changed\n')
+        summary = render_tree(self.src, self.out, jobs=1)
+        self.assertEqual((summary.rendered, summary.skipped), (1, 40))
+        self.assertIn('Changed', (self.out / 'guide' / 'page7.html').read_text())
+
+        summary = render_tree(self.src, self.out, jobs=1, extensions=['extra'])
+        self.assertEqual((summary.rendered, summary.skipped), (41, 0))
+        manifest = json.loads((self.out / MANIFEST_NAME).read_text())
+        self.assertEqual(len(manifest['files']), 41)
+
+    def test_cli_does_not_import_qt(self):
+        """Test that the render command runs without loading PyQt5."""
+        code = (
+            'import sys, main\n'
+            'try:\n'
+            f'    main.main(["render", {str(self.src)!r}, {str(self.out)!r}, "-j", "2", "-q", "--no-cache"])\n'
+            'except SystemExit as e:\n'
+            '    assert e.code == 0, e.code\n'
+            'assert not any(name.startswith("PyQt5") for name in sys.modules)\n'
+        )
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                                capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('41 rendered', result.stdout)
+        self.assertIn('files/s', result.stdout)
+
+    def test_snippets_are_expanded_and_tracked(self):
+        """Test that pages with snippets render again when a snippet changes."""
+        (self.src / 'shared.md').write_text('*[HTML]: Hyper Text\n\n[^note]: A note.\n')
+        (self.src / 'guide' / 'page1.md').write_text('# HTML\n\nSee[^note].\n\n--8<-- "../shared.md"\n')
+        results = []
+        summary = render_tree(self.src, self.out, jobs=1, on_result=results.append)
+        self.assertEqual(summary.rendered, 42)
+        page = (self.out / 'guide' / 'page1.html').read_text()
+        self.assertIn('<abbr title="Hyper Text">HTML</abbr>', page)
+        self.assertIn('A note.', page)
+        self.assertIn(((self.src / 'shared.md').resolve().as_posix(),),
+                      [tuple(Path(p).as_posix() for p in r.includes) for r in results])
+        (self.src / 'shared.md').write_text('*[HTML]: Hypertext Markup\n\n[^note]: A note.\n')
+        summary = render_tree(self.src, self.out, jobs=1)
+        self.assertEqual((summary.rendered, summary.skipped), (2, 40))
+        self.assertIn('Hypertext Markup', (self.out / 'guide' / 'page1.html').read_text())
+
+    def test_snippets_outside_the_source_tree_are_skipped(self):
+        """Test that snippets cannot include files from outside the source directory."""
+        secret = Path(self.tmp.name) / 'secret.txt'
+        secret.write_text('Top secret')
+        (self.src / 'guide' / 'page1.md').write_text(
+            f'# One\n\n--8<-- "../../secret.txt"\n\n--8<-- "{secret}"\n'
+        )
+        results = []
+        with self.assertLogs(level='WARNING') as logs:
+            summary = render_tree(self.src, self.out, jobs=1, on_result=results.append,
+                                  cache_dir=Path(self.tmp.name) / 'cache')
+        self.assertEqual(summary.rendered, 41)
+        self.assertEqual(len([line for line in logs.output if 'outside' in line]), 2)
+        self.assertNotIn('Top secret', (self.out / 'guide' / 'page1.html').read_text())
+        self.assertEqual([r.includes for r in results if r.source == 'guide/page1.md'], [()])
+        # The render cache opened in this process is closed with the render
+        self.assertIsNone(batch._worker_cache)
+
+    def test_watch_rebuilds_changed_and_dependent_files(self):
+        """Test that a watch session re-renders only what a change affects."""
+        (self.src / 'abbr.txt').write_text('*[CSS]: Style sheets\n')
+        (self.src / 'guide' / 'page2.md').write_text('CSS\n\n--8<-- "../abbr.txt"\n')
+        out = self.src / 'site'
+        session = WatchSession(self.src, out)
+        for polling in (False, True):
+            with self.subTest(polling=polling):
+                watcher = open_watcher(session.src_dir, exclude=session.out_dir, polling=polling,
+                                       interval=0.05)
+                try:
+                    if not polling:
+                        self.assertEqual(session.build(jobs=1).rendered, 41)
+                        self.assertEqual(watcher.kind, 'inotify' if sys.platform.startswith('linux')
+                                         else 'polling')
+                    self.assertEqual(watcher.wait(0.2), set())
+                    (self.src / 'abbr.txt').write_text(f'*[CSS]: Cascading {polling}\n')
+                    (self.src / 'guide' / 'page9.md').write_text(f'# Nine {polling}\n')
+                    changed = watcher.wait(5)
+                    self.assertEqual(session.affected(sorted(changed)), ['guide/page2.md', 'guide/page9.md'])
+                    summary = session.rebuild(sorted(changed))
+                    self.assertEqual((summary.rendered, summary.failed), (2, 0))
+                    self.assertIn(f'Cascading {polling}', (out / 'guide' / 'page2.html').read_text())
+                    (self.src / 'guide' / 'page9.md').unlink()
+                    session.rebuild(sorted(watcher.wait(5)))
+                    self.assertFalse((out / 'guide' / 'page9.html').exists())
+                    (self.src / 'guide' / 'page9.md').write_text('# Back\n')
+                    session.rebuild(sorted(watcher.wait(5)))
+                finally:
+                    watcher.close()
+        # The manifest kept up by the session lets a full build skip everything
+        self.assertEqual(render_tree(self.src, out, jobs=1).skipped, 41)
+        # A stop event ends the loop
+        stop = threading.Event()
+        stop.set()
+        session.run(PollingWatcher(self.src, out), stop)
+        session.close()
+        self.assertIsNone(batch._worker_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
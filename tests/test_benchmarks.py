@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.documents import generate_document, parse_size, size_label
+from benchmarks.report import compare, load_metrics, summarize
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class TestBenchmarkDocuments(unittest.TestCase):
+    """Test cases for the synthetic benchmark documents."""
+
+    def test_sizes(self):
+        """Test parsing and labelling document sizes."""
+        self.assertEqual(parse_size('1K'), 1024)
+        self.assertEqual(parse_size('50MB'), 50 << 20)
+        self.assertEqual(parse_size('512'), 512)
+        self.assertEqual(size_label(parse_size('10M')), '10M')
+        with self.assertRaises(ValueError):
+            parse_size('ten')
+
+    def test_generate_document(self):
+        """Test that documents have the requested size and mix and are reproducible."""
+        text = generate_document(100_000, seed=3)
+        self.assertEqual(len(text), 100_000)
+        self.assertEqual(text, generate_document(100_000, seed=3))
+        self.assertIn('```', text)
+        self.assertIn('| --- |', text)
+        self.assertIn('\n- ', text)
+        code_only = generate_document(20_000, {'code': 1.0})
+        self.assertNotIn(' | ', code_only)
+        with self.assertRaises(ValueError):
+            generate_document(1000, {'pictures': 1.0})
+
+
+class TestBenchmarkReport(unittest.TestCase):
+    """Test cases for comparing benchmark results."""
+
+    def test_compare(self):
+        """Test that only slowdowns beyond the threshold and the noise floor regress."""
+        baseline = {
+            'render.full[1M]': summarize([1.0, 1.1]),
+            'render.edit[1M]': summarize([0.05]),
+            'status.update[1M]': summarize([0.00001]),
+            'removed[1M]': summarize([1.0]),
+        }
+        current = {
+            'render.full[1M]': summarize([1.5]),
+            'render.edit[1M]': summarize([0.055]),
+            'status.update[1M]': summarize([0.00005]),
+            'added[1M]': summarize([1.0]),
+        }
+        regressions = compare(baseline, current, threshold=0.2)
+        self.assertEqual([r.metric for r in regressions], ['render.full[1M]'])
+        self.assertAlmostEqual(regressions[0].ratio, 1.5)
+        self.assertEqual(compare(baseline, current, threshold=0.6), [])
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    """Smoke test of the benchmark suite against the real editor."""
+
+    def test_run(self):
+        """Test that a run times every hot path and writes the results."""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'results.json'
+            result = subprocess.run(
+                [sys.executable, '-m', 'benchmarks', 'run', '--sizes', '1K', '--repeat', '1',
+                 '--output', str(output)],
+                cwd=ROOT, capture_output=True, text=True, timeout=300,
+                env=dict(os.environ, QT_QPA_PLATFORM='offscreen'))
+            self.assertEqual(result.returncode, 0, result.stderr)
+            metrics = load_metrics(output)
+        self.assertEqual(set(metrics), {f'{metric}[1K]' for metric in (
+            'file.open', 'render.full', 'render.edit', 'editor.keystroke', 'status.update',
+            'stats.recount', 'file.save', 'highlight.full', 'highlight.edit')})
+        self.assertGreater(metrics['render.full[1K]']['min'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
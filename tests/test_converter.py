@@ -0,0 +1,139 @@
+import unittest
+import threading
+
+import markdown
+from markdown.extensions import codehilite, fenced_code
+
+from QuickMD.codehilite import CachedCodeHilite
+from QuickMD.highlight_cache import HighlightCache, get_highlight_cache
+from QuickMD.converter import MarkdownConverter, get_converter
+
+CODE_DOCUMENT = (
+    "```python\ndef f(x):\n    return x < 1\n```\n\n"
+    "```nosuchlang\na < b\n```\n\n"
+    "    #!python\n    indented = 1\n"
+)
+
+
+class TestMarkdownConverter(unittest.TestCase):
+    """Test cases for the MarkdownConverter class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.converter = MarkdownConverter(pool_size=2)
+
+    def test_convert(self):
+        """Test conversion with the configured extensions."""
+        html = self.converter.convert("| a | b |\n|---|---|\n| 1 | 2 |")
+        self.assertIn('<table>', html)
+
+    def test_state_is_reset_between_documents(self):
+        """Test that footnotes and references do not leak between documents."""
+        first = self.converter.convert("Text[^1]\n\n[^1]: Note\n\n[ref]: http://example.com")
+        self.assertIn('footnote', first)
+        second = self.converter.convert("Plain [link][ref]")
+        self.assertNotIn('footnote', second)
+        self.assertNotIn('http://example.com', second)
+
+    def test_instances_are_reused(self):
+        """Test that sequential conversions reuse one instance."""
+        for _ in range(5):
+            self.converter.convert("# Heading")
+        self.assertEqual(self.converter._created, 1)
+
+    def test_concurrent_conversions(self):
+        """Test that concurrent conversions stay within the pool size."""
+        results = []
+
+        def convert(i):
+            results.append(self.converter.convert(f"# Heading {i}"))
+
+        threads = [threading.Thread(target=convert, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 8)
+        self.assertLessEqual(self.converter._created, 2)
+
+    def test_failed_builds_free_their_slot(self):
+        """Test that instances failing to build do not use up the pool."""
+        converter = MarkdownConverter(['no_such_extension'], {}, pool_size=2)
+        errors = []
+
+        def convert():
+            for _ in range(3):
+                try:
+                    converter.convert("# Heading")
+                except ImportError as e:
+                    errors.append(e)
+
+        thread = threading.Thread(target=convert, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), 'convert() waited for an instance never built')
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(converter._created, 0)
+
+    def test_shared_converter(self):
+        """Test that the shared converter is a singleton."""
+        self.assertIs(get_converter(), get_converter())
+
+
+class TestHighlightCache(unittest.TestCase):
+    """Test cases for memoized code highlighting."""
+
+    def test_output_matches_codehilite(self):
+        """Test that cached highlighting produces the same HTML as codehilite."""
+        converter = MarkdownConverter()
+        self.assertEqual(converter.convert(CODE_DOCUMENT), converter.convert(CODE_DOCUMENT))
+        expected = markdown.markdown(
+            CODE_DOCUMENT, extensions=['fenced_code', 'codehilite'],
+            extension_configs={'codehilite': {'guess_lang': False}}
+        )
+        self.assertEqual(converter.convert(CODE_DOCUMENT), expected)
+        # Other Markdown instances keep the library's highlighter
+        self.assertIsNot(codehilite.CodeHilite, CachedCodeHilite)
+        self.assertIsNot(fenced_code.CodeHilite, CachedCodeHilite)
+
+    def test_hits_and_misses(self):
+        """Test that unchanged code blocks are served from the cache."""
+        converter = MarkdownConverter()
+        cache = get_highlight_cache()
+        cache.clear()
+        converter.convert(CODE_DOCUMENT)
+        self.assertEqual(cache.stats().misses, 3)
+        converter.convert(CODE_DOCUMENT + "\n```python\nchanged = True\n```\n")
+        stats = cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (3, 4, 4))
+
+    def test_fenced_and_indented_code_use_the_cache(self):
+        """Test that every kind of highlighted code block goes through the cache."""
+        converter = MarkdownConverter()
+        cache = get_highlight_cache()
+        for document in ("```python\nx = 1\n```\n", "~~~ {.python hl_lines=\"1\"}\nx = 1\n~~~\n",
+                         "Text\n\n    #!python\n    x = 1\n"):
+            with self.subTest(document=document):
+                cache.clear()
+                first = converter.convert(document)
+                self.assertEqual(converter.convert(document), first)
+                stats = cache.stats()
+                self.assertEqual((stats.hits, stats.misses), (1, 1))
+        # Blocks codehilite leaves alone are escaped as before
+        self.assertEqual(converter.convert('``` { .python use_pygments=false }\na < b\n```\n'),
+                         '<pre><code class="language-python">a &lt; b\n</code></pre>')
+
+    def test_size_cap(self):
+        """Test that the least recently used blocks are evicted over the cap."""
+        cache = HighlightCache(max_size=10)
+        cache.put('a', 'x' * 4)
+        cache.put('b', 'x' * 4)
+        cache.get('a')
+        cache.put('c', 'x' * 4)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'x' * 4)
+        self.assertEqual(cache.stats().size, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,36 @@
 import unittest
+import urllib.request
 from unittest.mock import MagicMock, patch
 from pathlib import Path
 import sys
+import random
+import tempfile
+import threading
+import time
 from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont
+from PyQt5.QtCore import QEvent, QPoint, Qt, QUrl
+from PyQt5.QtGui import QColor, QFont, QImage, QTextDocument, QTextFormat
 
 # Create QApplication instance for tests
 app = QApplication(sys.argv)
 
 from QuickMD.config import Config
 from QuickMD.ui import MainWindow, Editor, Viewer
+from QuickMD.incremental import BlockRenderer
+from QuickMD.images import PLACEHOLDER_SIZE, ImageCache
+from QuickMD.highlighter import NORMAL, COMMENT, FRONT_MATTER
+
+
+def wait_until(predicate, timeout=5.0):
+    """Processes events until predicate() is true or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        QApplication.processEvents()
+        time.sleep(0.005)
+    return True
+
 
 class TestConfig(unittest.TestCase):
     """Test cases for the Config class."""
@@ -96,6 +116,153 @@ class TestEditor(unittest.TestCase):
         self.assertEqual(current_font.family(), 'Courier')
         self.assertEqual(current_font.pointSize(), 12)
 
+    def test_document_stats(self):
+        """Test that statistics follow edits without recounting everything."""
+        self.editor.setPlainText("# Title\n\nsome words here\n## Sub\ntext")
+        cursor = self.editor.textCursor()
+        cursor.setPosition(9)
+        cursor.insertText("more\n# New\n")
+        cursor.setPosition(2)
+        cursor.setPosition(20, cursor.KeepAnchor)
+        cursor.removeSelectedText()
+        cursor.insertText("x y\n\n")
+        text = self.editor.toPlainText()
+        stats = self.editor.stats
+        self.assertEqual(stats.words, len(text.split()))
+        self.assertEqual(stats.characters, len(text))
+        self.assertEqual(stats.lines, text.count('\n') + 1)
+        self.assertEqual(stats.headings, sum(line.startswith('#') for line in text.split('\n')))
+
+    def test_outline(self):
+        """Test that the outline follows edits and skips headings in code and front matter."""
+        self.editor.setPlainText(
+            "---\n# meta\n---\n# Title {#top}\n\n## *Sub* [link](x) ##\n"
+            "```\n# code\n```\n## Sub\ntext"
+        )
+        outline = self.editor.outline
+        changes = []
+        outline.changed.connect(lambda: changes.append('changed'))
+        outline.entry_changed.connect(changes.append)
+        entries = outline.entries()
+        self.assertEqual([(e.line, e.level, e.title) for e in entries],
+                         [(3, 1, 'Title'), (5, 2, 'Sub link'), (9, 2, 'Sub')])
+        self.assertEqual(outline.anchors(), ['top', 'sub-link', 'sub'])
+        self.assertEqual(outline.entry_at(7), 1)
+        self.assertIsNone(outline.entry_at(2))
+        # Lines added above only move the entries
+        cursor = self.editor.textCursor()
+        cursor.setPosition(self.editor.document().findBlockByNumber(4).position())
+        cursor.insertText("more\n\n")
+        self.assertEqual(changes, [])
+        self.assertIs(outline.entries(), entries)
+        self.assertEqual([e.line for e in entries], [3, 7, 11])
+        # Typing in a heading updates its entry alone
+        cursor.setPosition(self.editor.document().findBlockByNumber(11).position() + 6)
+        cursor.insertText("s")
+        self.assertEqual(changes, [2])
+        self.assertEqual(outline.entries()[2].title, 'Subs')
+        self.assertEqual(outline.anchors()[2], 'subs')
+        # Closing the fence earlier brings the heading in the code out and
+        # turns the old closing fence into an opening one
+        cursor.setPosition(self.editor.document().findBlockByNumber(9).position())
+        cursor.insertText("```\n")
+        self.assertEqual(changes, [2, 'changed'])
+        self.assertEqual([e.title for e in outline.entries()], ['Title', 'Sub link', 'code'])
+
+    def test_plain_text_snapshot(self):
+        """Test that the shared text copy is reused until the next edit."""
+        self.editor.setPlainText("abc")
+        first = self.editor.plain_text()
+        self.assertIs(self.editor.plain_text(), first)
+        self.editor.textCursor().insertText("d")
+        self.assertEqual(self.editor.plain_text(), "dabc")
+
+
+class TestHighlighter(unittest.TestCase):
+    """Test cases for the MarkdownHighlighter class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.editor = Editor({'font_family': 'Arial', 'font_size': '14', 'tab_width': '40'})
+        self.document = self.editor.document()
+
+    def states(self):
+        """Returns the highlighter state of every line."""
+        block = self.document.begin()
+        states = []
+        while block.isValid():
+            states.append(block.userState())
+            block = block.next()
+        return states
+
+    def formats(self, line):
+        """Returns the (start, length, bold, italic) of the formats on a line."""
+        layout = self.document.findBlockByNumber(line).layout()
+        return [(r.start, r.length, r.format.fontWeight() == QFont.Bold, r.format.fontItalic())
+                for r in layout.formats()]
+
+    def test_inline_rules(self):
+        """Test bold, italic and code spans in one line."""
+        self.editor.setPlainText("a **b** *c* `d`")
+        self.assertEqual(self.formats(0), [(2, 5, True, False), (8, 3, False, True),
+                                           (12, 3, False, False)])
+
+    def test_fenced_code_state(self):
+        """Test that fenced code is highlighted as a unit."""
+        self.editor.setPlainText("```\n**not bold**\n```\n**bold**")
+        states = self.states()
+        self.assertGreater(states[0], FRONT_MATTER)
+        self.assertEqual(states[1], states[0])
+        self.assertEqual(states[2:], [NORMAL, NORMAL])
+        self.assertFalse(self.formats(1)[0][2])
+        self.assertTrue(self.formats(3)[0][2])
+
+    def test_comment_and_front_matter_states(self):
+        """Test multi-line comments and front matter."""
+        self.editor.setPlainText("---\ntitle: x\n---\n<!-- a\nb\n-->after")
+        self.assertEqual(self.states(), [FRONT_MATTER, FRONT_MATTER, NORMAL,
+                                         COMMENT, COMMENT, NORMAL])
+
+    def test_edit_propagates_state(self):
+        """Test that closing a fence updates the following lines."""
+        self.editor.setPlainText("```\ncode\ntext")
+        self.assertEqual(self.states()[2], self.states()[0])
+        cursor = self.editor.textCursor()
+        cursor.setPosition(self.document.findBlockByNumber(2).position())
+        cursor.insertText("```\n")
+        self.assertEqual(self.states()[3], NORMAL)
+
+    def test_lazy_highlighting(self):
+        """Test that large documents are highlighted visible lines first."""
+        self.editor = Editor({'lazy_highlight_threshold': '100'})
+        self.document = self.editor.document()
+        self.editor.resize(400, 300)
+        self.editor.show()
+        self.editor.setPlainText("```\n" + "**a**\n" * 2000 + "```\n**b**")
+        highlighter = self.editor.highlighter
+        self.assertTrue(highlighter.lazy)
+        self.assertEqual(self.formats(2001), [])
+        self.assertTrue(wait_until(lambda: not highlighter.lazy))
+        self.assertTrue(self.formats(2002)[0][2])
+        self.assertFalse(self.formats(1000)[0][2])
+        self.assertEqual(self.states()[1000], self.states()[0])
+
+    def test_evicted_formats_are_restored(self):
+        """Test that dropped highlight formats come back, with the block states kept."""
+        self.editor.resize(400, 300)
+        self.editor.show()
+        self.editor.setPlainText("```\ncode\n```\n" + "**a**\n" * 500)
+        states = self.states()
+        self.editor.evict_highlighting()
+        self.assertEqual(self.formats(3), [])
+        self.assertEqual(self.editor.highlighter.formatted_lines(), 0)
+        self.assertEqual(self.states(), states)
+        self.editor.restore_highlighting()
+        self.assertTrue(wait_until(lambda: not self.editor.highlighter.lazy))
+        self.assertTrue(self.formats(3)[0][2])
+        self.assertTrue(self.formats(400)[0][2])
+        self.assertEqual(self.states(), states)
+
 
 class TestViewer(unittest.TestCase):
     """Test cases for the Viewer class."""
@@ -121,6 +288,162 @@ class TestViewer(unittest.TestCase):
         self.viewer.setHtml(test_html)
         self.assertIn("Test HTML content", self.viewer.toPlainText())
 
+    def test_block_patching(self):
+        """Test that a local edit patches the document instead of resetting it."""
+        renderer = BlockRenderer()
+        text = "# Title\n\n" + "\n\n".join(f"Paragraph {i}" for i in range(20))
+        self.viewer.show_blocks(renderer.render(text).blocks)
+        self.assertEqual(self.viewer.full_resets, 1)
+
+        edited = text.replace("Paragraph 7", "Paragraph *seven*")
+        result = renderer.render(edited)
+        self.viewer.show_blocks(result.blocks)
+        self.assertEqual(self.viewer.full_resets, 1)
+        self.assertEqual(self.viewer.patches, 1)
+        self.assertEqual(self.viewer.toPlainText(), self._full_text(result.html))
+
+        edited = edited.replace("Paragraph 12\n\n", "")
+        result = renderer.render(edited)
+        self.viewer.show_blocks(result.blocks)
+        self.assertEqual(self.viewer.patches, 2)
+        self.assertEqual(self.viewer.toPlainText(), self._full_text(result.html))
+
+    def test_structure_change_resets(self):
+        """Test that replacing most of the document falls back to a reset."""
+        renderer = BlockRenderer()
+        self.viewer.show_blocks(renderer.render("a\n\nb\n\nc").blocks)
+        self.viewer.show_blocks(renderer.render("x\n\ny\n\nc").blocks)
+        self.assertEqual(self.viewer.full_resets, 2)
+        self.assertEqual(self.viewer.patches, 0)
+
+    def test_patches_match_reset(self):
+        """Test that patched documents match documents set from scratch, seeded random edits."""
+        kinds = ["para {}", "> quote {}", "---", "1. x{}\n2. y{}", "- a{}\n- b{}", "## head {}",
+                 "```\ncode {}\n```", "| a | b |\n|---|---|\n| {} | 2 |", "*em* {}"]
+        rng = random.Random(4)
+        renderer = BlockRenderer()
+        self.viewer.patch_limit = 1.0
+        sources = [rng.choice(kinds).format(i, i) for i in range(40)]
+        for step in range(200):
+            index = rng.randrange(len(sources))
+            source = rng.choice(kinds).format(step, step)
+            action = rng.random()
+            if action < 0.6:
+                sources[index] = source
+            elif action < 0.8 or len(sources) < 4:
+                sources.insert(index, source)
+            else:
+                del sources[index]
+            result = renderer.render("\n\n".join(sources))
+            self.viewer.show_blocks(result.blocks)
+            reference = QTextDocument()
+            reference.setDefaultFont(self.viewer.document().defaultFont())
+            reference.setHtml(result.html)
+            self.assertEqual(self._layout(self.viewer.document()), self._layout(reference), step)
+        self.assertGreater(self.viewer.patches, 50)
+
+    def test_source_map(self):
+        """Test that preview blocks map back to the source lines they came from."""
+        renderer = BlockRenderer()
+        text = "\n\n".join(f"Paragraph {i}" for i in range(30))
+        self.viewer.resize(400, 200)
+        self.viewer.show()
+        self.viewer.show_blocks(renderer.render(text).blocks)
+        document = self.viewer.document()
+        block = document.findBlockByNumber(int(self.viewer.source_map.position(40)))
+        self.assertEqual(block.text(), "Paragraph 20")
+        # A blank line at the top moves every block without changing any
+        text = "\n" + text
+        self.viewer.show_blocks(renderer.render(text).blocks)
+        self.assertEqual(self.viewer.source_map.line(block.blockNumber()), 41)
+        self.viewer.scroll_to_line(41)
+        self.assertGreater(self.viewer.verticalScrollBar().value(), 0)
+
+    def test_virtual_preview(self):
+        """Test that large documents lay out only the sections around the view."""
+        renderer = BlockRenderer()
+        text = "\n\n".join(f"# Section {i}\n\n" + "\n\n".join(f"Paragraph {i}.{j}" for j in range(10))
+                           for i in range(100))
+        result = renderer.render(text)
+        viewer = Viewer({'virtual_threshold': '5000', 'virtual_window': '3000'})
+        viewer.resize(400, 300)
+        viewer.show()
+        viewer.show_blocks(result.blocks)
+        self.assertTrue(viewer.virtual)
+        self.assertIn("Section 0", viewer.toPlainText())
+        self.assertNotIn("Section 99", viewer.toPlainText())
+        self.assertLess(viewer.document().blockCount(), len(result.blocks) // 4)
+        # Jumping to a source line lays out the sections around it
+        line = result.blocks[-50].start_line
+        viewer.scroll_to_line(line)
+        self.assertIn("Section 99", viewer.toPlainText())
+        self.assertNotIn("Section 0\n", viewer.toPlainText())
+        self.assertEqual(viewer.line_at(QPoint(0, 0)), line)
+        # Scrolling up moves the window back to the start
+        scrollbar = viewer.verticalScrollBar()
+        for _ in range(1000):
+            if scrollbar.value() == 0:
+                break
+            scrollbar.setValue(scrollbar.value() - scrollbar.pageStep())
+        self.assertIn("Section 0\n", viewer.toPlainText())
+        # Small documents are laid out whole
+        viewer.show_blocks(renderer.render("# Small\n\ntext").blocks)
+        self.assertFalse(viewer.virtual)
+        self.assertEqual(viewer.toPlainText(), "Small\ntext")
+
+    def test_images_load_in_background(self):
+        """Test local images are decoded off the GUI thread, scaled down and cached."""
+        with tempfile.TemporaryDirectory() as directory:
+            image = QImage(4000, 300, QImage.Format_RGB32)
+            image.fill(QColor('#336699'))
+            image.save(str(Path(directory) / 'wide.png'))
+            viewer = Viewer(self.config)
+            viewer.resize(600, 400)
+            viewer.base_path = Path(directory)
+            viewer.image_loader.cache = ImageCache()
+            url = QUrl('wide.png')
+            viewer.setHtml('<p><img src="wide.png"></p>')
+            # A placeholder is shown until the image is decoded
+            shown = viewer.document().resource(QTextDocument.ImageResource, url)
+            self.assertEqual(shown.size(), PLACEHOLDER_SIZE)
+            self.assertTrue(wait_until(viewer.image_loader.is_idle))
+            QApplication.processEvents()
+            shown = viewer.document().resource(QTextDocument.ImageResource, url)
+            self.assertLessEqual(shown.width(), 1024)
+            self.assertEqual(shown.width() * 300 // 4000, shown.height())
+            self.assertEqual(viewer.image_loader.decoded, 1)
+            # Rendering again takes the image from the cache
+            viewer.setHtml('<p><img src="wide.png"> again</p>')
+            shown = viewer.document().resource(QTextDocument.ImageResource, url)
+            self.assertNotEqual(shown.size(), PLACEHOLDER_SIZE)
+            self.assertTrue(viewer.image_loader.is_idle())
+            self.assertEqual(viewer.image_loader.decoded, 1)
+            # Missing images are not loaded
+            viewer.setHtml('<p><img src="missing.png"></p>')
+            self.assertTrue(viewer.image_loader.is_idle())
+
+    @staticmethod
+    def _layout(document):
+        """Returns the text, block format and list style of every block."""
+        layout = []
+        block = document.begin()
+        while block.isValid():
+            properties = block.blockFormat().properties()
+            properties.pop(QTextFormat.ObjectIndex, None)
+            properties = {key: value.rawValue() if hasattr(value, 'rawValue') else value
+                          for key, value in properties.items()}
+            text_list = block.textList()
+            layout.append((block.text(), properties,
+                           text_list.format().style() if text_list is not None else None))
+            block = block.next()
+        return layout
+
+    def _full_text(self, html):
+        """Returns the plain text of html rendered from scratch."""
+        viewer = Viewer(self.config)
+        viewer.setHtml(html)
+        return viewer.toPlainText()
+
 
 class TestMainWindow(unittest.TestCase):
     """Test cases for the MainWindow class."""
@@ -171,6 +494,258 @@ class TestMainWindow(unittest.TestCase):
             if test_file.exists():
                 test_file.unlink()
 
+    def test_open_large_file_streams(self):
+        """Test that large files are loaded in chunks in the background."""
+        self.config.get_editor_config.return_value = {'stream_threshold': '100',
+                                                      'stream_chunk_size': '64'}
+        window = MainWindow(self.config)
+        test_content = "".join(f"# Heading {i}\n\ntext {i}\n\n" for i in range(100))
+        with tempfile.TemporaryDirectory() as tmp:
+            test_file = Path(tmp) / 'large.md'
+            test_file.write_text(test_content)
+            window.load_file(test_file)
+            self.assertTrue(window.loader.is_running())
+            self.assertTrue(window.editor.isReadOnly())
+            self.assertTrue(wait_until(lambda: not window.loader.is_running()))
+        self.assertEqual(window.editor.toPlainText(), test_content)
+        self.assertEqual(window.current_file, test_file)
+        self.assertFalse(window.editor.isReadOnly())
+        self.assertEqual(window.editor.stats.headings, 100)
+        self.assertEqual(window.editor.font().family(), window.editor.document().defaultFont().family())
+        self.assertTrue(wait_until(lambda: "Heading 99" in window.viewer.toPlainText()))
+
+    def test_cancel_load(self):
+        """Test that a cancelled load keeps the current document."""
+        self.config.get_editor_config.return_value = {'stream_threshold': '100',
+                                                      'stream_chunk_size': '64'}
+        window = MainWindow(self.config)
+        window.editor.setPlainText("current")
+        with tempfile.TemporaryDirectory() as tmp:
+            test_file = Path(tmp) / 'large.md'
+            test_file.write_text("text\n" * 1000)
+            window.load_file(test_file)
+            QApplication.processEvents()
+            window.cancel_load()
+            for _ in range(20):
+                QApplication.processEvents()
+        self.assertFalse(window.loader.is_running())
+        self.assertEqual(window.editor.toPlainText(), "current")
+        self.assertIsNone(window.current_file)
+        self.assertFalse(window.editor.isReadOnly())
+
+    def test_large_save_runs_in_background(self):
+        """Test that saves above the synchronous limit are written by the saver."""
+        self.window.saver.sync_limit = 0
+        with tempfile.TemporaryDirectory() as tmp:
+            test_file = Path(tmp) / 'saved.md'
+            self.window.editor.setPlainText("# Saved")
+            self.window.current_file = test_file
+            self.window.save_file()
+            self.assertTrue(self.window.saver.wait(5))
+            self.assertEqual(test_file.read_text(), "# Saved")
+
+    def test_journal_recovery(self):
+        """Test that unsaved edits are recovered by the next session."""
+        with tempfile.TemporaryDirectory() as tmp:
+            test_file = Path(tmp) / 'doc.md'
+            test_file.write_text("# Title\n")
+            self.config.get_editor_config.return_value = {'journal_dir': str(Path(tmp) / 'journal')}
+            window = MainWindow(self.config)
+            window.load_file(test_file)
+            cursor = window.editor.textCursor()
+            cursor.movePosition(cursor.End)
+            cursor.insertText("body")
+            cursor.setPosition(2)
+            cursor.insertText("New ")
+            window.autosave()
+            # Not while the window writing it is running
+            self.assertFalse(MainWindow(self.config).recover_from_journal())
+            # The first window never closes, as after a crash, which releases its lock
+            window.current_tab.journal.close()
+            recovered = MainWindow(self.config)
+            self.assertTrue(recovered.recover_from_journal())
+            self.assertEqual(recovered.editor.toPlainText(), "# New Title\nbody")
+            self.assertEqual(recovered.current_file, test_file)
+            recovered.save_file()
+            self.assertEqual(test_file.read_text(), "# New Title\nbody")
+            self.assertFalse(recovered.journal.path.exists())
+
+    def test_warm_up_opens_render_cache(self):
+        """Test that the render cache is opened by the warm-up after startup."""
+        with tempfile.TemporaryDirectory() as tmp:
+            self.config.get_viewer_config.return_value = {'render_cache_dir': tmp}
+            window = MainWindow(self.config)
+            self.assertIsNone(window.render_cache)
+            self.assertTrue(wait_until(lambda: window.render_cache is not None))
+            self.assertIs(window.block_renderer.persistent, window.render_cache)
+            window.close()
+
+    def test_warm_up_outlives_the_first_tab(self):
+        """Test that the warm-up result arrives after the tab shown at startup is closed."""
+        with tempfile.TemporaryDirectory() as tmp:
+            self.config.get_viewer_config.return_value = {'render_cache_dir': tmp}
+            window = MainWindow(self.config)
+            started, release = threading.Event(), threading.Event()
+            warm_up_renderer = window.warm_up_renderer
+
+            def held_warm_up():
+                started.set()
+                release.wait(5)
+                return warm_up_renderer()
+
+            window.warm_up_renderer = held_warm_up
+            ready = []
+            window.renderer_ready.connect(lambda: ready.append(True))
+            self.assertTrue(wait_until(started.is_set))
+            first = window.current_tab
+            (Path(tmp) / 'doc.md').write_text("# Doc")
+            window.load_file(Path(tmp) / 'doc.md')
+            window.close_tab(window.tab_widget.indexOf(first))
+            QApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+            release.set()
+            self.assertTrue(wait_until(lambda: ready))
+            self.assertIsNotNone(window.render_cache)
+            self.assertIs(window.block_renderer.persistent, window.render_cache)
+            window.close()
+
+    def test_tabs(self):
+        """Test that documents open in tabs sharing the converter."""
+        with tempfile.TemporaryDirectory() as tmp:
+            first, second = Path(tmp) / 'first.md', Path(tmp) / 'second.md'
+            first.write_text("# First")
+            second.write_text("# Second")
+            self.window.load_file(first)
+            self.window.load_file(second)
+            self.assertEqual(self.window.tab_widget.count(), 2)
+            self.assertEqual(self.window.windowTitle(), 'QuickMD - second.md')
+            self.assertTrue(wait_until(lambda: "Second" in self.window.viewer.toPlainText()))
+            first_tab, second_tab = self.window.tabs()
+            self.assertIs(first_tab.block_renderer.converter, second_tab.block_renderer.converter)
+            self.window.load_file(first)
+            self.assertIs(self.window.current_tab, first_tab)
+            self.assertEqual(self.window.tab_widget.count(), 2)
+            self.window.close_tab(0)
+            self.assertEqual(self.window.tabs(), [second_tab])
+            self.window.close_tab(0)
+            self.assertEqual(self.window.tab_widget.count(), 1)
+            self.assertIsNone(self.window.current_file)
+
+    def test_go_to_heading(self):
+        """Test that the outline panel lists the headings and jumps to them."""
+        window = self.window
+        window.resize(800, 600)
+        window.show()
+        window.editor.setPlainText(''.join(f"# Heading {i}\n\n" + "text\n" * 40 for i in range(50)))
+        panel = window.outline_panel
+        panel.focus_filter()
+        self.assertTrue(panel.isVisible())
+        self.assertEqual(len(panel._items), 50)
+        panel.filter.setText("Heading 42")
+        self.assertEqual([item.text(0) for item in panel._items if not item.isHidden()], ['Heading 42'])
+        panel.activate_first()
+        self.assertEqual(window.editor.textCursor().blockNumber(), 42 * 42)
+        self.assertEqual(window.editor.firstVisibleBlock().blockNumber(), 42 * 42)
+        self.assertEqual(panel.tree.currentItem().text(0), 'Heading 42')
+        window.close()
+
+    def test_find_and_replace(self):
+        """Test that the find bar counts, finds and replaces matches in slices, with one undo step."""
+        window = self.window
+        text = "foo bar\nFoo baz\n" * 3000
+        window.editor.setPlainText(text)
+        bar = window.find_bar
+        bar.show_find()
+        bar.find_field.setText("foo")
+        self.assertTrue(wait_until(bar.is_idle))
+        self.assertEqual(bar.count_label.text(), '6000 matches')
+        bar.case_box.setChecked(True)
+        self.assertTrue(wait_until(bar.is_idle))
+        self.assertEqual(bar.matches, 3000)
+        self.assertTrue(bar.find_next())
+        self.assertEqual(window.editor.textCursor().selectedText(), 'foo')
+        self.assertTrue(bar.find_previous())
+        self.assertEqual(window.editor.textCursor().blockNumber(), 5998)
+        bar.regex_box.setChecked(True)
+        bar.case_box.setChecked(False)
+        bar.find_field.setText("f(o+)")
+        bar.replace_field.setText("\\1X")
+        bar.replace_all()
+        self.assertTrue(window.editor.isReadOnly())
+        self.assertTrue(wait_until(bar.is_idle))
+        self.assertFalse(window.editor.isReadOnly())
+        self.assertEqual(window.editor.toPlainText(), "ooX bar\nooX baz\n" * 3000)
+        self.assertEqual(bar.count_label.text(), 'Replaced 6000')
+        window.editor.undo()
+        self.assertEqual(window.editor.toPlainText(), text)
+
+    def test_workspace_search(self):
+        """Test that the workspace search indexes a folder and opens hits at their line."""
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp) / 'docs'
+            root.mkdir()
+            (root / 'a.md').write_text("# Alpha\n\nnothing here\n\n## Target\n\none\ntwo quokka\n")
+            self.config.get_editor_config.return_value = {'workspace': str(root),
+                                                          'search_index_dir': str(Path(tmp) / 'cache')}
+            window = MainWindow(self.config)
+            panel = window.search_panel
+            self.assertTrue(wait_until(lambda: not panel.is_indexing()))
+            panel.query.setText("quok")
+            panel.search()
+            self.assertEqual(panel.results.count(), 1)
+            panel.activate_first()
+            self.assertEqual(window.current_file, root / 'a.md')
+            self.assertEqual(window.editor.textCursor().blockNumber(), 7)
+            window.editor.setPlainText("# Alpha\n\nquokka again\n")
+            window.save_file()
+            window.saver.wait()
+            self.assertTrue(wait_until(lambda: panel.results.count() == 1
+                                       and panel.results.item(0).text().startswith('a.md:3')))
+            window.close()
+
+    def test_preview_server(self):
+        """Test that browsers are served the current tab and its edits."""
+        self.config.get_viewer_config.return_value = {'preview_server_port': '0'}
+        window = MainWindow(self.config)
+        try:
+            self.assertTrue(window.start_preview_server())
+            self.assertTrue(window.serve_action.isChecked())
+            server = window.preview_server
+            url = f'http://127.0.0.1:{server.port}/'
+            window.editor.setPlainText("# Served\n\nlive *text*")
+            self.assertTrue(wait_until(lambda: 'Served</h1>' in server.page()))
+            page = urllib.request.urlopen(url, timeout=5).read().decode()
+            self.assertIn('<em>text</em>', page)
+            # Switching tabs shows the new current tab
+            window.new_file()
+            self.assertTrue(wait_until(lambda: 'Served' not in server.page()))
+            window.tab_widget.setCurrentIndex(0)
+            self.assertTrue(wait_until(lambda: 'Served</h1>' in server.page()))
+            window.toggle_preview_server(False)
+            self.assertFalse(server.is_running())
+            self.assertFalse(window.serve_action.isChecked())
+        finally:
+            window.close()
+
+    def test_hidden_tabs_are_evicted(self):
+        """Test that hidden tabs over the memory budget are evicted and rebuilt when shown."""
+        self.config.get_editor_config.return_value = {'hidden_tab_budget': '0'}
+        window = MainWindow(self.config)
+        window.editor.setPlainText("# First\n\n**bold**")
+        first = window.current_tab
+        self.assertTrue(wait_until(lambda: "First" in first.viewer.toPlainText()))
+        self.assertGreater(first.memory_usage().evictable, 0)
+        window.new_file()
+        self.assertTrue(first.evicted)
+        self.assertEqual(first.viewer.toPlainText(), "")
+        memory = first.memory_usage()
+        self.assertEqual((memory.highlighting, memory.blocks), (0, 0))
+        self.assertIn("Evicted", window.tab_widget.tabToolTip(0))
+        window.tab_widget.setCurrentWidget(first)
+        self.assertFalse(first.evicted)
+        self.assertTrue(wait_until(lambda: "First" in first.viewer.toPlainText()))
+        self.assertTrue(wait_until(lambda: not first.editor.highlighter.lazy))
+        self.assertIn(first, window.memory_usage())
+
     def test_markdown_extensions(self):
         """Test Markdown extensions setup."""
         self.assertTrue(hasattr(self.window, 'markdown_extensions'))
@@ -180,10 +755,22 @@ class TestMainWindow(unittest.TestCase):
         """Test viewer update on editor changes."""
         test_markdown = "# Test Heading"
         self.window.editor.setPlainText(test_markdown)
-        # Allow event loop to process
+        # Rendering is debounced and runs on a worker thread
+        self.assertTrue(wait_until(
+            lambda: "Test Heading" in self.window.viewer.toPlainText()))
+
+    def test_viewer_update_keeps_latest_snapshot(self):
+        """Test that a burst of edits renders only the newest text."""
+        rendered = []
+        self.window.render_worker.rendered.connect(
+            lambda generation, html: rendered.append(html))
+        for i in range(20):
+            self.window.editor.setPlainText(f"# Heading {i}")
+        self.assertTrue(wait_until(lambda: rendered))
+        self.assertTrue(wait_until(self.window.render_worker.is_idle))
         QApplication.processEvents()
-        viewer_content = self.window.viewer.toPlainText()
-        self.assertIn("Test Heading", viewer_content)
+        self.assertEqual(len(rendered), 1)
+        self.assertIn("Heading 19", self.window.viewer.toPlainText())
 
     @patch('PyQt5.QtWidgets.QFileDialog.getSaveFileName')
     def test_save_file_as(self, mock_file_dialog):
@@ -0,0 +1,49 @@
+import unittest
+
+from benchmarks.engines import FEATURES, KNOWN_DIFFERENCES, conformance, normalize_html
+from QuickMD.converter import MarkdownConverter, available_engines, extension_signature
+from QuickMD.incremental import BlockRenderer
+
+HAS_MARKDOWN_IT = 'markdown-it' in available_engines()
+
+
+class TestEngines(unittest.TestCase):
+    """Test cases for the pluggable Markdown engines."""
+
+    def test_unknown_engine(self):
+        """Test that only known engines can be picked."""
+        self.assertIn('python-markdown', available_engines())
+        with self.assertRaises(ValueError):
+            MarkdownConverter(engine='commonmark-rs')
+
+    def test_normalize_html(self):
+        """Test that equivalent markup compares equal."""
+        self.assertEqual(normalize_html('<hr />\n<td style="text-align: right;" id="a">x</td>'),
+                         normalize_html('<hr><td id="a" style="text-align:right">x</td>'))
+        self.assertNotEqual(normalize_html('<p>a b</p>'), normalize_html('<p>ab</p>'))
+
+    @unittest.skipUnless(HAS_MARKDOWN_IT, 'markdown-it-py is not installed')
+    def test_feature_conformance(self):
+        """Test that markdown-it renders the extension features like Python-Markdown."""
+        for feature, source in FEATURES.items():
+            if feature in KNOWN_DIFFERENCES:
+                continue
+            with self.subTest(feature=feature):
+                result = conformance([source], 'markdown-it')
+                self.assertEqual(result.matched, 1, result.mismatches)
+
+    @unittest.skipUnless(HAS_MARKDOWN_IT, 'markdown-it-py is not installed')
+    def test_block_renderer(self):
+        """Test that block rendering with markdown-it matches its whole-document output."""
+        converter = MarkdownConverter(engine='markdown-it')
+        self.assertNotEqual(converter.fingerprint, MarkdownConverter().fingerprint)
+        self.assertEqual(MarkdownConverter().fingerprint,
+                         extension_signature(converter.extensions, converter.extension_configs))
+        text = '\n\n'.join(FEATURES[feature] for feature in
+                           ('headings', 'table of contents', 'footnotes', 'abbreviations', 'tables'))
+        result = BlockRenderer(converter).render(text)
+        self.assertEqual(normalize_html(result.html), normalize_html(converter.convert(text)))
+
+
+if __name__ == '__main__':
+    unittest.main()
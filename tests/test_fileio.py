@@ -0,0 +1,55 @@
+import codecs
+import tempfile
+import unittest
+from pathlib import Path
+
+from QuickMD.fileio import atomic_write, detect_encoding, read_chunks, read_text
+
+
+class TestFileIO(unittest.TestCase):
+    """Test cases for encoding detection and chunked reading."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'doc.md'
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.tmp.cleanup()
+
+    def test_detect_encoding(self):
+        """Test byte order marks, BOM-less UTF-16 and the fallback."""
+        self.assertEqual(detect_encoding(codecs.BOM_UTF8 + b'# a'), ('utf-8', 3))
+        self.assertEqual(detect_encoding(codecs.BOM_UTF16_LE + b'#\x00'), ('utf-16-le', 2))
+        self.assertEqual(detect_encoding(codecs.BOM_UTF32_LE + b'#\x00\x00\x00'), ('utf-32-le', 4))
+        self.assertEqual(detect_encoding('# héllo'.encode('utf-16-be')), ('utf-16-be', 0))
+        self.assertEqual(detect_encoding('# héllo'.encode('utf-8')), ('utf-8', 0))
+        self.assertEqual(detect_encoding('# héllo'.encode('cp1252')), ('cp1252', 0))
+
+    def test_chunks_split_characters_and_newlines(self):
+        """Test that chunk boundaries inside a character or CRLF are handled."""
+        text = 'é€\r\n' * 50 + 'end\r'
+        self.path.write_bytes(codecs.BOM_UTF8 + text.encode('utf-8'))
+        chunks = list(read_chunks(self.path, chunk_size=7))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(''.join(chunk for chunk, _ in chunks), 'é€\n' * 50 + 'end\n')
+        self.assertEqual(chunks[-1][1], self.path.stat().st_size)
+
+    def test_read_text_utf16(self):
+        """Test reading a UTF-16 file with a byte order mark."""
+        self.path.write_bytes('# Title\r\nbody'.encode('utf-16'))
+        self.assertEqual(read_text(self.path), '# Title\nbody')
+
+    def test_atomic_write(self):
+        """Test that a save replaces the file and keeps its permissions."""
+        self.path.write_text('old')
+        self.path.chmod(0o640)
+        atomic_write(self.path, 'new\ntext')
+        self.assertEqual(self.path.read_text(), 'new\ntext')
+        self.assertEqual(self.path.stat().st_mode & 0o777, 0o640)
+        self.assertEqual(list(self.path.parent.iterdir()), [self.path])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import re
+import unittest
+
+from QuickMD.converter import MarkdownConverter
+from QuickMD.incremental import BlockRenderer, split_blocks
+
+SAMPLE = """Title: Sample
+Author: Tester
+
+# Intro
+
+Para[^b] and[^a] HTML text with [link][ref] and [Other].
+
+# Intro
+
+[TOC]
+
+## Sub A
+
+### Deep
+
+## Sub B
+
+- item 1
+- item 2
+
+- item 3
+
+    continued item 3
+
+Term
+: Definition
+
+Note: not meta
+
+> quote a
+
+> quote b
+
+```python
+def f():
+
+    return 1
+```
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+<div>
+
+raw *html*
+
+</div>
+
+# Outro { #custom }
+
+*[HTML]: Hyper Text
+
+[ref]: http://example.com "Title"
+[other]: http://other.com
+
+[^a]: Note A
+[^b]: Note B
+
+    more b
+"""
+
+# Notes referenced more than once, in one block and across blocks, and
+# reference links inside their text
+FOOTNOTES = """Twice[^a] in one block[^a].
+
+Again[^a], and once[^b].
+
+[^a]: Note A, see [ref].
+[^b]: Note B
+    with [other] HTML.
+
+[ref]: http://example.com
+[other]: http://other.com
+*[HTML]: Hyper Text
+"""
+
+# Repeated headings, one with a suffix of its own
+HEADINGS = """# a
+
+# a_5
+
+# a_5
+
+# a
+"""
+
+
+def normalize(html):
+    """Drops whitespace between tags, which does not affect rendering."""
+    return re.sub(r'>\s+<', '><', html.strip())
+
+
+class TestBlockRenderer(unittest.TestCase):
+    """Test cases for the BlockRenderer class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.converter = MarkdownConverter()
+        self.renderer = BlockRenderer(self.converter)
+
+    def test_matches_full_render(self):
+        """Test that block rendering matches a full document render."""
+        for document in (SAMPLE, FOOTNOTES, HEADINGS):
+            with self.subTest(document=document[:20]):
+                expected = self.converter.convert(document)
+                self.assertEqual(normalize(self.renderer.render(document).html), normalize(expected))
+
+    def test_edit_rerenders_only_changed_block(self):
+        """Test that a one-character edit re-renders a single block."""
+        first = self.renderer.render(SAMPLE)
+        self.assertGreater(first.rendered_count, 10)
+        edited = SAMPLE.replace('Note: not meta', 'Note: not metal')
+        second = self.renderer.render(edited)
+        self.assertEqual(second.rendered_count, 1)
+        self.assertEqual(normalize(second.html), normalize(self.converter.convert(edited)))
+
+    def test_definition_change_rerenders_users(self):
+        """Test that changing a reference re-renders the blocks that use it."""
+        self.renderer.render(SAMPLE)
+        edited = SAMPLE.replace('http://example.com', 'http://example.org')
+        result = self.renderer.render(edited)
+        self.assertEqual(result.rendered_count, 1)
+        self.assertIn('http://example.org', result.html)
+
+    def test_new_footnote_renumbers_references(self):
+        """Test that footnote numbers follow the document-wide definition order."""
+        self.renderer.render(SAMPLE)
+        edited = SAMPLE.replace('[^a]: Note A', '[^c]: Note C\n[^a]: Note A')
+        edited = edited.replace('# Outro', 'See[^c]\n\n# Outro')
+        result = self.renderer.render(edited)
+        self.assertEqual(normalize(result.html), normalize(self.converter.convert(edited)))
+
+    def test_split_keeps_fences_whole(self):
+        """Test that blank lines inside fenced code do not split blocks."""
+        lines = ['```', 'a', '', 'b', '```', '', 'para']
+        self.assertEqual(split_blocks(lines), [(0, 5), (6, 7)])
+
+
+if __name__ == '__main__':
+    unittest.main()
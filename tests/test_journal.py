@@ -0,0 +1,130 @@
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from QuickMD.journal import EditJournal, JournalLock, apply_edit, find_journals, recover
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class TestEditJournal(unittest.TestCase):
+    """Test cases for the autosave journal and recovery."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name) / 'journal'
+        self.file = Path(self.tmp.name) / 'doc.md'
+        self.file.write_text("hello world\n")
+        self.journal = EditJournal(self.directory)
+        self.journal.start(self.file, "hello world\n")
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.journal.close()
+        self.tmp.cleanup()
+
+    def test_apply_edit(self):
+        """Test replacing text across piece boundaries."""
+        pieces = apply_edit(["abc", "def"], 2, 2, "XY")
+        self.assertEqual("".join(pieces), "abXYef")
+        self.assertEqual("".join(apply_edit(pieces, 6, 0, "!")), "abXYef!")
+        self.assertEqual("".join(apply_edit(pieces, 0, 6, "")), "")
+
+    def test_unedited_document_leaves_no_journal(self):
+        """Test that flushing without edits writes nothing."""
+        self.journal.flush()
+        self.assertEqual(find_journals(self.directory), [])
+
+    def test_recover_replays_edits(self):
+        """Test that flushed deltas replay onto the base file."""
+        self.journal.record(5, 0, ",")
+        self.journal.record(6, 0, " dear")
+        self.journal.flush()
+        self.journal.record(0, 5, "goodbye")
+        self.journal.flush()
+        lines = self.journal.path.read_text().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(recover(self.journal.path), (self.file, "goodbye, dear world\n"))
+
+    def test_changed_base_file_is_not_replayed(self):
+        """Test that edits are not replayed onto a file changed since."""
+        self.journal.record(0, 0, "x")
+        self.journal.flush()
+        self.file.write_text("changed\n")
+        with self.assertRaises(ValueError):
+            recover(self.journal.path)
+
+    def test_truncated_last_record_is_ignored(self):
+        """Test recovery after a crash in the middle of an append."""
+        self.journal.record(0, 0, "a")
+        self.journal.flush()
+        with open(self.journal.path, 'a') as file:
+            file.write('{"type": "edit", "at": 0')
+        self.assertEqual(recover(self.journal.path)[1], "ahello world\n")
+
+    def test_rebase_keeps_later_edits(self):
+        """Test that a completed save drops the edits it covered."""
+        self.journal.record(0, 0, "a")
+        self.journal.flush()
+        mark = self.journal.mark()
+        saved = "ahello world\n"
+        self.journal.record(1, 0, "b")
+        self.file.write_text(saved)
+        self.journal.rebase(self.file, saved, mark)
+        self.journal.flush()
+        self.assertEqual(recover(self.journal.path)[1], "abhello world\n")
+        self.journal.rebase(self.file, "abhello world\n", self.journal.mark())
+        self.assertFalse(self.journal.path.exists())
+
+    def test_overlapping_saves(self):
+        """Test that a save started before an earlier one finished keeps later edits."""
+        for in_order in (True, False):
+            with self.subTest(in_order=in_order):
+                journal = EditJournal(self.directory)
+                journal.start(self.file, "YZ")
+                journal.record(1, 0, "abc")
+                first = journal.mark()
+                journal.record(4, 0, "1")
+                second = journal.mark()
+                journal.record(5, 0, "!")
+                saves = [("YabcZ", first), ("Yabc1Z", second)]
+                for text, mark in saves if in_order else reversed(saves):
+                    journal.rebase(self.file, text, mark)
+                self.file.write_text("Yabc1Z")
+                self.assertTrue(journal.has_edits)
+                journal.flush()
+                self.assertEqual(recover(journal.path)[1], "Yabc1!Z")
+                journal.discard()
+
+    def test_lock_is_held_while_the_owner_runs(self):
+        """Test that a journal cannot be claimed until the process writing it ends."""
+        self.journal.record(0, 0, "a")
+        self.journal.flush()
+        self.assertIsNone(JournalLock.acquire(self.journal.path))
+        self.journal.close()
+        code = ('import sys\n'
+                'from pathlib import Path\n'
+                'from QuickMD.journal import JournalLock\n'
+                f'lock = JournalLock.acquire(Path({str(self.journal.path)!r}))\n'
+                'print(lock is not None, flush=True)\n'
+                'sys.stdin.readline()\n')
+        owner = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, text=True,
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            self.assertEqual(owner.stdout.readline().strip(), 'True')
+            self.assertIsNone(JournalLock.acquire(self.journal.path))
+        finally:
+            owner.kill()
+            owner.wait()
+        # The lock goes with the process, however it ends
+        lock = JournalLock.acquire(self.journal.path)
+        self.assertIsNotNone(lock)
+        lock.release(remove=True)
+        self.assertEqual(list(self.directory.glob('*.lock')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import logging
+import logging.handlers
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from QuickMD.utils import setup_logging, stop_logging
+
+
+class TestLogging(unittest.TestCase):
+    """Test cases for the queued, rotating log."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_file = Path(self.tmp.name) / 'logs' / 'app.log'
+        self.root_level = logging.getLogger().level
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        stop_logging()
+        logging.getLogger().setLevel(self.root_level)
+        self.tmp.cleanup()
+
+    def test_written_by_listener_thread(self):
+        """Test that records are written off the calling thread, at the configured level."""
+        setup_logging(str(self.log_file), level='info', max_bytes=2000, backup_count=2)
+        self.assertIsInstance(logging.getLogger().handlers[-1], logging.handlers.QueueHandler)
+        logging.debug('hidden')
+        for i in range(100):
+            logging.info(f'message {i}')
+        stop_logging()
+        text = self.log_file.read_text()
+        self.assertNotIn('hidden', text)
+        self.assertIn('message 99', text)
+        self.assertLessEqual(self.log_file.stat().st_size, 2000)
+        backups = sorted(p.name for p in self.log_file.parent.iterdir())
+        self.assertEqual(backups, ['app.log', 'app.log.1', 'app.log.2'])
+
+    def test_json_lines(self):
+        """Test structured output, with the traceback kept apart from the message."""
+        setup_logging(str(self.log_file), level='DEBUG', json_lines=True)
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logging.exception('failed %s', 'render')
+        stop_logging()
+        entry = json.loads(self.log_file.read_text().splitlines()[-1])
+        self.assertEqual(entry['level'], 'ERROR')
+        self.assertEqual(entry['message'], 'failed render')
+        self.assertEqual(entry['thread'], threading.current_thread().name)
+        self.assertIn('ValueError: boom', entry['exception'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import base64
+import json
+import os
+import socket
+import struct
+import tempfile
+import time
+import unittest
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from QuickMD.incremental import RenderedBlock
+from QuickMD.preview_server import CLIENT_BACKLOG, PreviewServer, _Client, _Document
+
+
+def blocks(*fragments):
+    """Returns rendered blocks keyed by their HTML."""
+    return [RenderedBlock(fragment, index, index + 1, fragment) for index, fragment in enumerate(fragments)]
+
+
+class WebSocketClient:
+    """A minimal blocking WebSocket client for localhost tests."""
+
+    def __init__(self, port, origin=None):
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+        key = base64.b64encode(os.urandom(16)).decode()
+        origin = origin or f'http://localhost:{port}'
+        self.sock.sendall((f'GET /ws HTTP/1.1\r\nHost: localhost:{port}\r\nOrigin: {origin}\r\n'
+                           f'Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n'
+                           'Sec-WebSocket-Version: 13\r\n\r\n').encode())
+        head = b''
+        while not head.endswith(b'\r\n\r\n'):
+            head += self.sock.recv(1)
+        self.status = int(head.split()[1])
+
+    def _read(self, count):
+        data = b''
+        while len(data) < count:
+            chunk = self.sock.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError('closed')
+            data += chunk
+        return data
+
+    def receive(self):
+        """Returns the next text message as JSON."""
+        first, second = self._read(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self._read(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self._read(8))[0]
+        return json.loads(self._read(length))
+
+    def send(self, opcode, payload=b''):
+        mask = os.urandom(4)
+        masked = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+        self.sock.sendall(struct.pack('!BB', 0x80 | opcode, 0x80 | len(payload)) + mask + masked)
+
+    def close(self):
+        self.sock.close()
+
+
+def wait_until(predicate, timeout=5.0):
+    """Polls predicate() until it is true or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class TestPreviewServer(unittest.TestCase):
+    """Test cases for the live preview server."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.server = PreviewServer('127.0.0.1', 0)
+        self.port = self.server.start()
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.server.stop()
+
+    def test_clients_get_the_document_and_patches(self):
+        """Test that every client gets the whole document, then only the changed blocks."""
+        self.server.publish('Doc', blocks('<h1>A</h1>', '<p>b</p>', '<p>c</p>'))
+        self.assertTrue(wait_until(lambda: self.server.updates == 1))
+        clients = [WebSocketClient(self.port) for _ in range(30)]
+        self.assertEqual({client.status for client in clients}, {101})
+        try:
+            for client in clients:
+                reset = client.receive()
+                self.assertEqual((reset['type'], reset['title']), ('reset', 'Doc'))
+                self.assertEqual(reset['html'], ['<h1>A</h1>', '<p>b</p>', '<p>c</p>'])
+            self.assertTrue(wait_until(lambda: self.server.client_count() == 30))
+            # A burst of edits goes out as one update with the middle block alone
+            for text in ('x', 'xy', 'xyz'):
+                self.server.publish('Doc', blocks('<h1>A</h1>', f'<p>{text}</p>', '<p>c</p>'))
+            for client in clients:
+                patch = client.receive()
+                self.assertEqual((patch['type'], patch['start'], patch['remove'], patch['html']),
+                                 ('patch', 1, 1, ['<p>xyz</p>']))
+            self.assertEqual(self.server.updates, 2)
+            # Pings are answered
+            clients[0].send(0x9, b'hi')
+            first, length = clients[0]._read(2)
+            self.assertEqual((first & 0x0F, clients[0]._read(length)), (0xA, b'hi'))
+        finally:
+            for client in clients:
+                client.close()
+        self.assertTrue(wait_until(lambda: self.server.client_count() == 0))
+
+    def test_slow_client_is_sent_the_whole_document(self):
+        """Test that a client far behind gets one reset instead of every update."""
+        client = _Client(None)
+        document = _Document(3, 'Doc', ['a'], ['<p>a</p>'])
+        for _ in range(CLIENT_BACKLOG):
+            client.send(b'patch', document)
+        self.assertEqual(client.queue.qsize(), CLIENT_BACKLOG)
+        client.send(b'patch', document)
+        self.assertEqual(client.queue.qsize(), 1)
+        reset = client.queue.get_nowait()
+        self.assertIs(reset, document.reset_frame())
+        self.assertEqual(json.loads(reset[2:])['html'], ['<p>a</p>'])
+
+    def test_http_page_and_files(self):
+        """Test that the page shows the document and files are served from its folder only."""
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp) / 'doc'
+            base.mkdir()
+            (base / 'image.png').write_bytes(b'\x89PNG data')
+            (base / '.secret').write_text('hidden')
+            (Path(tmp) / 'outside.txt').write_text('outside')
+            self.server.publish('My <Doc>', blocks('<h1>Hello</h1>'), base)
+            self.assertTrue(wait_until(lambda: self.server.updates == 1))
+            url = f'http://127.0.0.1:{self.port}/'
+            page = urllib.request.urlopen(url, timeout=5).read().decode()
+            self.assertIn('<title>My &lt;Doc&gt;</title>', page)
+            self.assertIn('<h1>Hello</h1>', page)
+            response = urllib.request.urlopen(url + 'image.png', timeout=5)
+            self.assertEqual((response.headers['Content-Type'], response.read()),
+                             ('image/png', b'\x89PNG data'))
+            for path in ('.secret', '..%2Foutside.txt', 'missing.png'):
+                with self.assertRaises(urllib.error.HTTPError) as raised:
+                    urllib.request.urlopen(url + path, timeout=5)
+                self.assertEqual(raised.exception.code, 404)
+
+    def test_other_hosts_and_origins_are_refused(self):
+        """Test that requests for another host name and sockets opened by other sites get 403."""
+        for host in (f'evil.example:{self.port}', 'localhost:1', 'localhost'):
+            request = urllib.request.Request(f'http://127.0.0.1:{self.port}/', headers={'Host': host})
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(request, timeout=5)
+            self.assertEqual(raised.exception.code, 403, host)
+        request = urllib.request.Request(f'http://127.0.0.1:{self.port}/',
+                                         headers={'Host': f'127.0.0.1:{self.port}'})
+        self.assertEqual(urllib.request.urlopen(request, timeout=5).status, 200)
+        client = WebSocketClient(self.port, origin='http://evil.example')
+        self.assertEqual(client.status, 403)
+        client.sock.close()
+        self.assertEqual(self.server.client_count(), 0)
+
+    def test_busy_port_raises(self):
+        """Test that starting on a port in use fails with OSError."""
+        with self.assertRaises(OSError):
+            PreviewServer('127.0.0.1', self.port).start()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from QuickMD import profiling
+from QuickMD.profiling import Histogram
+
+
+class TestProfiling(unittest.TestCase):
+    """Test cases for the hot-path instrumentation."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.was_enabled = profiling.is_enabled()
+        profiling.reset()
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        profiling.enable(self.was_enabled)
+        profiling.reset()
+
+    def test_histogram(self):
+        """Test counts and percentiles."""
+        histogram = Histogram(window=100)
+        for i in range(1, 201):
+            histogram.add(i / 1000)
+        summary = histogram.summary()
+        self.assertEqual(summary.count, 200)
+        self.assertAlmostEqual(summary.total, sum(range(1, 201)) / 1000)
+        self.assertAlmostEqual(summary.max, 0.2)
+        self.assertAlmostEqual(summary.last, 0.2)
+        # Percentiles cover the 100 most recent samples
+        self.assertAlmostEqual(summary.p50, 0.151)
+        self.assertAlmostEqual(summary.p95, 0.196)
+
+    def test_disabled_records_nothing(self):
+        """Test that nothing is recorded or wrapped while disabled."""
+        profiling.enable(False)
+
+        def function():
+            return 1
+
+        self.assertIs(profiling.profiled('test.function')(function), function)
+        with profiling.span('test.span'):
+            pass
+        profiling.record('test.record', 1.0)
+        self.assertEqual(profiling.summaries(), {})
+        self.assertEqual(profiling.format_summary(), 'No samples recorded.')
+
+    def test_enabled_records_samples(self):
+        """Test that spans, records and decorated functions are timed."""
+        profiling.enable()
+
+        @profiling.profiled('test.function')
+        def function(value):
+            return value * 2
+
+        self.assertEqual(function(21), 42)
+        with profiling.span('test.span'):
+            pass
+        profiling.record('test.record', 0.5)
+        stats = profiling.summaries()
+        self.assertEqual(list(stats), ['test.function', 'test.record', 'test.span'])
+        self.assertEqual(stats['test.function'].count, 1)
+        self.assertEqual(stats['test.record'].p95, 0.5)
+        self.assertIn('test.record', profiling.format_summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import multiprocessing
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from QuickMD.converter import MarkdownConverter
+from QuickMD.incremental import BlockRenderer
+from QuickMD.render_cache import RenderCache, resolve_cache_dir
+
+
+def _fill(directory: str, worker: int) -> None:
+    """Writes entries from another process."""
+    cache = RenderCache(directory, 'shared')
+    for i in range(50):
+        cache.put_many({f'{worker}-{i}-{j}': 'x' * 10 for j in range(4)})
+        cache.get(f'{worker}-{i}-0')
+    cache.close()
+
+
+class TestRenderCache(unittest.TestCase):
+    """Test cases for the persistent render cache."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.tmp.cleanup()
+
+    def test_entries_persist_per_fingerprint(self):
+        """Test that entries survive reopening and are kept apart by fingerprint."""
+        cache = RenderCache(self.dir, 'a')
+        cache.put_many({'k1': '<p>one</p>', 'k2': '<p>two</p>'})
+        cache.close()
+        cache = RenderCache(self.dir, 'a')
+        self.assertEqual(cache.get_many(['k1', 'k2', 'k3']), {'k1': '<p>one</p>', 'k2': '<p>two</p>'})
+        self.assertIsNone(RenderCache(self.dir, 'b').get('k1'))
+        self.assertEqual(cache.size(), 20)
+        self.assertIsNone(resolve_cache_dir(''))
+        self.assertEqual(resolve_cache_dir(str(self.dir)), self.dir)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test that the size cap evicts the entries used longest ago."""
+        cache = RenderCache(self.dir, 'a', max_bytes=1000)
+        for i in range(9):
+            cache.put(f'k{i}', 'x' * 100)
+        cache.get('k0')
+        cache.put('k9', 'x' * 200)
+        self.assertLessEqual(cache.size(), 1000)
+        self.assertIsNotNone(cache.get('k0'))
+        self.assertIsNotNone(cache.get('k9'))
+        self.assertIsNone(cache.get('k1'))
+
+    def test_concurrent_processes(self):
+        """Test that several processes can write the same cache at once."""
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=_fill, args=(str(self.dir), i)) for i in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(process.exitcode, 0)
+        cache = RenderCache(self.dir, 'shared')
+        keys = [f'{w}-{i}-{j}' for w in range(3) for i in range(50) for j in range(4)]
+        self.assertEqual(len(cache.get_many(keys)), 600)
+        self.assertEqual(cache.size(), 6000)
+
+    def test_close_during_lookup(self):
+        """Test that calls waiting on the lock when the cache closes act as misses."""
+        cache = RenderCache(self.dir, 'a')
+        cache.put('k', 'v')
+        results = []
+        calls = [lambda: results.append(cache.get_many(['k'])),
+                 lambda: results.append(cache.put_many({'j': 'w'})),
+                 lambda: results.append(cache.size())]
+        with cache._lock:
+            threads = [threading.Thread(target=call) for call in calls]
+            for thread in threads:
+                thread.start()
+            # Let them get past the check made before the lock
+            time.sleep(0.05)
+            cache._db.close()
+            cache._db = None
+        for thread in threads:
+            thread.join(5)
+        self.assertCountEqual(results, [{}, None, 0])
+
+    def test_block_renderer_reuses_persisted_blocks(self):
+        """Test that a new renderer takes unchanged blocks from the disk cache."""
+        text = '# Title\n\nSome *text*[^1].\n\n[TOC]\n\n## Part\n\n[^1]: A note.\n'
+        converter = MarkdownConverter()
+        first = BlockRenderer(converter, persistent=RenderCache(self.dir, converter.fingerprint))
+        expected = first.render(text)
+        self.assertGreater(expected.rendered_count, 0)
+        second = BlockRenderer(converter, persistent=RenderCache(self.dir, converter.fingerprint))
+        result = second.render(text)
+        self.assertEqual(result.rendered_count, 0)
+        self.assertEqual(result.html, expected.html)
+        self.assertEqual(second.render(text + '\nMore.\n').rendered_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from QuickMD.incremental import RenderedBlock
+from QuickMD.sourcemap import SourceMap
+
+
+def blocks(*ranges):
+    """Returns rendered blocks covering the given line ranges."""
+    return [RenderedBlock(f'k{start}', start, end, '') for start, end in ranges]
+
+
+class TestSourceMap(unittest.TestCase):
+    """Test cases for the source line to preview position index."""
+
+    def test_lookups(self):
+        """Test both directions, inside blocks and in the blank lines between them."""
+        source_map = SourceMap()
+        source_map.update(blocks((0, 1), (2, 6), (7, 8)), [1, 2, 1], leading=1)
+        self.assertEqual(source_map.position(0), 1)
+        self.assertEqual(source_map.position(2), 2)
+        self.assertEqual(source_map.position(4), 3)
+        self.assertEqual(source_map.position(6.5), 4)
+        self.assertEqual(source_map.position(100), 5)
+        self.assertEqual(source_map.line(3), 4)
+        self.assertEqual(source_map.line(4.5), 7.5)
+        self.assertEqual(source_map.line(0), 0)
+        # Lines inside blocks map there and back; blank lines have no preview
+        for line in (0, 2, 3, 4, 5, 7):
+            self.assertAlmostEqual(source_map.line(source_map.position(line)), line)
+
+    def test_incremental_update(self):
+        """Test that an edit recomputes the points from the first moved block on."""
+        source_map = SourceMap()
+        source_map.update(blocks((0, 1), (2, 3), (4, 5)), [1, 1, 1])
+        first_points = source_map.lines[:2]
+        # A paragraph in the middle grows by two lines and one text block
+        source_map.update(blocks((0, 1), (2, 5), (6, 7)), [1, 2, 1])
+        self.assertEqual(source_map.lines[:2], first_points)
+        self.assertEqual(source_map.lines, [0, 1, 2, 5, 6, 7])
+        self.assertEqual(source_map.positions, [0, 1, 1, 3, 3, 4])
+        source_map.clear()
+        self.assertEqual(len(source_map), 0)
+        self.assertEqual(source_map.position(3), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+from QuickMD.startup import StartupTrace
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class TestStartup(unittest.TestCase):
+    """Test cases for the startup path."""
+
+    def test_trace(self):
+        """Test that phases record their time and the packages they import."""
+        sys.modules.pop('colorsys', None)
+        trace = StartupTrace()
+        with trace.phase('outer'):
+            with trace.phase('inner'):
+                import colorsys
+        trace.mark('ready')
+        self.assertEqual([phase.name for phase in trace.phases], ['inner', 'outer', 'ready'])
+        inner, outer, ready = trace.phases
+        self.assertEqual(inner.imports, ['colorsys'])
+        self.assertGreaterEqual(outer.seconds, inner.seconds)
+        self.assertEqual(ready.seconds, 0.0)
+        lines = trace.report().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]], ['outer', 'inner', 'ready'])
+
+    def test_gui_import_defers_renderer(self):
+        """Test that importing the window leaves Markdown, Pygments and SQLite unloaded."""
+        code = ('import sys, QuickMD.ui; '
+                'print(",".join(m for m in ("markdown", "pygments", "sqlite3") if m in sys.modules))')
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True,
+                                text=True, check=True, env=dict(os.environ, QT_QPA_PLATFORM='offscreen')).stdout
+        self.assertEqual(output.strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from QuickMD.workspace_index import (MATCH_END, MATCH_START, WorkspaceIndex, fts_query,
+                                     index_path, split_sections)
+
+
+class TestWorkspaceIndex(unittest.TestCase):
+    """Test cases for the on-disk workspace search index."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name) / 'docs'
+        (self.root / 'notes').mkdir(parents=True)
+        (self.root / '.git').mkdir()
+        (self.root / 'guide.md').write_text(
+            "# Guide\n\nIntro text.\n\n## Zebra crossing\n\nStripes everywhere.\n\n"
+            "```\n# not a heading\nzebra in code\n```\n"
+        )
+        (self.root / 'notes' / 'animals.markdown').write_text(
+            "---\ntitle: Animals\n---\n# Animals\n\nA lion.\nA zebra grazes here.\n"
+        )
+        (self.root / 'notes' / 'other.txt').write_text("zebra")
+        (self.root / '.git' / 'hidden.md').write_text("# zebra")
+        self.index = WorkspaceIndex(Path(self.tmp.name) / 'index.sqlite3', self.root)
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_split_sections(self):
+        """Test that documents split at headings outside code and front matter."""
+        sections = split_sections((self.root / 'guide.md').read_text())
+        self.assertEqual([(line, title) for line, title, _ in sections],
+                         [(0, 'Guide'), (4, 'Zebra crossing')])
+        self.assertIn('zebra in code', sections[1][2])
+        sections = split_sections("preamble\n# *One*\n#tag\n### Two ###")
+        self.assertEqual([(line, title) for line, title, _ in sections],
+                         [(0, ''), (1, 'One'), (3, 'Two')])
+
+    def test_search_ranks_and_locates_matches(self):
+        """Test that a search finds ranked sections with snippets and the line of the match."""
+        stats = self.index.update()
+        self.assertEqual((stats.files, stats.indexed, stats.removed), (2, 2, 0))
+        hits = self.index.search('zebr')
+        self.assertEqual([(hit.path.name, hit.line, hit.title) for hit in hits],
+                         [('guide.md', 4, 'Zebra crossing'), ('animals.markdown', 6, 'Animals')])
+        self.assertIn(f'{MATCH_START}zebra{MATCH_END}', hits[1].snippet)
+        self.assertEqual(len(self.index.search('"lion zebra"')), 0)
+        self.assertEqual(len(self.index.search('lion zebra')), 1)
+        self.assertEqual(self.index.search('NEAR( OR *'), [])
+        self.assertEqual(fts_query('a-b "c d" e*'), '"a"* "b"* "c d" "e"*')
+
+    def test_update_only_changed_files(self):
+        """Test that updates index changed files and drop removed ones."""
+        self.index.update()
+        self.assertEqual(self.index.update().indexed, 0)
+        guide = self.root / 'guide.md'
+        guide.write_text("# Guide\n\nNo stripes any more.\n")
+        stat = guide.stat()
+        os.utime(guide, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        (self.root / 'notes' / 'animals.markdown').unlink()
+        stats = self.index.update()
+        self.assertEqual((stats.files, stats.indexed, stats.removed), (1, 1, 1))
+        self.assertEqual(self.index.search('zebra'), [])
+        self.assertEqual([hit.line for hit in self.index.search('stripes')], [2])
+        # A reopened index keeps its contents
+        self.index.close()
+        self.index = WorkspaceIndex(Path(self.tmp.name) / 'index.sqlite3', self.root)
+        self.assertEqual(len(self.index.search('stripes')), 1)
+        self.assertIsNone(index_path(self.root, ''))
+        self.assertEqual(index_path(self.root, self.tmp.name).parent, Path(self.tmp.name) / 'search')
+
+
+if __name__ == '__main__':
+    unittest.main()